@@ -1,17 +1,24 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, send_file
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from sqlalchemy.exc import OperationalError, ProgrammingError
 from sqlalchemy import inspect
 import os
 from flask_migrate import Migrate  # <--- 1. Importa la clase
 from flask import Response, abort  # <-- Asegúrate de importar esto
-from drive_service import drive_service, get_cached_image, save_to_cache, serve_default_image # <-- Importa el servicio
+from drive_service import drive_service, serve_default_image # <-- Importa el servicio
+from drive_cache import fetch_drive_file, image_cache
+from http_cache import etag_archivo, aplicar_cache_archivo_subido, aplicar_cache_drive
+from derivatives import obtener_derivado
+from werkzeug.utils import safe_join
 # --- INICIALIZACIÓN Y CONFIGURACIÓN ---
 app = Flask(__name__)
 # Importar la configuración de la base de datos y otras configuraciones
 from config import DB_CONFIG,    UPLOAD_FOLDER
+from config import DB_POOL_SIZE, DB_POOL_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_POOL_TIMEOUT
 from extensions import db
-from log_activity import log_activity
+from database import init_pool
+from log_activity import log_activity, iniciar_escritor
+from permisos_cache import cargar_usuario
 import httplib2
 import time
 # Configuración de la aplicación
@@ -19,10 +26,19 @@ app.config['SECRET_KEY'] = 'tu_clave_secreta_aqui'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['SQLALCHEMY_DATABASE_URI'] = f"mysql+pymysql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}/{DB_CONFIG['database']}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool compartido: db.session y database.get_db_connection() usan el mismo engine
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': DB_POOL_SIZE,
+    'max_overflow': DB_POOL_MAX_OVERFLOW,
+    'pool_pre_ping': DB_POOL_PRE_PING,
+    'pool_recycle': DB_POOL_RECYCLE,
+    'pool_timeout': DB_POOL_TIMEOUT,
+}
 
 # Inicializar la base de datos con la app
 db.init_app(app)
 migrate = Migrate(app, db)
+init_pool(app)
 # --- LÓGICA DE INICIALIZACIÓN DE TABLAS (PARA PRODUCCIÓN) ---
 def init_tables():
     """
@@ -61,6 +77,9 @@ from routes.etiquetas import etiquetas_bp
 from routes.bajas import bajas_bp
 from routes.inventarios import inventarios_bp  # Asegúrate de importar el blueprint de inventarios
 from routes.manual import manual_bp  # Importar el blueprint del manual
+from routes.jobs import jobs_bp
+import jobs
+import sql_profiler
 # Ejecutar la inicialización de las tablas
 init_tables()
 
@@ -71,7 +90,8 @@ login_manager.login_view = 'login'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Usuario, roles y permisos salen del cache del proceso (ver permisos_cache.py)
+    return cargar_usuario(user_id)
 
 # --- REGISTRO DE BLUEPRINTS ---
 app.register_blueprint(resguardos_bp)
@@ -87,6 +107,14 @@ app.register_blueprint(etiquetas_bp)
 app.register_blueprint(bajas_bp)
 app.register_blueprint(inventarios_bp)  # Registrar el blueprint de inventarios
 app.register_blueprint(manual_bp)  # Registrar el blueprint del manual
+app.register_blueprint(jobs_bp)
+
+# Ejecutor de trabajos en segundo plano (los manejadores ya se registraron al importar los blueprints)
+jobs.init_app(app)
+# Perfilado de SQL por petición (Server-Timing, consultas lentas)
+sql_profiler.init_app(app)
+# Escritura de la bitácora por lotes en segundo plano
+iniciar_escritor(app)
 
 # --- RUTAS DE AUTENTICACIÓN Y CONFIGURACIÓN INICIAL ---
 
@@ -145,7 +173,6 @@ def login():
                 category="Login", 
                 details=f"El usuario '{username}' ha iniciado sesión."
             )
-            db.session.commit()
             return redirect(next_page or url_for('resguardos.ver_resguardos'))
         else:
             flash('Usuario o contraseña incorrectos.', 'danger')
@@ -160,7 +187,6 @@ def logout():
         category="Logout", 
         details=f"El usuario '{current_user.username}' ha cerrado sesión."
     )
-    db.session.commit()
     logout_user()
     return redirect(url_for('login'))
 
@@ -177,6 +203,7 @@ def index():
 def serve_drive_image(file_id):
     """
     Ruta GLOBAL para servir TODAS las imágenes desde Google Drive con cache.
+    La cache (drive_cache) guarda mimetype y etag, y revalida contra Drive por md5.
     """
     # Verificar que el servicio Drive esté disponible
     if not drive_service:
@@ -184,34 +211,16 @@ def serve_drive_image(file_id):
         return serve_default_image()
     
     try:
-        # 1. Intentar desde cache local primero
-        cached_content = get_cached_image(file_id)
-        if cached_content:
-            print(f"Sirviendo imagen {file_id} desde cache local")
-            return Response(cached_content, mimetype='image/jpeg')
-        
-        # 2. Si no está en cache, obtener de Drive
-        print(f"Descargando imagen {file_id} desde Drive...")
-        
-        # Usar el método download_file mejorado
-        file_content = drive_service.download_file(file_id)
-        
+        # El navegador ya tiene la versión vigente: 304 sin leer el archivo
+        meta = image_cache.peek(file_id)
+        if meta and meta['etag'] in request.if_none_match:
+            return aplicar_cache_drive(Response(status=304), meta['etag'])
+
+        file_content, meta = fetch_drive_file(drive_service, file_id)
         if not file_content:
             return serve_default_image()
-            
-        # 3. Intentar obtener el mimetype
-        try:
-            metadata = drive_service.get_file_metadata(file_id)
-            mimetype = metadata.get('mimeType', 'image/jpeg')
-        except:
-            mimetype = 'image/jpeg'
-        
-        # 4. Guardar en cache para futuras peticiones
-        save_to_cache(file_id, file_content)
-        
-        # 5. Servir la imagen
-        print(f"Imagen {file_id} servida exitosamente")
-        return Response(file_content, mimetype=mimetype)
+        response = aplicar_cache_drive(Response(file_content, mimetype=meta['mimetype']), meta['etag'])
+        return response.make_conditional(request)
         
     except Exception as e:
         print(f"Error al servir archivo {file_id} desde Drive: {e}")
@@ -221,7 +230,9 @@ def serve_drive_image(file_id):
 @login_required
 def serve_uploaded_file(filename):
     """
-    Sirve archivos desde cualquier subcarpeta dentro de UPLOAD_FOLDER.
+    Sirve archivos desde cualquier subcarpeta dentro de UPLOAD_FOLDER,
+    con ETag, Cache-Control inmutable y peticiones Range.
+    Con ?size=thumb o ?size=report entrega la versión reducida de una foto.
     Ejemplos de filename: 
       - 'bienes/foto-123.jpg'
       - 'resguardos/evidencia-456.jpg'
@@ -233,10 +244,28 @@ def serve_uploaded_file(filename):
         app.logger.error("UPLOAD_FOLDER no está configurado.")
         abort(404)
         
-    try:
-        return send_from_directory(upload_dir, filename)
-    except FileNotFoundError:
+    ruta = safe_join(upload_dir, filename)
+    if ruta is None or not os.path.isfile(ruta):
         abort(404)
+
+    try:
+        # ?size=thumb|report sirve el derivado reducido (WebP si el navegador lo acepta)
+        size = request.args.get('size')
+        respaldo = False
+        if size:
+            acepta_webp = 'image/webp' in request.accept_mimetypes
+            derivado = obtener_derivado(filename, size, acepta_webp=acepta_webp, base_folder=upload_dir)
+            if derivado:
+                ruta = derivado
+            else:
+                # Sin derivado (no es imagen, Pillow falló): el original no se fija bajo esta URL
+                respaldo = True
+
+        # ETag por contenido, 304 condicional y soporte de Range (PDF grandes)
+        response = send_file(ruta, conditional=True, etag=etag_archivo(ruta))
+        if size:
+            response.vary.add('Accept')
+        return aplicar_cache_archivo_subido(response, respaldo=respaldo)
     except Exception as e:
         app.logger.error(f"Error al servir archivo {filename}: {e}")
         abort(500)
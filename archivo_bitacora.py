@@ -0,0 +1,168 @@
+# archivo_bitacora.py
+"""
+Retención de la bitácora: mueve los registros viejos de activity_log a
+archivos comprimidos, uno por mes.
+
+    python -m archivo_bitacora [--meses 12] [--simular]
+    python -m archivo_bitacora --leer 2024-03 | head
+
+Se conservan en la tabla los últimos `--meses` meses completos más el mes en
+curso (ACTIVITY_LOG_RETENTION_MONTHS). Cada mes anterior se escribe en
+ACTIVITY_LOG_ARCHIVE_DIR/activity_log_AAAA-MM.jsonl.gz (una línea JSON por
+registro) y sólo después de cerrar el archivo se borran sus filas, por
+bloques y hasta el último id archivado. Si el mes ya tenía archivo, las
+filas nuevas se agregan como otro miembro gzip (el archivo se sigue leyendo
+con zcat / gzip.open como uno solo).
+
+No se usan particiones de MySQL: exigen que la fecha forme parte de la
+llave primaria y no admiten la llave foránea de user_id.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+from datetime import date, datetime
+
+import pymysql.cursors
+
+from config import ACTIVITY_LOG_ARCHIVE_DIR, ACTIVITY_LOG_RETENTION_MONTHS
+from database import get_db_connection
+
+LECTURA_BLOQUE = 5000    # Filas leídas por viaje al servidor
+BORRADO_BLOQUE = 5000    # Filas borradas por transacción
+COLUMNAS = ('id', 'timestamp', 'user_id', 'action', 'category', 'details', 'resource_id')
+
+
+def _sumar_meses(fecha, meses):
+    total = fecha.year * 12 + (fecha.month - 1) + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def fecha_corte(meses, hoy=None):
+    """Primer día del mes más antiguo que se conserva."""
+    hoy = hoy or date.today()
+    return _sumar_meses(hoy.replace(day=1), -meses)
+
+
+def ruta_archivo(mes, carpeta=ACTIVITY_LOG_ARCHIVE_DIR):
+    return os.path.join(carpeta, f"activity_log_{mes:%Y-%m}.jsonl.gz")
+
+
+def _meses_a_archivar(cursor, corte):
+    cursor.execute("SELECT MIN(timestamp) AS inicio FROM activity_log")
+    inicio = cursor.fetchone()['inicio']
+    if inicio is None or inicio.date() >= corte:
+        return []
+    meses = []
+    mes = inicio.date().replace(day=1)
+    while mes < corte:
+        meses.append(mes)
+        mes = _sumar_meses(mes, 1)
+    return meses
+
+
+def _archivar_mes(conn, mes, carpeta, simular=False, log=print):
+    """Escribe el mes en su archivo y borra las filas escritas. Devuelve el número de filas."""
+    desde, hasta = datetime(mes.year, mes.month, 1), datetime.combine(_sumar_meses(mes, 1), datetime.min.time())
+    cursor = conn.cursor(pymysql.cursors.DictCursor)
+    cursor.execute("SELECT COUNT(*) AS total, MAX(id) AS ultimo FROM activity_log "
+                   "WHERE timestamp >= %s AND timestamp < %s", (desde, hasta))
+    resumen = cursor.fetchone()
+    if not resumen['total']:
+        return 0
+    if simular:
+        log(f"  {mes:%Y-%m}: {resumen['total']} registros (simulación, no se modifica nada)")
+        return resumen['total']
+
+    os.makedirs(carpeta, exist_ok=True)
+    ruta = ruta_archivo(mes, carpeta)
+    ultimo_id = resumen['ultimo']
+    escritas = 0
+    # Lectura por llave (id > último leído) en bloques: memoria constante
+    with open(ruta, 'ab') as crudo:
+        with gzip.open(crudo, 'at', encoding='utf-8') as archivo:
+            desde_id = 0
+            while True:
+                cursor.execute(
+                    f"SELECT {', '.join(COLUMNAS)} FROM activity_log "
+                    "WHERE timestamp >= %s AND timestamp < %s AND id > %s AND id <= %s ORDER BY id LIMIT %s",
+                    (desde, hasta, desde_id, ultimo_id, LECTURA_BLOQUE)
+                )
+                filas = cursor.fetchall()
+                if not filas:
+                    break
+                for fila in filas:
+                    archivo.write(json.dumps(fila, default=str, ensure_ascii=False) + '\n')
+                escritas += len(filas)
+                desde_id = filas[-1]['id']
+        # El trailer gzip se escribe al cerrar; se sincroniza después
+        crudo.flush()
+        os.fsync(crudo.fileno())
+
+    # Sólo se borra lo que ya quedó en disco
+    borradas = 0
+    while True:
+        cursor.execute(
+            "DELETE FROM activity_log WHERE timestamp >= %s AND timestamp < %s AND id <= %s LIMIT %s",
+            (desde, hasta, ultimo_id, BORRADO_BLOQUE)
+        )
+        conn.commit()
+        if cursor.rowcount <= 0:
+            break
+        borradas += cursor.rowcount
+    log(f"  {mes:%Y-%m}: {escritas} registros -> {ruta} ({borradas} borrados)")
+    return escritas
+
+
+def archivar(meses=ACTIVITY_LOG_RETENTION_MONTHS, carpeta=ACTIVITY_LOG_ARCHIVE_DIR, simular=False, log=print):
+    """Archiva todo lo anterior a fecha_corte(meses). Devuelve {mes: filas}."""
+    corte = fecha_corte(meses)
+    conn = get_db_connection()
+    if conn is None:
+        raise RuntimeError("No se pudo conectar a la base de datos.")
+    resultado = {}
+    try:
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        pendientes = _meses_a_archivar(cursor, corte)
+        log(f"Archivando la bitácora anterior a {corte:%Y-%m-%d} ({len(pendientes)} meses)...")
+        for mes in pendientes:
+            filas = _archivar_mes(conn, mes, carpeta, simular, log)
+            if filas:
+                resultado[f"{mes:%Y-%m}"] = filas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return resultado
+
+
+def leer(mes, carpeta=ACTIVITY_LOG_ARCHIVE_DIR):
+    """Itera los registros archivados de un mes ('AAAA-MM') como diccionarios."""
+    ruta = ruta_archivo(datetime.strptime(mes, '%Y-%m').date(), carpeta)
+    with gzip.open(ruta, 'rt', encoding='utf-8') as archivo:
+        for linea in archivo:
+            yield json.loads(linea)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--meses', type=int, default=ACTIVITY_LOG_RETENTION_MONTHS,
+                        help='Meses completos que se conservan en la tabla')
+    parser.add_argument('--carpeta', default=ACTIVITY_LOG_ARCHIVE_DIR)
+    parser.add_argument('--simular', action='store_true', help='Sólo contar lo que se archivaría')
+    parser.add_argument('--leer', metavar='AAAA-MM', help='Imprime los registros archivados de un mes')
+    args = parser.parse_args()
+
+    if args.leer:
+        for registro in leer(args.leer, args.carpeta):
+            sys.stdout.write(json.dumps(registro, ensure_ascii=False) + '\n')
+        return
+
+    resultado = archivar(args.meses, args.carpeta, args.simular)
+    print(f"Listo: {sum(resultado.values())} registros en {len(resultado)} meses.")
+
+
+if __name__ == '__main__':
+    main()
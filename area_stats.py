@@ -0,0 +1,163 @@
+# area_stats.py
+"""
+Estadísticas por área materializadas en la tabla area_stats.
+
+    python -m area_stats                 # reconstruye toda la tabla
+    python -m area_stats --areas 3 17    # sólo esas áreas
+
+Por área (resguardos activos): bienes normales y sujetos a control, valor en
+libros, jefe de área vigente y bienes por estatus_actual. Antes se calculaba
+en cada apertura del formulario de nuevo inventario recorriendo todos los
+resguardos activos.
+
+Mantenimiento incremental: las rutas que crean, traspasan, editan o
+desactivan resguardos (y las importaciones) llaman a refrescar_areas /
+refrescar_bienes / refrescar_resguardos con su cursor ANTES de confirmar,
+así la fila del área cambia en la misma transacción. Cada refresco es un
+INSERT ... SELECT ... ON DUPLICATE KEY UPDATE sobre el índice
+ix_resguardos_area_activo_tipo, sólo de las áreas indicadas.
+
+Se lee con catalogos.area_stats(); un área sin fila (recién creada) se ve
+con ceros.
+"""
+import argparse
+import time
+
+import pymysql.cursors
+
+from database import get_db_connection
+
+BLOQUE_AREAS = 50      # Áreas por sentencia en la reconstrucción (cada bloque se confirma)
+BLOQUE_IDS = 1000      # Ids por IN (...) al buscar las áreas de bienes/resguardos
+
+# Columna de area_stats -> valor de bienes.estatus_actual
+ESTATUS = {
+    'num_activo': 'Activo',
+    'num_en_mantenimiento': 'En Mantenimiento',
+    'num_en_proceso_baja': 'En Proceso de Baja',
+    'num_baja': 'Baja',
+    'num_faltante': 'Faltante',
+}
+
+COLUMNAS = ('num_resguardos', 'num_bienes_normal', 'num_bienes_control', 'valor_en_libros',
+            'jefe_de_area') + tuple(ESTATUS)
+
+_por_estatus = ',\n'.join(
+    f"        COUNT(DISTINCT CASE WHEN b.estatus_actual = '{valor}' THEN b.id END) AS {columna}"
+    for columna, valor in ESTATUS.items()
+)
+
+# Jefe de área vigente: el del resguardo activo más reciente que lo tenga.
+# GROUP_CONCAT omite los NULL; sólo se conserva el primer elemento.
+SQL_REFRESCO = f"""
+    INSERT INTO area_stats (id_area, {', '.join(COLUMNAS)}, fecha_actualizacion)
+    SELECT
+        a.id,
+        COUNT(r.id) AS num_resguardos,
+        COUNT(DISTINCT CASE WHEN r.Tipo_De_Resguardo = 0 THEN r.id_bien END) AS num_bienes_normal,
+        COUNT(DISTINCT CASE WHEN r.Tipo_De_Resguardo = 1 THEN r.id_bien END) AS num_bienes_control,
+        COALESCE(SUM(b.Valor_En_Libros), 0) AS valor_en_libros,
+        SUBSTRING_INDEX(GROUP_CONCAT(NULLIF(TRIM(r.Nombre_Director_Jefe_De_Area), '')
+                                     ORDER BY r.id DESC SEPARATOR '\\n'), '\\n', 1) AS jefe_de_area,
+{_por_estatus},
+        NOW()
+    FROM areas a
+    LEFT JOIN resguardos r ON r.id_area = a.id AND r.Activo = 1
+    LEFT JOIN bienes b ON b.id = r.id_bien
+    WHERE a.id IN ({{ids}})
+    GROUP BY a.id
+    ON DUPLICATE KEY UPDATE
+        {', '.join(f'{c} = VALUES({c})' for c in COLUMNAS)},
+        fecha_actualizacion = VALUES(fecha_actualizacion)
+"""
+
+
+def _bloques(ids, tamano):
+    ids = sorted({int(i) for i in ids if i not in (None, '')})
+    for inicio in range(0, len(ids), tamano):
+        yield ids[inicio:inicio + tamano]
+
+
+def refrescar_areas(cursor, ids_area):
+    """Recalcula las filas de `ids_area` en la transacción del cursor. Devuelve cuántas áreas."""
+    total = 0
+    for bloque in _bloques(ids_area, BLOQUE_AREAS):
+        cursor.execute(SQL_REFRESCO.format(ids=', '.join(['%s'] * len(bloque))), bloque)
+        total += len(bloque)
+    return total
+
+
+def _areas_por(cursor, columna, ids):
+    areas = set()
+    for bloque in _bloques(ids, BLOQUE_IDS):
+        cursor.execute(
+            f"SELECT DISTINCT id_area FROM resguardos WHERE {columna} IN ({', '.join(['%s'] * len(bloque))}) AND Activo = 1",
+            bloque
+        )
+        areas.update(fila['id_area'] for fila in cursor.fetchall() if fila['id_area'] is not None)
+    return areas
+
+
+def refrescar_bienes(cursor, ids_bien):
+    """Refresca las áreas donde `ids_bien` tienen resguardo activo (cambio de valor o estatus)."""
+    return refrescar_areas(cursor, _areas_por(cursor, 'id_bien', ids_bien))
+
+
+def refrescar_resguardos(cursor, ids_resguardo):
+    """Refresca las áreas de los resguardos activos indicados."""
+    return refrescar_areas(cursor, _areas_por(cursor, 'id', ids_resguardo))
+
+
+def refrescar(ids_area=(), ids_bien=()):
+    """Refresco con conexión propia, para código que escribe con db.session (después de su commit)."""
+    conn = get_db_connection()
+    if conn is None:
+        print(f"AREA_STATS: sin conexión, no se refrescaron áreas={list(ids_area)} bienes={list(ids_bien)}")
+        return 0
+    try:
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        total = refrescar_areas(cursor, set(ids_area) | _areas_por(cursor, 'id_bien', ids_bien))
+        conn.commit()
+        return total
+    except Exception as e:
+        conn.rollback()
+        print(f"AREA_STATS: error al refrescar áreas={list(ids_area)} bienes={list(ids_bien)}: {e}")
+        return 0
+    finally:
+        conn.close()
+
+
+def reconstruir(ids_area=None, log=print):
+    """Recalcula todas las áreas (o `ids_area`) por bloques, confirmando cada uno."""
+    conn = get_db_connection()
+    if conn is None:
+        raise RuntimeError("No se pudo conectar a la base de datos.")
+    inicio = time.perf_counter()
+    total = 0
+    try:
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        if ids_area is None:
+            cursor.execute("SELECT id FROM areas")
+            ids_area = [fila['id'] for fila in cursor.fetchall()]
+        for bloque in _bloques(ids_area, BLOQUE_AREAS):
+            total += refrescar_areas(cursor, bloque)
+            conn.commit()
+            log(f"  {total} áreas...")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    log(f"area_stats: {total} áreas recalculadas en {time.perf_counter() - inicio:.1f} s")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--areas', type=int, nargs='+', help='Ids de área a recalcular (por omisión, todas)')
+    args = parser.parse_args()
+    reconstruir(args.areas)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+# benchmarks/__init__.py
+"""
+Scripts de medición de rendimiento. Trabajan sobre un esquema temporal
+(`<base>_bench`) con datos sintéticos, nunca sobre la base real.
+
+    python -m benchmarks.indices --filas 50000
+    python -m benchmarks.carga --bienes 200000 --salida base.json
+"""
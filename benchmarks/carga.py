@@ -0,0 +1,270 @@
+# benchmarks/carga.py
+"""
+Benchmark de carga de punta a punta sobre datos sintéticos.
+
+    python -m benchmarks.carga [--bienes 200000 --resguardos 300000 ...]
+                               [--iteraciones 20] [--iteraciones-pesadas 3]
+                               [--salida benchmark_carga.json] [--comparar base.json]
+                               [--reutilizar] [--conservar]
+
+Crea `<base>_bench` con todas las tablas de la base configurada, lo llena con
+los volúmenes indicados (benchmarks.sintetico), escribe fotos falsas en
+`<UPLOAD_FOLDER>_bench` y recorre las rutas más usadas con el cliente de
+pruebas de Flask, como el usuario `bench_admin` (todos los roles). Los
+trabajos en segundo plano (exportaciones, importación, PDF) corren dentro de
+la petición (JOBS_SYNC) para que su costo quede medido.
+
+Por cada escenario reporta p50/p95/máximo en ms, consultas SQL por petición
+(contadas con database.registrar_hook_consulta) y el pico de memoria (RSS)
+del proceso. El resultado se guarda en JSON para compararlo entre cambios.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows: sin getrusage no se reporta el RSS
+    resource = None
+
+import config
+from benchmarks import sintetico
+
+FILAS_IMPORTACION = 1000
+
+
+def _rss_pico_mb():
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB; macOS, bytes
+    return round(pico / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _percentil(valores, p):
+    """Percentil por rango más cercano (sin interpolar; sirve con pocas muestras)."""
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
+
+
+def preparar_entorno(esquema, carpeta):
+    """
+    Apunta la configuración al esquema y carpeta del benchmark. Debe llamarse
+    antes de importar `app`: los módulos copian estos valores al importarse.
+    """
+    config.DB_CONFIG['database'] = esquema
+    config.UPLOAD_FOLDER = carpeta
+    config.JOBS_FOLDER = os.path.join(carpeta, '_jobs')
+    config.JOBS_SYNC = True
+    os.makedirs(config.JOBS_FOLDER, exist_ok=True)
+
+
+def archivo_importacion(desde, filas=FILAS_IMPORTACION, areas=1):
+    """Excel en memoria con el formato de la carga masiva (encabezados de COLUMN_MAPPING)."""
+    import xlsxwriter
+
+    salida = io.BytesIO()
+    libro = xlsxwriter.Workbook(salida, {'in_memory': True})
+    hoja = libro.add_worksheet('Resguardos')
+    encabezados = ['NO. DE INVENTARIO', 'DESCRIPCION DEL BIEN', 'DESCRIPCION CORTA DEL BIEN', 'MARCA',
+                   'COSTO INICIAL', 'CLASIFICACION LEGAL', 'AREA', 'NO. DE RESGUARDO',
+                   'TIPO DE RESGUARDO', 'FECHA DE RESGUARDO', 'NOMBRE DEL RESGUARDANTE']
+    hoja.write_row(0, 0, encabezados)
+    for i in range(filas):
+        n = desde + i
+        hoja.write_row(i + 1, 0, [
+            f"IMP-{n:08d}", f"Bien importado {n}", f"Importado {n}", 'HP', 1500.5, 'Dominio Privado',
+            f"Área {1 + n % areas}", f"RI-{n:08d}", 0, '2025-01-15', f"Resguardante {n % 3000}"
+        ])
+    libro.close()
+    salida.seek(0)
+    return salida
+
+
+def escenarios(vol, template_id):
+    """
+    (nombre, pesado, función(i) -> (método, url, kwargs del cliente)).
+    Los pesados corren --iteraciones-pesadas veces.
+    """
+    xhr = {'X-Requested-With': 'XMLHttpRequest'}
+    plantilla = {
+        'columns': ['No_Inventario', 'Descripcion_Corta_Del_Bien', 'Marca', 'No_Resguardo',
+                    'Nombre_Del_Resguardante', 'Area_Nombre', 'imagenPath_bien'],
+        'filters': {'condition': 'AND', 'rules': [{'field': 'Marca', 'operator': '==', 'value': 'Dell'}]},
+    }
+    inventario = lambda i: 1 + i % vol['inventarios']
+
+    return [
+        ('resguardos_lista', False, lambda i: ('GET', '/resguardos', {})),
+        ('resguardos_busqueda', False, lambda i: (
+            'GET', '/resguardos', {'query_string': {'search_column': 'all',
+                                                    'search_query': f"Resguardante {i % 3000}"}})),
+        ('resguardos_prefijo', False, lambda i: (
+            'GET', '/resguardos', {'query_string': {'search_column': 'all',
+                                                    'search_query': f"R-000{i % 100:02d}"}})),
+        ('bienes_lista', False, lambda i: ('GET', '/bienes', {})),
+        ('bienes_busqueda', False, lambda i: (
+            'GET', '/bienes', {'query_string': {'search_query': ('Dell', 'Lenovo', 'Bien sintético')[i % 3]}})),
+        ('inventario_gestionar', False, lambda i: ('GET', f"/inventarios/gestionar/{inventario(i)}", {})),
+        ('plantillas_preview', False, lambda i: ('POST', '/preview_query', {'json': plantilla})),
+        ('plantillas_exportar_csv', True, lambda i: ('GET', f"/exportar_csv/{template_id}", {})),
+        ('plantillas_exportar_excel', True, lambda i: (
+            'GET', f"/exportar_excel/{template_id}", {'headers': xhr})),
+        ('importacion_excel', True, lambda i: ('POST', '/upload_excel', {
+            'headers': xhr,
+            'content_type': 'multipart/form-data',
+            'data': {'excel_file': (archivo_importacion(1 + i * FILAS_IMPORTACION, areas=vol['areas']),
+                                    f"bench_{i}.xlsx")},
+        })),
+        ('reporte_pdf', True, lambda i: ('GET', f"/inventarios/{inventario(i)}/reporte/pdf", {'headers': xhr})),
+    ]
+
+
+def medir(cliente, lista, iteraciones, iteraciones_pesadas, contador, log=print):
+    resultados = {}
+    for nombre, pesado, peticion in lista:
+        veces = iteraciones_pesadas if pesado else iteraciones
+        tiempos, consultas, codigos, jobs = [], [], set(), set()
+        rss_antes = _rss_pico_mb()
+        for i in range(veces):
+            metodo, url, kwargs = peticion(i)
+            contador[0] = 0
+            inicio = time.perf_counter()
+            respuesta = cliente.open(url, method=metodo, **kwargs)
+            respuesta.get_data()  # Consume las respuestas en streaming (CSV)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            consultas.append(contador[0])
+            codigos.add(respuesta.status_code)
+            if respuesta.status_code == 202 and respuesta.is_json:
+                jobs.add((respuesta.get_json() or {}).get('estatus'))
+            respuesta.close()
+
+        resultados[nombre] = {
+            'iteraciones': veces,
+            'p50_ms': round(_percentil(tiempos, 50), 1),
+            'p95_ms': round(_percentil(tiempos, 95), 1),
+            'max_ms': round(max(tiempos), 1),
+            'primera_ms': round(tiempos[0], 1),
+            'consultas_p50': _percentil(consultas, 50),
+            'consultas_max': max(consultas),
+            'http': sorted(codigos),
+            'jobs': sorted(j for j in jobs if j),
+            'rss_pico_mb': _rss_pico_mb(),
+            'rss_incremento_mb': (round(_rss_pico_mb() - rss_antes, 1) if rss_antes is not None else None),
+        }
+        r = resultados[nombre]
+        log(f"  {nombre:<28}p50 {r['p50_ms']:>9} ms  p95 {r['p95_ms']:>9} ms  "
+            f"consultas {r['consultas_p50']:>5}  http {r['http']}")
+    return resultados
+
+
+def imprimir_comparacion(actual, base):
+    print(f"\n{'escenario':<28}{'base p50':>10}{'actual p50':>12}{'cambio':>9}{'consultas':>14}")
+    for nombre, r in actual.items():
+        b = base.get(nombre)
+        if not b:
+            continue
+        cambio = f"{b['p50_ms'] / r['p50_ms']:.2f}x" if r['p50_ms'] else '-'
+        print(f"{nombre:<28}{b['p50_ms']:>10}{r['p50_ms']:>12}{cambio:>9}"
+              f"{b['consultas_p50']:>7} -> {r['consultas_p50']:<5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for nombre, valor in sintetico.VOLUMENES_DEFECTO.items():
+        parser.add_argument(f"--{nombre.replace('_', '-')}", type=int, dest=nombre, help=f"Por defecto {valor}")
+    parser.add_argument('--iteraciones', type=int, default=20, help='Peticiones por escenario ligero')
+    parser.add_argument('--iteraciones-pesadas', type=int, default=3, help='Peticiones por exportación/importación/PDF')
+    parser.add_argument('--salida', default='benchmark_carga.json', help='Archivo JSON de resultados')
+    parser.add_argument('--comparar', help='JSON de una corrida anterior para comparar')
+    parser.add_argument('--uploads', help='Carpeta de archivos del benchmark (por defecto <UPLOAD_FOLDER>_bench)')
+    parser.add_argument('--reutilizar', action='store_true', help='Usar el esquema ya generado por una corrida con --conservar')
+    parser.add_argument('--conservar', action='store_true', help='No borrar el esquema ni las fotos al terminar')
+    args = parser.parse_args()
+
+    vol = sintetico.volumenes(**{k: getattr(args, k) for k in sintetico.VOLUMENES_DEFECTO})
+    origen = config.DB_CONFIG['database']
+    esquema = sintetico.nombre_esquema()
+    carpeta = args.uploads or sintetico.carpeta_uploads()
+
+    conn = sintetico.conectar()
+    try:
+        cursor = conn.cursor()
+        if args.reutilizar:
+            cursor.execute(f"SELECT id FROM `{esquema}`.query_templates WHERE name = 'Benchmark'")
+            template_id = cursor.fetchone()['id']
+        else:
+            print(f"Generando datos sintéticos en {esquema}...")
+            inicio = time.perf_counter()
+            sintetico.crear_esquema(cursor, esquema, tablas=None)
+            cursor.execute(f"USE `{esquema}`")
+            sintetico.poblar(cursor, vol)
+            template_id = sintetico.poblar_aplicacion(cursor, vol, esquema, carpeta)
+            print(f"Datos listos en {time.perf_counter() - inicio:.0f} s")
+    finally:
+        conn.close()
+
+    try:
+        preparar_entorno(esquema, carpeta)
+        from app import app
+        import database
+        import log_activity
+        from extensions import db
+
+        contador = [0]
+
+        def contar_consulta(sql, duracion_ms, params, filas):
+            contador[0] += 1
+
+        database.registrar_hook_consulta(contar_consulta)
+        app.config['TESTING'] = True
+
+        cliente = app.test_client()
+        with cliente.session_transaction() as sesion:
+            sesion['_user_id'] = '1'
+            sesion['_fresh'] = True
+
+        print(f"Midiendo ({args.iteraciones} iteraciones, {args.iteraciones_pesadas} en escenarios pesados)...")
+        resultados = medir(cliente, escenarios(vol, template_id), args.iteraciones,
+                           args.iteraciones_pesadas, contador)
+
+        datos = {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'volumenes': vol,
+            'rss_pico_mb': _rss_pico_mb(),
+            'escenarios': resultados,
+        }
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(datos, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en {args.salida}")
+
+        if args.comparar:
+            with open(args.comparar, encoding='utf-8') as f:
+                imprimir_comparacion(resultados, json.load(f).get('escenarios', {}))
+
+        # La bitácora pendiente y las conexiones del pool bloquearían el DROP DATABASE
+        log_activity.vaciar()
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        if not args.conservar and not args.reutilizar:
+            conn = sintetico.conectar(database=origen)
+            try:
+                sintetico.eliminar_esquema(conn.cursor(), esquema)
+            finally:
+                conn.close()
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
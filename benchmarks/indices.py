@@ -0,0 +1,184 @@
+# benchmarks/indices.py
+"""
+Compara planes de ejecución y tiempos de las consultas frecuentes antes y
+después de los índices de la migración d7f3a9c2b815, con los reemplazos
+posteriores de e2c4b7a9d1f6 (bitácora paginada por id).
+
+    python -m benchmarks.indices --filas 50000 --repeticiones 5 [--json salida.json] [--conservar]
+
+Crea `<base>_bench`, lo llena con datos sintéticos (benchmarks.sintetico),
+quita los índices de la migración, mide, los crea y vuelve a medir.
+"""
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import statistics
+import time
+
+from benchmarks import sintetico
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (nombre, SQL, parámetros): mismas formas que las rutas que motivaron cada índice
+CONSULTAS = [
+    ('resguardos_lista', """
+        SELECT r.id, r.No_Resguardo, r.Nombre_Del_Resguardante, b.No_Inventario, a.nombre
+        FROM resguardos r JOIN bienes b ON r.id_bien = b.id JOIN areas a ON r.id_area = a.id
+        WHERE r.Tipo_De_Resguardo = 0 ORDER BY r.id DESC LIMIT 101
+    """, ()),
+    ('resguardos_prefijo', """
+        SELECT r.id FROM resguardos r WHERE r.No_Resguardo LIKE %s ORDER BY r.No_Resguardo LIMIT 50
+    """, ('R-00012%',)),
+    ('crear_inventario', """
+        SELECT b.id, r.id AS resguardo_id, r.id_area, r.Nombre_Del_Resguardante
+        FROM bienes b JOIN resguardos r ON b.id = r.id_bien
+        WHERE r.Activo = 1 AND r.id_area IN (1, 2, 3, 4, 5, 6, 7, 8, 9, 10) AND r.Tipo_De_Resguardo = %s
+    """, (0,)),
+    ('conteo_por_area', """
+        SELECT a.id, COUNT(DISTINCT CASE WHEN r.Tipo_De_Resguardo = 0 THEN r.id_bien END) AS normal,
+               COUNT(DISTINCT CASE WHEN r.Tipo_De_Resguardo = 1 THEN r.id_bien END) AS control
+        FROM areas a LEFT JOIN resguardos r ON a.id = r.id_area AND r.Activo = 1
+        GROUP BY a.id
+    """, ()),
+    ('pendientes_inventario', """
+        SELECT id_bien FROM inventario_detalle WHERE id_inventario = %s AND estatus_hallazgo = 'Pendiente'
+    """, (3,)),
+    # view_activity_log: paginación por llave (paginar_keyset, ORDER BY l.id DESC)
+    ('bitacora_recientes', """
+        SELECT l.id, l.timestamp, l.user_id, l.action, l.category, l.details, l.resource_id
+        FROM activity_log l ORDER BY l.id DESC LIMIT 51
+    """, ()),
+    ('bitacora_categoria', """
+        SELECT l.id, l.timestamp, l.user_id, l.action, l.category, l.details, l.resource_id
+        FROM activity_log l WHERE l.category = %s ORDER BY l.id DESC LIMIT 51
+    """, ('Inventarios',)),
+    ('bitacora_usuario', """
+        SELECT l.id, l.timestamp, l.user_id, l.action, l.category, l.details, l.resource_id
+        FROM activity_log l WHERE l.user_id = %s ORDER BY l.id DESC LIMIT 51
+    """, (7,)),
+    ('bitacora_categorias', """
+        SELECT DISTINCT category FROM activity_log ORDER BY category
+    """, ()),
+    ('lotes_errores', """
+        SELECT upload_id, COUNT(*) AS total_errors, MAX(Fecha_Registro) AS fecha_carga
+        FROM resguardo_errores GROUP BY upload_id ORDER BY fecha_carga DESC
+    """, ()),
+]
+
+
+def _migracion(prefijo):
+    ruta = glob.glob(os.path.join(RAIZ, 'migrations', 'versions', f'{prefijo}_*.py'))[0]
+    spec = importlib.util.spec_from_file_location(f'migracion_{prefijo}', ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def cargar_indices():
+    """
+    INDICES de d7f3a9c2b815 con los REEMPLAZOS de e2c4b7a9d1f6 aplicados: los
+    índices que hoy existen (las migraciones son la única fuente).
+    """
+    reemplazos = {(tabla, anterior): (tabla, nuevo, columnas)
+                  for tabla, anterior, nuevo, columnas in _migracion('e2c4b7a9d1f6').REEMPLAZOS}
+    return [reemplazos.get((tabla, nombre), (tabla, nombre, columnas))
+            for tabla, nombre, columnas in _migracion('d7f3a9c2b815').INDICES]
+
+
+def _indices_existentes(cursor, tabla):
+    cursor.execute(f"SHOW INDEX FROM `{tabla}`")
+    return {row['Key_name'] for row in cursor.fetchall()}
+
+
+def quitar_indices(cursor, indices):
+    for tabla, nombre, _ in indices:
+        if nombre in _indices_existentes(cursor, tabla):
+            cursor.execute(f"ALTER TABLE `{tabla}` DROP INDEX `{nombre}`")
+
+
+def crear_indices(cursor, indices):
+    for tabla, nombre, columnas in indices:
+        if nombre not in _indices_existentes(cursor, tabla):
+            lista = ', '.join(f"`{c}`" for c in columnas)
+            cursor.execute(f"ALTER TABLE `{tabla}` ADD INDEX `{nombre}` ({lista})")
+    for tabla in {t for t, _, _ in indices}:
+        cursor.execute(f"ANALYZE TABLE `{tabla}`")
+        cursor.fetchall()
+
+
+def medir(cursor, repeticiones):
+    """Plan (EXPLAIN) y mediana en ms de cada consulta."""
+    resultados = {}
+    for nombre, sql, params in CONSULTAS:
+        cursor.execute("EXPLAIN " + sql, params)
+        plan = [{k: row.get(k) for k in ('table', 'type', 'key', 'rows', 'Extra')} for row in cursor.fetchall()]
+
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            cursor.execute(sql, params)
+            cursor.fetchall()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        resultados[nombre] = {'mediana_ms': round(statistics.median(tiempos), 2), 'plan': plan}
+    return resultados
+
+
+def _resumen_plan(plan):
+    return '; '.join(f"{p['table']}:{p['type']}/{p['key'] or '-'}" for p in plan)
+
+
+def imprimir(antes, despues):
+    print(f"\n{'consulta':<24}{'antes ms':>10}{'después ms':>12}{'mejora':>9}")
+    for nombre, _, _ in CONSULTAS:
+        a, d = antes[nombre]['mediana_ms'], despues[nombre]['mediana_ms']
+        mejora = f"{a / d:.1f}x" if d else '-'
+        print(f"{nombre:<24}{a:>10}{d:>12}{mejora:>9}")
+        print(f"    antes:   {_resumen_plan(antes[nombre]['plan'])}")
+        print(f"    después: {_resumen_plan(despues[nombre]['plan'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filas', type=int, default=50000, help='Bienes/resguardos sintéticos')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--json', help='Guarda los resultados en este archivo')
+    parser.add_argument('--conservar', action='store_true', help='No borrar el esquema temporal al terminar')
+    args = parser.parse_args()
+
+    indices = cargar_indices()
+    conn = sintetico.conectar()
+    try:
+        cursor = conn.cursor()
+        esquema = sintetico.crear_esquema(cursor)
+        cursor.execute(f"USE `{esquema}`")
+        print(f"Generando datos sintéticos en {esquema}...")
+        f = args.filas
+        sintetico.poblar(cursor, sintetico.volumenes(
+            areas=200, bienes=f, resguardos=f, activity_log=f * 2, inventarios=10,
+            detalles_por_inventario=max(f // 10, 1), resguardo_errores=f // 5
+        ))
+
+        quitar_indices(cursor, indices)
+        print("Midiendo sin los índices...")
+        antes = medir(cursor, args.repeticiones)
+
+        crear_indices(cursor, indices)
+        print("Midiendo con los índices...")
+        despues = medir(cursor, args.repeticiones)
+
+        imprimir(antes, despues)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'filas': args.filas, 'antes': antes, 'despues': despues}, f, indent=2, default=str)
+            print(f"\nResultados guardados en {args.json}")
+
+        if not args.conservar:
+            sintetico.eliminar_esquema(cursor, esquema)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
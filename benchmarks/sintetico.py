@@ -0,0 +1,261 @@
+# benchmarks/sintetico.py
+"""
+Esquema temporal con datos sintéticos para los benchmarks.
+
+Las tablas se copian de la base configurada con CREATE TABLE ... LIKE (se
+conservan columnas e índices, no las llaves foráneas) y se llenan con
+INSERT ... SELECT sobre una secuencia generada en MySQL, sin pasar las filas
+por Python. Las tablas grandes se insertan por bloques de BLOQUE filas para
+no armar una sola transacción de millones de filas.
+
+Los volúmenes se configuran con un dict (ver VOLUMENES_DEFECTO y volumenes()).
+"""
+import os
+
+import pymysql
+import pymysql.cursors
+
+from config import DB_CONFIG, UPLOAD_FOLDER
+
+TABLAS = ['areas', 'bienes', 'resguardos', 'inventario_detalle', 'activity_log', 'resguardo_errores']
+# Catálogos que se copian tal cual de la base real (roles y permisos del sistema)
+TABLAS_CATALOGO = ['role', 'permission', 'role_permissions', 'alembic_version', 'cache_versions']
+BLOQUE = 500000
+CATEGORIAS_BITACORA = ('Bienes', 'Resguardos', 'Inventarios', 'Traspasos', 'Plantillas',
+                       'Usuarios', 'Importación', 'Bajas')
+
+VOLUMENES_DEFECTO = {
+    'areas': 500,
+    'bienes': 200000,
+    'resguardos': 300000,             # Los que exceden a los bienes quedan como historial inactivo
+    'activity_log': 2000000,
+    'inventarios': 50,
+    'detalles_por_inventario': 10000,
+    'resguardo_errores': 20000,
+    'usuarios': 50,
+    'imagenes_bien': 50000,           # Filas en imagenes_bien
+    'fotos': 200,                     # Archivos JPEG distintos en disco (se reparten entre las filas)
+}
+
+USUARIO_BENCH = 'bench_admin'
+PASSWORD_BENCH = 'bench'
+
+
+def volumenes(**cambios):
+    """VOLUMENES_DEFECTO con los valores indicados reemplazados."""
+    desconocidos = set(cambios) - set(VOLUMENES_DEFECTO)
+    if desconocidos:
+        raise ValueError(f"Volúmenes desconocidos: {', '.join(sorted(desconocidos))}")
+    datos = dict(VOLUMENES_DEFECTO)
+    datos.update({k: int(v) for k, v in cambios.items() if v is not None})
+    return datos
+
+
+def nombre_esquema():
+    return f"{DB_CONFIG['database']}_bench"
+
+
+def carpeta_uploads():
+    """Carpeta de archivos del benchmark, hermana de UPLOAD_FOLDER (nunca la real)."""
+    return f"{UPLOAD_FOLDER.rstrip(os.sep)}_bench"
+
+
+def conectar(database=None):
+    config = DB_CONFIG.copy()
+    config['database'] = database or DB_CONFIG['database']
+    config['cursorclass'] = pymysql.cursors.DictCursor
+    config['autocommit'] = True
+    return pymysql.connect(**config)
+
+
+def _tablas_origen(cursor, origen):
+    cursor.execute(
+        "SELECT table_name AS nombre FROM information_schema.tables "
+        "WHERE table_schema = %s AND table_type = 'BASE TABLE'", (origen,)
+    )
+    return [row['nombre'] for row in cursor.fetchall()]
+
+
+def crear_esquema(cursor, esquema=None, tablas=TABLAS):
+    """
+    (Re)crea el esquema temporal con la estructura actual de las tablas.
+    Con `tablas=None` se copian todas las de la base configurada.
+    """
+    esquema = esquema or nombre_esquema()
+    origen = DB_CONFIG['database']
+    if tablas is None:
+        tablas = _tablas_origen(cursor, origen)
+    cursor.execute(f"DROP DATABASE IF EXISTS `{esquema}`")
+    cursor.execute(f"CREATE DATABASE `{esquema}` CHARACTER SET utf8mb4")
+    for tabla in tablas:
+        cursor.execute(f"CREATE TABLE `{esquema}`.`{tabla}` LIKE `{origen}`.`{tabla}`")
+    return esquema
+
+
+def eliminar_esquema(cursor, esquema=None):
+    cursor.execute(f"DROP DATABASE IF EXISTS `{esquema or nombre_esquema()}`")
+
+
+def _secuencia(n):
+    return f"WITH RECURSIVE seq (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {int(n)})"
+
+
+def _insertar(cursor, destino, select, total, log=print):
+    """
+    INSERT INTO `destino` SELECT `select` para n = 1..total, por bloques.
+    `select` es la lista de expresiones en función de n.
+    """
+    tabla = destino.split('(')[0].strip()
+    log(f"  {tabla}: {total}")
+    cursor.execute("SET SESSION cte_max_recursion_depth = %s", (min(total, BLOQUE) + 1,))
+    for inicio in range(0, total, BLOQUE):
+        tamano = min(BLOQUE, total - inicio)
+        cursor.execute(f"""
+            INSERT INTO {destino}
+            {_secuencia(tamano)}
+            SELECT {select} FROM (SELECT n + {inicio} AS n FROM seq) s
+        """)
+
+
+def poblar(cursor, vol, log=print):
+    """
+    Llena el esquema actual con los volúmenes `vol` (ver volumenes()):
+    áreas, bienes, resguardos (uno activo por bien, los sobrantes como
+    historial), la cédula de cada inventario, bitácora y errores de importación.
+    """
+    areas, bienes = vol['areas'], vol['bienes']
+
+    _insertar(cursor, "areas (id, nombre, numero)",
+              "n, CONCAT('Área ', n), n", areas, log)
+
+    _insertar(cursor, """bienes (id, No_Inventario, Descripcion_Del_Bien, Descripcion_Corta_Del_Bien,
+                                 Marca, Costo_Inicial, Clasificacion_Legal, Activo, estatus_actual,
+                                 usuario_id_registro)""",
+              f"""n, CONCAT('INV-', LPAD(n, 7, '0')), CONCAT('Bien sintético número ', n),
+                  CONCAT('Bien ', n), ELT(1 + n % 5, 'HP', 'Dell', 'Lenovo', 'Steren', 'Truper'),
+                  (n % 10000) + 0.50, 'Dominio Privado', 1, 'Activo', 1""",
+              bienes, log)
+
+    # Resguardo n -> bien 1 + (n - 1) % bienes, en el área 1 + id_bien % areas.
+    # Los primeros `bienes` resguardos son los vigentes (salvo 1 de cada 20).
+    _insertar(cursor, """resguardos (id, id_bien, id_area, No_Resguardo, Tipo_De_Resguardo, Activo,
+                                     Nombre_Del_Resguardante, Nombre_Director_Jefe_De_Area,
+                                     Fecha_Resguardo, usuario_id_registro)""",
+              f"""n, 1 + (n - 1) % {bienes}, 1 + (1 + (n - 1) % {bienes}) % {areas},
+                  CONCAT('R-', LPAD(n, 7, '0')), IF(n % 5 = 0, 1, 0),
+                  IF(n <= {bienes} AND n % 20 <> 0, 1, 0), CONCAT('Resguardante ', n % 3000),
+                  CONCAT('Jefe ', n % {areas}), CURRENT_DATE - INTERVAL (n % 1500) DAY, 1""",
+              vol['resguardos'], log)
+
+    por_inventario = min(vol['detalles_por_inventario'], bienes)
+    _insertar(cursor, """inventario_detalle (id_inventario, id_bien, id_resguardo_esperado, id_area_esperada,
+                                             nombre_resguardante_esperado, estatus_hallazgo)""",
+              f"""1 + (n - 1) DIV {por_inventario}, 1 + (n - 1) % {bienes}, 1 + (n - 1) % {bienes},
+                  1 + (1 + (n - 1) % {bienes}) % {areas}, CONCAT('Resguardante ', (1 + (n - 1) % {bienes}) % 3000),
+                  ELT(1 + n % 4, 'Pendiente', 'Localizado', 'No Localizado', 'Localizado con Discrepancia')""",
+              vol['inventarios'] * por_inventario, log)
+
+    categorias = ', '.join(f"'{c}'" for c in CATEGORIAS_BITACORA)
+    _insertar(cursor, "activity_log (timestamp, user_id, action, category, details, resource_id)",
+              f"""NOW() - INTERVAL n MINUTE, 1 + n % {vol['usuarios']}, 'Acción sintética',
+                  ELT(1 + n % {len(CATEGORIAS_BITACORA)}, {categorias}),
+                  CONCAT('Detalle del registro ', n), n""",
+              vol['activity_log'], log)
+
+    _insertar(cursor, "resguardo_errores (upload_id, No_Inventario, error_message, Fecha_Registro)",
+              "CONCAT('carga-', n % 100), CONCAT('INV-', n), 'Error sintético', NOW() - INTERVAL n SECOND",
+              max(vol['resguardo_errores'], 1), log)
+
+    analizar(cursor, TABLAS)
+
+
+def analizar(cursor, tablas):
+    for tabla in tablas:
+        cursor.execute(f"ANALYZE TABLE `{tabla}`")
+        cursor.fetchall()
+
+
+def poblar_aplicacion(cursor, vol, esquema, carpeta=None, log=print):
+    """
+    Lo necesario para recorrer la aplicación sobre el esquema: roles y
+    permisos copiados de la base real, USUARIO_BENCH con todos los roles
+    (más usuarios de relleno), los inventarios con sus áreas y brigada, una
+    plantilla de consulta y fotos JPEG falsas en `carpeta` (uploads del
+    benchmark) referenciadas desde imagenes_bien. Al final calcula area_stats.
+
+    Se ejecuta después de poblar(); devuelve el id de la plantilla creada.
+    """
+    from werkzeug.security import generate_password_hash
+
+    origen = DB_CONFIG['database']
+    for tabla in TABLAS_CATALOGO:
+        cursor.execute(f"INSERT INTO `{esquema}`.`{tabla}` SELECT * FROM `{origen}`.`{tabla}`")
+
+    log(f"  user: {vol['usuarios']}")
+    cursor.execute("INSERT INTO `user` (id, username, password_hash, nombres) VALUES (1, %s, %s, %s)",
+                   (USUARIO_BENCH, generate_password_hash(PASSWORD_BENCH), 'Usuario de benchmark'))
+    if vol['usuarios'] > 1:
+        _insertar(cursor, "`user` (id, username, password_hash, nombres)",
+                  "n + 1, CONCAT('bench_', n + 1), 'x', CONCAT('Usuario ', n + 1)",
+                  vol['usuarios'] - 1, log=lambda _: None)
+    cursor.execute("INSERT INTO user_roles (user_id, role_id) SELECT 1, id FROM role")
+
+    areas = vol['areas']
+    _insertar(cursor, """inventarios (id, nombre, tipo, tipo_resguardo_inventariado, estatus,
+                                      id_usuario_creador)""",
+              "n, CONCAT('Inventario sintético ', n), 'Físico-Contable', 0, 'En Progreso', 1",
+              vol['inventarios'], log)
+    # Cada inventario cubre las áreas de su cédula; la brigada es el usuario del benchmark
+    cursor.execute("""
+        INSERT INTO inventario_areas (inventario_id, area_id)
+        SELECT DISTINCT id_inventario, id_area_esperada FROM inventario_detalle
+    """)
+    cursor.execute("INSERT INTO inventario_brigadas (inventario_id, user_id) SELECT id, 1 FROM inventarios")
+
+    cursor.execute(
+        "INSERT INTO query_templates (name, description, columns, filters) VALUES (%s, %s, %s, %s)",
+        ('Benchmark', 'Plantilla del benchmark de carga',
+         '["No_Inventario", "Descripcion_Corta_Del_Bien", "Marca", "No_Resguardo", '
+         '"Nombre_Del_Resguardante", "Area_Nombre", "imagenPath_bien"]',
+         '{"condition": "AND", "rules": [{"field": "Marca", "operator": "==", "value": "Dell"}, '
+         f'{{"field": "id_area", "operator": "between", "value": "1,{max(areas // 10, 1)}"}}]}}')
+    )
+    template_id = cursor.lastrowid
+
+    if vol['fotos'] and vol['imagenes_bien']:
+        rutas = generar_fotos(carpeta or carpeta_uploads(), vol['fotos'], log)
+        _insertar(cursor, "imagenes_bien (id_bien, ruta_imagen)",
+                  f"1 + (n - 1) % {vol['bienes']}, CONCAT('bienes/bench_', LPAD(1 + (n - 1) % {len(rutas)}, 5, '0'), '.jpg')",
+                  vol['imagenes_bien'], log)
+
+    # Estadísticas materializadas por área (las lee crear_inventario)
+    from area_stats import refrescar_areas
+    log(f"  area_stats: {areas}")
+    refrescar_areas(cursor, range(1, areas + 1))
+
+    analizar(cursor, ['user', 'inventarios', 'inventario_areas', 'imagenes_bien', 'area_stats'])
+    return template_id
+
+
+def generar_fotos(carpeta, cantidad, log=print):
+    """
+    Escribe `cantidad` JPEG de 1600x1200 (tamaño típico de una foto de
+    celular reducida) en `carpeta`/bienes/. Devuelve sus rutas relativas.
+    """
+    from PIL import Image, ImageDraw
+
+    destino = os.path.join(carpeta, 'bienes')
+    os.makedirs(destino, exist_ok=True)
+    log(f"  fotos: {cantidad} en {destino}")
+    rutas = []
+    for i in range(1, cantidad + 1):
+        nombre = f"bench_{i:05d}.jpg"
+        ruta = os.path.join(destino, nombre)
+        if not os.path.exists(ruta):
+            img = Image.effect_noise((1600, 1200), 40 + i % 50).convert('RGB')
+            dibujo = ImageDraw.Draw(img)
+            dibujo.rectangle((100, 100, 1500, 1100), outline=(i * 37 % 256, i * 91 % 256, i * 53 % 256), width=30)
+            dibujo.text((200, 200), f"Bien {i}", fill=(255, 255, 255))
+            img.save(ruta, 'JPEG', quality=85)
+        rutas.append(f"bienes/{nombre}")
+    return rutas
@@ -0,0 +1,250 @@
+# catalogos.py
+"""
+Catálogos en memoria: tablas pequeñas que casi todas las páginas consultan
+(áreas, usuarios, roles) y los conteos de bienes por área de crear_inventario.
+
+    from catalogos import areas, usuarios, roles, area_stats, respuesta_json
+
+- Cada catálogo se carga con una sola consulta y se guarda por proceso.
+  Las funciones devuelven copias (lista de diccionarios) que el llamador
+  puede modificar.
+- Invalidación local: cada entrada recuerda la versión de las tablas de las
+  que depende (contadores de query_cache que database.py incrementa en cada
+  commit), así cualquier escritura del mismo proceso la descarta.
+- Invalidación entre workers (REFERENCE_CACHE_SHARED): al confirmar una
+  transacción de get_db_connection que escribió en areas, user o role se
+  incrementa, en esa misma transacción, la fila del catálogo en
+  cache_versions. Cada proceso lee esa tabla a lo más cada
+  REFERENCE_CACHE_CHECK_SECONDS. Lo escrito por el ORM (Flask-Admin) lo
+  cubre el TTL.
+- area_stats lee la tabla materializada del mismo nombre, que cambia con
+  cada resguardo: no usa la fila compartida, sólo su TTL corto
+  (AREA_STATS_TTL_SECONDS).
+- respuesta_json() entrega el catálogo con un ETag del contenido: el mismo
+  en todos los workers mientras los datos no cambien.
+"""
+import hashlib
+import json
+import threading
+import time
+
+import pymysql
+from flask import Response, jsonify, request
+
+from config import (REFERENCE_CACHE_TTL_SECONDS, AREA_STATS_TTL_SECONDS,
+                    REFERENCE_CACHE_SHARED, REFERENCE_CACHE_CHECK_SECONDS)
+from database import get_db_connection, registrar_hook_antes_commit
+from query_cache import version_tablas
+
+
+class Catalogo:
+    def __init__(self, sql, tablas, ttl, compartido):
+        self.sql = sql
+        self.tablas = tablas
+        self.ttl = ttl
+        self.compartido = compartido
+
+
+CATALOGOS = {
+    'areas': Catalogo("SELECT id, nombre, numero FROM areas ORDER BY nombre",
+                      ('areas',), REFERENCE_CACHE_TTL_SECONDS, True),
+    'usuarios': Catalogo("SELECT id, username, nombres FROM user ORDER BY username",
+                         ('user',), REFERENCE_CACHE_TTL_SECONDS, True),
+    'roles': Catalogo("SELECT id, name, description FROM role ORDER BY name",
+                      ('role',), REFERENCE_CACHE_TTL_SECONDS, True),
+    # Tabla materializada (area_stats.py); un área sin fila todavía se ve con ceros
+    'area_stats': Catalogo("""
+        SELECT
+            a.id,
+            a.nombre,
+            s.jefe_de_area,
+            COALESCE(s.num_resguardos, 0) AS num_resguardos,
+            COALESCE(s.num_bienes_normal, 0) AS num_bienes_normal,
+            COALESCE(s.num_bienes_control, 0) AS num_bienes_control,
+            COALESCE(s.valor_en_libros, 0) AS valor_en_libros,
+            COALESCE(s.num_activo, 0) AS num_activo,
+            COALESCE(s.num_en_mantenimiento, 0) AS num_en_mantenimiento,
+            COALESCE(s.num_en_proceso_baja, 0) AS num_en_proceso_baja,
+            COALESCE(s.num_baja, 0) AS num_baja,
+            COALESCE(s.num_faltante, 0) AS num_faltante
+        FROM areas a
+        LEFT JOIN area_stats s ON s.id_area = a.id
+        ORDER BY a.nombre
+    """, ('areas', 'area_stats'), AREA_STATS_TTL_SECONDS, False),
+}
+
+# Tabla escrita -> fila de cache_versions que se incrementa
+_TABLA_A_CATALOGO = {'areas': 'areas', 'user': 'usuarios', 'role': 'roles'}
+
+
+# --- Versión compartida ---
+
+def _marcar_cambios(conn, tablas):
+    """Hook previo al commit: incrementa las filas compartidas en la misma transacción."""
+    nombres = sorted({_TABLA_A_CATALOGO[t] for t in tablas if t in _TABLA_A_CATALOGO})
+    if not nombres or not REFERENCE_CACHE_SHARED:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"UPDATE cache_versions SET version = version + 1 WHERE nombre IN ({','.join(['%s'] * len(nombres))})",
+            nombres
+        )
+    except pymysql.MySQLError as e:
+        # Sin la tabla (migración pendiente) sólo se pierde la invalidación entre workers
+        print(f"CATÁLOGOS: no se pudo marcar el cambio de {nombres}: {e}")
+    finally:
+        cursor.close()
+
+
+registrar_hook_antes_commit(_marcar_cambios)
+
+
+class ReferenceCache:
+    """Catálogos cargados completos, validados por versión local, versión compartida y TTL."""
+
+    def __init__(self, catalogos):
+        self.catalogos = catalogos
+        self._lock = threading.Lock()
+        self._entradas = {}          # nombre -> (filas, etag, versiones, version_compartida, creado)
+        self._compartidas = {}       # nombre -> versión leída de cache_versions
+        self._ultima_revision = 0.0
+        self._stats = {'hits': 0, 'misses': 0, 'invalidaciones': 0, 'expirados': 0,
+                       'revisiones': 0, 'invalidaciones_remotas': 0}
+
+    def _revisar_compartidas(self):
+        """Lee cache_versions si ya pasó REFERENCE_CACHE_CHECK_SECONDS desde la última vez."""
+        if not REFERENCE_CACHE_SHARED:
+            return
+        with self._lock:
+            ahora = time.time()
+            if ahora - self._ultima_revision < REFERENCE_CACHE_CHECK_SECONDS:
+                return
+            self._ultima_revision = ahora   # Un solo hilo revisa; los demás usan lo que hay
+        conn = get_db_connection()
+        if conn is None:
+            return
+        try:
+            cursor = conn.cursor(pymysql.cursors.DictCursor)
+            cursor.execute("SELECT nombre, version FROM cache_versions")
+            versiones = {fila['nombre']: fila['version'] for fila in cursor.fetchall()}
+        except pymysql.MySQLError as e:
+            print(f"CATÁLOGOS: no se pudo leer cache_versions: {e}")
+            return
+        finally:
+            conn.close()
+        with self._lock:
+            self._compartidas = versiones
+            self._stats['revisiones'] += 1
+
+    def _vigente(self, nombre):
+        catalogo = self.catalogos[nombre]
+        with self._lock:
+            entrada = self._entradas.get(nombre)
+            if entrada is None:
+                self._stats['misses'] += 1
+                return None
+            filas, etag, versiones, compartida, creado = entrada
+            motivo = None
+            if time.time() - creado > catalogo.ttl:
+                motivo = 'expirados'
+            elif version_tablas(catalogo.tablas) != versiones:
+                motivo = 'invalidaciones'
+            elif catalogo.compartido and self._compartidas.get(nombre, compartida) != compartida:
+                motivo = 'invalidaciones_remotas'
+            if motivo:
+                del self._entradas[nombre]
+                self._stats[motivo] += 1
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            return entrada
+
+    def _cargar(self, nombre):
+        catalogo = self.catalogos[nombre]
+        # Versiones tomadas antes de leer: una escritura concurrente deja la entrada ya vencida
+        versiones = version_tablas(catalogo.tablas)
+        with self._lock:
+            compartida = self._compartidas.get(nombre)
+        conn = get_db_connection()
+        if conn is None:
+            raise RuntimeError("No se pudo conectar a la base de datos.")
+        try:
+            cursor = conn.cursor(pymysql.cursors.DictCursor)
+            cursor.execute(catalogo.sql)
+            filas = tuple(cursor.fetchall())
+        finally:
+            conn.close()
+        contenido = json.dumps(filas, default=str, sort_keys=True, separators=(',', ':'))
+        etag = f"{nombre}-{hashlib.md5(contenido.encode('utf-8')).hexdigest()}"
+        entrada = (filas, etag, versiones, compartida, time.time())
+        with self._lock:
+            self._entradas[nombre] = entrada
+        return entrada
+
+    def obtener(self, nombre):
+        """(filas, etag) vigentes del catálogo; las filas son de sólo lectura."""
+        self._revisar_compartidas()
+        entrada = self._vigente(nombre) or self._cargar(nombre)
+        return entrada[0], entrada[1]
+
+    def invalidar(self, nombre=None):
+        with self._lock:
+            if nombre is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(nombre, None)
+
+    def stats(self):
+        with self._lock:
+            datos = dict(self._stats)
+            datos['cargados'] = sorted(self._entradas)
+            datos['versiones_compartidas'] = dict(self._compartidas)
+        return datos
+
+
+reference_cache = ReferenceCache(CATALOGOS)
+
+
+def _copia(nombre):
+    filas, _ = reference_cache.obtener(nombre)
+    return [dict(fila) for fila in filas]
+
+
+def areas():
+    """[{id, nombre, numero}] ordenadas por nombre."""
+    return _copia('areas')
+
+
+def usuarios():
+    """[{id, username, nombres}] ordenados por username."""
+    return _copia('usuarios')
+
+
+def roles():
+    """[{id, name, description}] ordenados por nombre."""
+    return _copia('roles')
+
+
+def area_stats():
+    """Una fila por área con las columnas de la tabla area_stats (resguardos activos)."""
+    return _copia('area_stats')
+
+
+def respuesta_json(nombre, campos=None):
+    """
+    Respuesta JSON del catálogo con ETag; If-None-Match con el mismo ETag
+    devuelve 304 sin cuerpo. `campos` limita las columnas enviadas.
+    """
+    filas, etag = reference_cache.obtener(nombre)
+    if campos:
+        etag = f"{etag}-{'.'.join(campos)}"
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        datos = [{c: fila[c] for c in campos} for fila in filas] if campos else list(filas)
+        response = jsonify(datos)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True   # Siempre se revalida: el 304 es barato
+    return response
@@ -0,0 +1,146 @@
+# cedulas.py
+"""
+Generación de la cédula de levantamiento de un inventario: una fila de
+inventario_detalle por bien con resguardo activo del tipo inventariado en
+cada área asignada.
+
+    python -m cedulas 42              # genera la cédula del inventario 42
+    python -m cedulas 42 --simular    # sólo cuenta los bienes por área
+
+Antes la ruta traía todos los resguardos a Python y los reinsertaba con
+executemany (cientos de miles de filas de ida y vuelta en un inventario
+institucional). Ahora cada área es un solo INSERT ... SELECT que resuelve el
+servidor sobre ix_resguardos_area_activo_tipo, confirmado por separado:
+
+- La transacción por área acota los bloqueos y permite informar avance.
+- Es reanudable e idempotente: cada área se genera con la fila del
+  inventario bloqueada (SELECT ... FOR UPDATE), se omite si ya tiene filas y
+  el INSERT descarta los bienes que ya están en la cédula. Dos trabajos
+  simultáneos del mismo inventario se turnan en vez de duplicar bienes.
+- contar() hace la simulación con un solo GROUP BY, sin escribir.
+"""
+import argparse
+
+import pymysql.cursors
+
+from database import get_db_connection
+
+SQL_CEDULA_AREA = """
+    INSERT INTO inventario_detalle (
+        id_inventario, id_bien, id_resguardo_esperado, id_area_esperada,
+        nombre_resguardante_esperado, estatus_hallazgo
+    )
+    SELECT %s, b.id, r.id, r.id_area, r.Nombre_Del_Resguardante, 'Pendiente'
+    FROM resguardos r
+    JOIN bienes b ON b.id = r.id_bien
+    WHERE r.id_area = %s
+      AND r.Activo = 1
+      AND r.Tipo_De_Resguardo = %s
+      AND NOT EXISTS (
+          SELECT 1 FROM inventario_detalle d
+          WHERE d.id_inventario = %s AND d.id_bien = b.id
+      )
+"""
+
+
+def _ids(area_ids):
+    return sorted({int(i) for i in area_ids if i not in (None, '')})
+
+
+def contar(cursor, area_ids, tipo_resguardo):
+    """{id_area: bienes} que tendría la cédula; las áreas sin bienes aparecen con 0."""
+    ids = _ids(area_ids)
+    if not ids:
+        return {}
+    cursor.execute(f"""
+        SELECT r.id_area, COUNT(*) AS bienes
+        FROM resguardos r
+        JOIN bienes b ON b.id = r.id_bien
+        WHERE r.id_area IN ({', '.join(['%s'] * len(ids))})
+          AND r.Activo = 1
+          AND r.Tipo_De_Resguardo = %s
+        GROUP BY r.id_area
+    """, ids + [int(tipo_resguardo)])
+    conteos = dict.fromkeys(ids, 0)
+    conteos.update({fila['id_area']: fila['bienes'] for fila in cursor.fetchall()})
+    return conteos
+
+
+def generar(conn, inventario_id, progreso=None):
+    """
+    Llena la cédula del inventario área por área, confirmando cada una.
+    `progreso(areas_hechas, total_areas, bienes_insertados)` se llama después
+    de cada commit. Devuelve {'areas', 'omitidas', 'bienes', 'por_area'}.
+    """
+    cursor = conn.cursor(pymysql.cursors.DictCursor)
+    cursor.execute("SELECT tipo_resguardo_inventariado FROM inventarios WHERE id = %s", (inventario_id,))
+    inventario = cursor.fetchone()
+    if not inventario:
+        raise ValueError(f"El inventario {inventario_id} no existe.")
+    tipo_resguardo = inventario['tipo_resguardo_inventariado']
+
+    cursor.execute("SELECT area_id FROM inventario_areas WHERE inventario_id = %s ORDER BY area_id",
+                   (inventario_id,))
+    area_ids = [fila['area_id'] for fila in cursor.fetchall()]
+    conn.commit()   # Cierra la lectura; cada área abre su propia transacción
+
+    resumen = {'areas': len(area_ids), 'omitidas': 0, 'bienes': 0, 'por_area': {}}
+    for hechas, area_id in enumerate(area_ids, start=1):
+        try:
+            # El bloqueo de la fila del inventario serializa a los generadores concurrentes;
+            # la revisión del área se hace ya con el bloqueo tomado
+            cursor.execute("SELECT id FROM inventarios WHERE id = %s FOR UPDATE", (inventario_id,))
+            cursor.execute("SELECT 1 FROM inventario_detalle WHERE id_inventario = %s AND id_area_esperada = %s LIMIT 1",
+                           (inventario_id, area_id))
+            if cursor.fetchone():
+                insertados = None
+            else:
+                cursor.execute(SQL_CEDULA_AREA, (inventario_id, area_id, tipo_resguardo, inventario_id))
+                insertados = cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if insertados is None:
+            resumen['omitidas'] += 1
+        else:
+            resumen['por_area'][area_id] = insertados
+            resumen['bienes'] += insertados
+        if progreso:
+            progreso(hechas, len(area_ids), resumen['bienes'])
+    return resumen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inventario_id', type=int)
+    parser.add_argument('--simular', action='store_true', help='Sólo contar los bienes por área, sin escribir')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if conn is None:
+        raise SystemExit("No se pudo conectar a la base de datos.")
+    try:
+        if args.simular:
+            cursor = conn.cursor(pymysql.cursors.DictCursor)
+            cursor.execute("SELECT tipo_resguardo_inventariado FROM inventarios WHERE id = %s", (args.inventario_id,))
+            inventario = cursor.fetchone()
+            if not inventario:
+                raise SystemExit(f"El inventario {args.inventario_id} no existe.")
+            cursor.execute("SELECT area_id FROM inventario_areas WHERE inventario_id = %s", (args.inventario_id,))
+            conteos = contar(cursor, [fila['area_id'] for fila in cursor.fetchall()],
+                             inventario['tipo_resguardo_inventariado'])
+            for area_id, bienes in conteos.items():
+                print(f"  área {area_id}: {bienes} bienes")
+            print(f"Total: {sum(conteos.values())} bienes en {len(conteos)} áreas (simulación).")
+            return
+        resumen = generar(conn, args.inventario_id,
+                          progreso=lambda hechas, total, bienes: print(f"  {hechas}/{total} áreas, {bienes} bienes..."))
+        print(f"Listo: {resumen['bienes']} bienes en {resumen['areas'] - resumen['omitidas']} áreas "
+              f"({resumen['omitidas']} ya generadas).")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
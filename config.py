@@ -20,6 +20,19 @@ DB_CONFIG = {
     'database': 'inventario'
 }
 
+# --- Pool de conexiones a la base de datos ---
+# Un solo pool por proceso, compartido entre db.session y get_db_connection().
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))                  # Conexiones que se mantienen abiertas
+DB_POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 20))  # Conexiones extra permitidas en picos
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'  # Verifica la conexión antes de prestarla
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 280))           # Vida máxima en segundos (menor al wait_timeout de MySQL)
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))            # Segundos máximos de espera por una conexión libre
+
+# --- Búsqueda ---
+# 'fulltext' (índices FULLTEXT de MySQL), 'like' (sin índices) o 'memoria' (índice invertido para pruebas)
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'fulltext')
+SEARCH_FT_MIN_TOKEN = int(os.environ.get('SEARCH_FT_MIN_TOKEN', 3))    # Igual a innodb_ft_min_token_size
+
 
 # --- Rutas de Archivos ---
 # app.root_path es la raíz de tu aplicación Flask
@@ -29,6 +42,56 @@ project_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(project_dir)
 UPLOAD_FOLDER = os.path.join(parent_dir, 'uploads')
 print(UPLOAD_FOLDER)
+
+# --- Cache en disco de archivos de Google Drive ---
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', os.path.join(project_dir, 'image_cache'))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_MB', 512)) * 1024 * 1024   # Presupuesto total en disco
+IMAGE_CACHE_REVALIDATE_SECONDS = int(os.environ.get('IMAGE_CACHE_REVALIDATE_SECONDS', 3600))  # Tras esto se compara el md5 con Drive
+
+# --- Derivados de fotos (miniaturas) ---
+DERIVATIVE_WORKERS = int(os.environ.get('DERIVATIVE_WORKERS', 2))      # Hilos que generan miniaturas al subir fotos
+PDF_IMAGE_MAX_PX = int(os.environ.get('PDF_IMAGE_MAX_PX', 200))        # Lado mayor de las fotos incrustadas en el PDF
+
+# --- Cache HTTP (navegador) ---
+UPLOADS_HTTP_MAX_AGE = int(os.environ.get('UPLOADS_HTTP_MAX_AGE', 365 * 24 * 3600))    # Archivos subidos: nombre único, inmutables
+DRIVE_IMAGES_HTTP_MAX_AGE = int(os.environ.get('DRIVE_IMAGES_HTTP_MAX_AGE', 24 * 3600))  # Imágenes de Drive: se revalidan con ETag
+
+# --- Trabajos en segundo plano ---
+# Archivos subidos para importar y resultados generados (Excel, PDF) de los trabajos
+JOBS_FOLDER = os.environ.get('JOBS_FOLDER', os.path.join(parent_dir, 'job_results'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))                     # Hilos que ejecutan trabajos por proceso
+JOBS_SYNC = os.environ.get('JOBS_SYNC', 'false').lower() == 'true'      # Ejecuta en la misma petición (depuración)
+JOB_STALE_MINUTES = int(os.environ.get('JOB_STALE_MINUTES', 120))       # 'En Proceso' sin latido (filas anteriores al latido) se da por interrumpido tras esto
+JOB_HEARTBEAT_SECONDS = int(os.environ.get('JOB_HEARTBEAT_SECONDS', 30))  # Latido de los trabajos en curso; 3 latidos perdidos = huérfano
+JOB_RESULT_TTL_HOURS = int(os.environ.get('JOB_RESULT_TTL_HOURS', 24))  # Tiempo que se conservan los resultados descargables
+
+# --- Cache de resultados de plantillas de consulta ---
+QUERY_CACHE_MAX_BYTES = int(os.environ.get('QUERY_CACHE_MAX_MB', 64)) * 1024 * 1024  # Memoria máxima por proceso
+QUERY_CACHE_TTL_SECONDS = int(os.environ.get('QUERY_CACHE_TTL_SECONDS', 600))        # Vida máxima de un resultado aunque no haya escrituras
+
+# --- Perfilado de SQL por petición ---
+SQL_PROFILER_ENABLED = os.environ.get('SQL_PROFILER', 'true').lower() == 'true'       # Cabecera Server-Timing y estadísticas por endpoint
+SQL_PROFILER_LOG = os.environ.get('SQL_PROFILER_LOG', 'true').lower() == 'true'       # Una línea JSON por petición en el log
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))                           # Consultas más lentas que esto se guardan con su EXPLAIN
+SLOW_QUERY_MAX = int(os.environ.get('SLOW_QUERY_MAX', 100))                           # Consultas lentas que se conservan en memoria
+
+# --- Bitácora de actividad ---
+ACTIVITY_LOG_SYNC = os.environ.get('ACTIVITY_LOG_SYNC', 'false').lower() == 'true'  # Escribe cada entrada en el momento (pruebas)
+ACTIVITY_LOG_BATCH_SIZE = int(os.environ.get('ACTIVITY_LOG_BATCH_SIZE', 200))          # Entradas por lote (executemany)
+ACTIVITY_LOG_FLUSH_SECONDS = float(os.environ.get('ACTIVITY_LOG_FLUSH_SECONDS', 2))    # Espera máxima antes de escribir un lote incompleto
+ACTIVITY_LOG_QUEUE_MAX = int(os.environ.get('ACTIVITY_LOG_QUEUE_MAX', 10000))          # Entradas en memoria; al llenarse se escribe directo
+ACTIVITY_LOG_RETENTION_MONTHS = int(os.environ.get('ACTIVITY_LOG_RETENTION_MONTHS', 12))  # Meses completos que se quedan en la tabla
+ACTIVITY_LOG_ARCHIVE_DIR = os.environ.get('ACTIVITY_LOG_ARCHIVE_DIR', os.path.join(parent_dir, 'activity_log_archive'))  # Archivos .jsonl.gz por mes
+
+# --- Cache de usuarios y permisos (user_loader) ---
+PERMISSION_CACHE_MAX_USERS = int(os.environ.get('PERMISSION_CACHE_MAX_USERS', 1000))      # Usuarios por proceso (LRU)
+PERMISSION_CACHE_TTL_SECONDS = int(os.environ.get('PERMISSION_CACHE_TTL_SECONDS', 120))   # Atraso máximo ante cambios hechos en otro worker
+
+# --- Catálogos en memoria (áreas, usuarios, roles) ---
+REFERENCE_CACHE_TTL_SECONDS = int(os.environ.get('REFERENCE_CACHE_TTL_SECONDS', 600))        # Vida máxima de un catálogo aunque no haya escrituras
+AREA_STATS_TTL_SECONDS = int(os.environ.get('AREA_STATS_TTL_SECONDS', 60))                   # Lectura de la tabla area_stats (cambia con cada resguardo)
+REFERENCE_CACHE_SHARED = os.environ.get('REFERENCE_CACHE_SHARED', 'true').lower() == 'true'  # Invalida entre workers con la tabla cache_versions
+REFERENCE_CACHE_CHECK_SECONDS = float(os.environ.get('REFERENCE_CACHE_CHECK_SECONDS', 5))    # Cada cuánto se consulta cache_versions
 # --- Extensiones Permitidas para Subidas ---
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf'}
 
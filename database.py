@@ -1,24 +1,305 @@
 # your_flask_app/database.py
 
 import pymysql.cursors  # 1. ¡Importa pymysql.cursors!
-from flask import flash, current_app # current_app para acceder a la config de Flask
+import re
+import threading
+import time
+from flask import flash, current_app, has_app_context # current_app para acceder a la config de Flask
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError, SQLAlchemyError
 from config import AVAILABLE_COLUMNS
 import pandas as pd
 from io import BytesIO
-from config import DB_CONFIG  # Importa la configuración directamente
+from config import DB_CONFIG, DB_POOL_SIZE, DB_POOL_MAX_OVERFLOW  # Importa la configuración directamente
+from extensions import db
+
+# --- Estadísticas del pool de conexiones ---
+_pool_stats_lock = threading.Lock()
+_pool_stats = {
+    'checkouts': 0,          # Préstamos de conexión (ORM y get_db_connection)
+    'esperas': 0,            # Préstamos que encontraron el pool agotado
+    'tiempo_espera_ms': 0.0, # Tiempo total esperando una conexión libre
+    'timeouts': 0,           # Préstamos que superaron DB_POOL_TIMEOUT
+    'conexiones_nuevas': 0,  # Conexiones físicas abiertas
+    'reciclajes': 0,         # Conexiones reemplazadas por vida máxima o pre-ping fallido
+    'invalidaciones': 0,     # Conexiones descartadas por error
+}
+
+
+def _incrementar_stat(nombre, valor=1):
+    with _pool_stats_lock:
+        _pool_stats[nombre] += valor
+
+
+def _on_connect(dbapi_connection, connection_record):
+    # record_info sobrevive a las reconexiones del mismo registro del pool,
+    # así distinguimos una conexión nueva de una reciclada.
+    if connection_record.record_info.get('conectado'):
+        _incrementar_stat('reciclajes')
+    else:
+        connection_record.record_info['conectado'] = True
+        _incrementar_stat('conexiones_nuevas')
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    _incrementar_stat('checkouts')
+
+
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    _incrementar_stat('invalidaciones')
+
+
+# --- Hooks de SQL ---
+# Otros módulos se suscriben para observar las consultas (perfilado) o las
+# tablas modificadas por cada transacción confirmada (invalidar caches).
+# Cubren tanto get_db_connection como db.session / db.engine.
+_hooks_consulta = []   # funcion(sql, duracion_ms, params, filas)
+_hooks_commit = []     # funcion(tablas_modificadas: set)
+_hooks_antes_commit = []   # funcion(conexion, tablas_modificadas: set), dentro de la transacción
+
+_RE_ESCRITURA = re.compile(r'^\s*(?:INSERT|UPDATE|DELETE|REPLACE|TRUNCATE|ALTER|DROP|LOAD|CREATE)\b', re.IGNORECASE)
+_RE_TABLAS = re.compile(r'\b(?:INTO|UPDATE|FROM|JOIN|TABLE)\s+`?(\w+)`?', re.IGNORECASE)
+_RE_INSERT = re.compile(r'^\s*(?:INSERT|REPLACE)(?:\s+(?:LOW_PRIORITY|DELAYED|HIGH_PRIORITY|IGNORE))*\s+(?:INTO\s+)?`?(\w+)`?',
+                        re.IGNORECASE)
+
+
+def registrar_hook_consulta(funcion):
+    if funcion not in _hooks_consulta:
+        _hooks_consulta.append(funcion)
+
+
+def registrar_hook_commit(funcion):
+    if funcion not in _hooks_commit:
+        _hooks_commit.append(funcion)
+
+
+def registrar_hook_antes_commit(funcion):
+    """
+    Sólo conexiones de get_db_connection: la función puede ejecutar más
+    sentencias en la misma transacción justo antes de confirmarla.
+    """
+    if funcion not in _hooks_antes_commit:
+        _hooks_antes_commit.append(funcion)
+
+
+def tablas_escritas(sql):
+    """
+    Tablas que puede modificar una sentencia. INSERT/REPLACE sólo escriben en
+    su tabla destino (aunque lean de otras con INSERT ... SELECT); en las
+    demás se devuelven todas las tablas que mencionan (UPDATE/DELETE con
+    JOIN): es preferible invalidar de más que servir datos viejos.
+    """
+    if not sql or not _RE_ESCRITURA.match(sql):
+        return set()
+    destino = _RE_INSERT.match(sql)
+    if destino:
+        return {destino.group(1).lower()}
+    return {t.lower() for t in _RE_TABLAS.findall(sql)}
+
+
+def _filas(cursor):
+    """Filas devueltas/afectadas; None si el cursor no lo sabe (SSCursor antes de leerlo)."""
+    try:
+        filas = cursor.rowcount
+    except Exception:
+        return None
+    return filas if filas is not None and 0 <= filas < 2 ** 63 else None
+
+
+def _notificar_consulta(sql, duracion_ms, params=None, filas=None):
+    for funcion in _hooks_consulta:
+        try:
+            funcion(sql, duracion_ms, params, filas)
+        except Exception as e:
+            print(f"Error en hook de consulta: {e}")
+
+
+def _notificar_commit(tablas):
+    if not tablas:
+        return
+    for funcion in _hooks_commit:
+        try:
+            funcion(tablas)
+        except Exception as e:
+            print(f"Error en hook de commit: {e}")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['sql_inicio'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    inicio = conn.info.pop('sql_inicio', None)
+    if inicio is not None:
+        _notificar_consulta(statement, (time.perf_counter() - inicio) * 1000,
+                            None if executemany else parameters, _filas(cursor))
+    tablas = tablas_escritas(statement)
+    if tablas:
+        conn.info.setdefault('tablas_escritas', set()).update(tablas)
+
+
+def _on_engine_commit(conn):
+    _notificar_commit(conn.info.pop('tablas_escritas', None))
+
+
+def _on_engine_rollback(conn):
+    conn.info.pop('tablas_escritas', None)
+
+
+def init_pool(app):
+    """
+    Registra los contadores sobre el pool del engine de Flask-SQLAlchemy y
+    los hooks de SQL del ORM. Debe llamarse una vez, después de db.init_app(app).
+    """
+    with app.app_context():
+        engine = db.engine
+        if not event.contains(engine, 'connect', _on_connect):
+            event.listen(engine, 'connect', _on_connect)
+            event.listen(engine, 'checkout', _on_checkout)
+            event.listen(engine, 'invalidate', _on_invalidate)
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'commit', _on_engine_commit)
+            event.listen(engine, 'rollback', _on_engine_rollback)
+
+
+def get_pool_stats():
+    """
+    Devuelve una copia de los contadores del pool junto con su ocupación actual.
+    """
+    with _pool_stats_lock:
+        stats = dict(_pool_stats)
+    if has_app_context():
+        pool = db.engine.pool
+        stats['estado'] = pool.status()
+        if hasattr(pool, 'checkedout'):
+            stats['en_uso'] = pool.checkedout()
+            stats['disponibles'] = pool.checkedin()
+    return stats
+
+
+class ObservedCursor:
+    """
+    Envoltura de un cursor PyMySQL que avisa a los hooks de SQL y anota en la
+    conexión las tablas que modifica; el resto se delega al cursor original.
+    """
+
+    def __init__(self, cursor, connection):
+        self._cursor = cursor
+        self._connection = connection
+
+    def _ejecutar(self, metodo, query, args, varias=False):
+        inicio = time.perf_counter()
+        try:
+            return metodo(query, args)
+        finally:
+            _notificar_consulta(query, (time.perf_counter() - inicio) * 1000,
+                                None if varias else args,
+                                _filas(self._cursor))
+            tablas = tablas_escritas(query)
+            if tablas:
+                self._connection._tablas_escritas.update(tablas)
+
+    def execute(self, query, args=None):
+        return self._ejecutar(self._cursor.execute, query, args)
+
+    def executemany(self, query, args):
+        return self._ejecutar(self._cursor.executemany, query, args, varias=True)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+
+
+class PooledConnection:
+    """
+    Conexión PyMySQL prestada del pool del engine de SQLAlchemy.
+    Se comporta como la conexión original (cursor, commit, rollback...) pero
+    close() la devuelve al pool en lugar de cerrar el socket.
+    """
+
+    def __init__(self, proxy):
+        self._proxy = proxy
+        self._tablas_escritas = set()
+
+    def cursor(self, cursorclass=None):
+        # Las rutas esperan diccionarios, igual que con cursorclass=DictCursor.
+        return ObservedCursor(self._proxy.cursor(cursorclass or pymysql.cursors.DictCursor), self)
+
+    def commit(self):
+        if self._tablas_escritas:
+            for funcion in _hooks_antes_commit:
+                try:
+                    funcion(self, set(self._tablas_escritas))
+                except Exception as e:
+                    print(f"Error en hook previo al commit: {e}")
+        self._proxy.commit()
+        tablas, self._tablas_escritas = self._tablas_escritas, set()
+        _notificar_commit(tablas)
+
+    def rollback(self):
+        self._tablas_escritas = set()
+        self._proxy.rollback()
+
+    def is_connected(self):
+        return self._proxy is not None and self._proxy.is_valid and bool(self._proxy.open)
+
+    def close(self):
+        if self._proxy is not None:
+            proxy, self._proxy = self._proxy, None
+            self._tablas_escritas = set()
+            proxy.close()  # El pool hace rollback de lo no confirmado
+
+    def __getattr__(self, name):
+        if self._proxy is None:
+            raise pymysql.err.InterfaceError(0, 'La conexión ya fue devuelta al pool')
+        return getattr(self._proxy, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _connect_direct():
+    config = DB_CONFIG.copy()
+    config['cursorclass'] = pymysql.cursors.DictCursor
+    return pymysql.connect(**config)
+
 
 def get_db_connection():
     """
-    Establece una conexión a la base de datos usando PyMySQL.
+    Presta una conexión PyMySQL del pool compartido con db.session.
+    Fuera de un contexto de aplicación (scripts) abre una conexión directa.
     """
     try:
-        config = DB_CONFIG.copy()
-        config['cursorclass'] = pymysql.cursors.DictCursor
-        
-        conn = pymysql.connect(**config)
-        return conn
-        
-    except pymysql.MySQLError as err: 
+        if not has_app_context():
+            return _connect_direct()
+
+        pool = db.engine.pool
+        agotado = (hasattr(pool, 'checkedin') and pool.checkedin() == 0
+                   and pool.checkedout() >= DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW)
+        inicio = time.perf_counter()
+        proxy = db.engine.raw_connection()
+        if agotado:
+            _incrementar_stat('esperas')
+            _incrementar_stat('tiempo_espera_ms', (time.perf_counter() - inicio) * 1000)
+        return PooledConnection(proxy)
+
+    except PoolTimeoutError as err:
+        _incrementar_stat('timeouts')
+        print(f"Tiempo de espera agotado al pedir una conexión del pool: {err}")
+        return None
+    except (pymysql.MySQLError, SQLAlchemyError) as err:
         print(f"Error de conexión a la base de datos: {err}")
         return None
 
@@ -86,22 +367,40 @@ def map_operator_to_sql(operator):
         'contains': 'LIKE'
     }
     return operator_map.get(operator, '=')
-# --- Core Helper Function (get_filtered_resguardo_data) ---
-# This function MUST be defined before any route or function that calls it.
+# --- Rutas de imágenes ---
+IMAGE_IN_CHUNK_SIZE = 500  # Ids por consulta IN al buscar imágenes en lote
+
+
+def get_image_paths_batch(cursor, table_name, foreign_key_col, record_ids, chunk_size=IMAGE_IN_CHUNK_SIZE):
+    """
+    Obtiene las rutas de imagen de muchos registros con una consulta IN por
+    bloque, usando el cursor del llamador (sin abrir conexiones nuevas).
+    Devuelve {record_id: [rutas ordenadas por id]}.
+    """
+    paths = {}
+    ids = list(dict.fromkeys(record_ids))
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        placeholders = ','.join(['%s'] * len(chunk))
+        query = (f"SELECT {foreign_key_col} AS record_id, ruta_imagen FROM {table_name} "
+                 f"WHERE {foreign_key_col} IN ({placeholders}) ORDER BY {foreign_key_col}, id")
+        cursor.execute(query, tuple(chunk))
+        for row in cursor.fetchall():
+            paths.setdefault(row['record_id'], []).append(row['ruta_imagen'])
+    return paths
+
+
 def get_image_paths(table_name, foreign_key_col, record_id):
     """
     Helper function to get all image paths for a record ID.
+    Para varios registros usa get_image_paths_batch con la conexión que ya tengas.
     """
     conn = None
     paths = []
     try:
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        query = f"SELECT ruta_imagen FROM {table_name} WHERE {foreign_key_col} = %s ORDER BY id"
-        cursor.execute(query, (record_id,))
-        results = cursor.fetchall()
-        paths = [row['ruta_imagen'] for row in results]
-        print(f"Found {len(paths)} images in {table_name} for {foreign_key_col}={record_id}")
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        paths = get_image_paths_batch(cursor, table_name, foreign_key_col, [record_id]).get(record_id, [])
     except pymysql.MySQLError as err:
         print(f"Database error in get_image_paths: {err}")
     except Exception as e:
@@ -112,134 +411,3 @@ def get_image_paths(table_name, foreign_key_col, record_id):
         if conn: # <-- Bien
             conn.close()
     return paths
-
-def get_filtered_resguardo_data(selected_columns, filters):
-    """
-    Gets filtered data from the resguardos and bienes tables.
-    """
-    conn = None
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        # Separar columnas reales de columnas virtuales (imágenes)
-        real_columns = [col for col in selected_columns if col not in ['imagenPath_bien', 'imagenPath_resguardo']]
-        image_columns = [col for col in selected_columns if col in ['imagenPath_bien', 'imagenPath_resguardo']]
-        
-        # Build the SELECT clause solo con columnas reales
-        select_clause = ", ".join(real_columns) if real_columns else "r.id as id_resguardo, b.id as id_bien, r.*, b.*, a.nombre as Area_Nombre"
-        
-        # Siempre incluir los IDs necesarios para recuperar imágenes
-        id_columns = []
-        if 'imagenPath_bien' in image_columns and 'b.id' not in real_columns and 'id_bien' not in real_columns:
-            select_clause += ", b.id AS id_bien"
-            id_columns.append('id_bien')
-        
-        if 'imagenPath_resguardo' in image_columns and 'r.id' not in real_columns and 'id_resguardo' not in real_columns:
-            select_clause += ", r.id AS id_resguardo"
-            id_columns.append('id_resguardo')
-
-        # Build the JOINs
-        query_tables = "resguardos r JOIN bienes b ON r.id_bien = b.id JOIN areas a ON r.id_area = a.id"
-
-        # Build the WHERE clause from filters
-        where_clause = ""
-        filter_values = []
-        if filters:
-            where_clauses = []
-            for f in filters:
-                field_name = f.get('field', '')
-                field_value = f.get('value', '')
-                field_operator = f.get('operator', '==')
-                
-                if field_name == 'No_Inventario':
-                    where_clauses.append("b.No_Inventario LIKE %s")
-                    filter_values.append(f"%{field_value}%")
-                elif field_name == 'No_Resguardo':
-                    where_clauses.append("r.No_Resguardo LIKE %s")
-                    filter_values.append(f"%{field_value}%")
-                elif field_name == 'Nombre_Del_Resguardante':
-                    where_clauses.append("r.Nombre_Del_Resguardante LIKE %s")
-                    filter_values.append(f"%{field_value}%")
-                elif field_name == 'Area':
-                    where_clauses.append("a.id = %s")
-                    filter_values.append(field_value)
-            if where_clauses:
-                where_clause = " WHERE " + " AND ".join(where_clauses)
-
-        # Final query
-        query = f"SELECT {select_clause} FROM {query_tables} {where_clause}"
-        print(f"Executing query: {query}")
-        print(f"With parameters: {filter_values}")
-
-        cursor.execute(query, tuple(filter_values))
-        data = cursor.fetchall()
-        print(f"Query returned {len(data)} rows.")
-
-        if not data:
-            print("No data found for the given filters.")
-            return [], 0, 0
-
-        # Obtener el máximo número de imágenes por tipo para determinar cuántas columnas necesitamos
-        max_bien_images = 0
-        max_resguardo_images = 0
-        
-        for row in data:
-            id_bien = row.get('id_bien')
-            id_resguardo = row.get('id_resguardo')
-            
-            if id_bien and 'imagenPath_bien' in image_columns:
-                bien_images = get_image_paths('imagenes_bien', 'id_bien', id_bien)
-                max_bien_images = max(max_bien_images, len(bien_images))
-            
-            if id_resguardo and 'imagenPath_resguardo' in image_columns:
-                resguardo_images = get_image_paths('imagenes_resguardo', 'id_resguardo', id_resguardo)
-                max_resguardo_images = max(max_resguardo_images, len(resguardo_images))
-
-        # Agregar las imágenes a cada registro
-        for row in data:
-            # Para imágenes de bienes
-            if 'imagenPath_bien' in image_columns:
-                id_bien = row.get('id_bien')
-                if id_bien:
-                    bien_images = get_image_paths('imagenes_bien', 'id_bien', id_bien)
-                    # Crear columnas individuales para cada imagen
-                    for i, image_path in enumerate(bien_images):
-                        row[f'imagen_bien_{i+1}'] = image_path
-                    # También guardar la lista completa para referencia
-                    row['imagenPath_bien'] = bien_images
-                else:
-                    row['imagenPath_bien'] = []
-
-            # Para imágenes de resguardos
-            if 'imagenPath_resguardo' in image_columns:
-                id_resguardo = row.get('id_resguardo')
-                if id_resguardo:
-                    resguardo_images = get_image_paths('imagenes_resguardo', 'id_resguardo', id_resguardo)
-                    # Crear columnas individuales para cada imagen
-                    for i, image_path in enumerate(resguardo_images):
-                        row[f'imagen_resguardo_{i+1}'] = image_path
-                    # También guardar la lista completa para referencia
-                    row['imagenPath_resguardo'] = resguardo_images
-                else:
-                    row['imagenPath_resguardo'] = []
-
-            # Remover las columnas de ID temporales si no se solicitaron originalmente
-            for id_col in id_columns:
-                if id_col not in selected_columns:
-                    row.pop(id_col, None)
-
-        return data, max_bien_images, max_resguardo_images
-        
-    except mysql.connector.Error as err:
-        print(f"Database error: {err}")
-        return [], 0, 0
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        import traceback
-        traceback.print_exc()
-        return [], 0, 0
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
-
@@ -28,10 +28,8 @@ def permission_required(endpoint_name):
                 flash('Debes iniciar sesión para acceder a esta página.', 'danger')
                 return redirect(url_for('auth.login')) # Asegúrate que 'auth.login' sea tu ruta de login
             
-            # Construye los permisos del usuario
-            user_permissions = {permission.endpoint for role in current_user.roles for permission in role.permissions}
-            
-            if endpoint_name not in user_permissions:
+            # Permisos resueltos una vez por usuario (permisos_cache), sin consultas por petición
+            if not current_user.tiene_permiso(endpoint_name):
                 # --- LÓGICA AÑADIDA: Detectar si es una petición AJAX ---
                 # Si el cliente (fetch) prefiere una respuesta JSON...
                 if 'application/json' in request.accept_mimetypes:
@@ -0,0 +1,152 @@
+# derivatives.py
+"""
+Versiones reducidas (derivados) de las fotos subidas a UPLOAD_FOLDER.
+
+Al subir una foto se programan, en un hilo de fondo, dos tamaños en WebP y
+en JPEG:
+- 'thumb'  (320 px): listados, galerías y la exportación a Excel.
+- 'report' (1280 px): PDF de inventario y vistas de detalle.
+
+Se respeta la orientación EXIF (ImageOps.exif_transpose) y los derivados se
+guardan sin metadatos EXIF. Viven en UPLOAD_FOLDER/_derivados/<tamaño>/ con
+la misma ruta relativa que el original; /uploads/<ruta>?size=thumb elige el
+formato según el Accept del navegador. Si un derivado falta (fotos previas a
+este cambio) se genera al pedirlo por primera vez.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from config import UPLOAD_FOLDER, DERIVATIVE_WORKERS
+
+DERIVADOS_DIR = '_derivados'
+SIZES = {
+    'thumb': (320, 320),
+    'report': (1280, 1280),
+}
+FORMATOS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+EXTENSIONES_IMAGEN = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'}
+DIMENSIONES_CACHE_MAX = 8192   # Imágenes cuyas dimensiones se recuerdan
+
+_executor = ThreadPoolExecutor(max_workers=DERIVATIVE_WORKERS, thread_name_prefix='derivados')
+_en_curso = set()
+_lock = threading.Lock()
+_dimensiones = OrderedDict()
+
+
+def es_imagen(ruta):
+    return os.path.splitext(ruta)[1].lower() in EXTENSIONES_IMAGEN
+
+
+def ruta_derivado(rel_path, size, fmt, base_folder=None):
+    """Ruta absoluta del derivado `size` en formato `fmt` ('webp' o 'jpg') de `rel_path`."""
+    base = os.path.splitext(rel_path.replace('\\', '/').lstrip('/'))[0]
+    return os.path.join(base_folder or UPLOAD_FOLDER, DERIVADOS_DIR, size, f"{base}.{fmt}")
+
+
+def _guardar(img, destino, fmt):
+    formato, opciones = FORMATOS[fmt]
+    if formato == 'JPEG' and img.mode != 'RGB':
+        # JPEG no admite transparencia: se aplana sobre blanco
+        fondo = Image.new('RGB', img.size, (255, 255, 255))
+        fondo.paste(img, mask=img.getchannel('A') if 'A' in img.getbands() else None)
+        img = fondo
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    tmp = f"{destino}.{threading.get_ident()}.tmp"
+    img.save(tmp, formato, **opciones)  # Sin exif=: los metadatos no se copian
+    os.replace(tmp, destino)
+
+
+def generar_derivados(ruta_original, rel_path, base_folder=None):
+    """Crea todos los tamaños y formatos de una foto. Devuelve True si se generaron."""
+    if not es_imagen(ruta_original) or not os.path.exists(ruta_original):
+        return False
+    try:
+        with Image.open(ruta_original) as original:
+            original = ImageOps.exif_transpose(original)
+            if original.mode not in ('RGB', 'RGBA'):
+                original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+            for size, limite in SIZES.items():
+                img = original.copy()
+                img.thumbnail(limite, Image.LANCZOS)
+                for fmt in FORMATOS:
+                    _guardar(img, ruta_derivado(rel_path, size, fmt, base_folder), fmt)
+        return True
+    except Exception as e:
+        print(f"Error generando derivados de {rel_path}: {e}")
+        return False
+
+
+def _tarea(ruta_original, rel_path, base_folder):
+    try:
+        generar_derivados(ruta_original, rel_path, base_folder)
+    finally:
+        with _lock:
+            _en_curso.discard(rel_path)
+
+
+def programar_derivados(ruta_original, rel_path, base_folder=None):
+    """Encola la generación de derivados tras guardar una foto; no bloquea la petición."""
+    if not es_imagen(ruta_original):
+        return
+    with _lock:
+        if rel_path in _en_curso:
+            return
+        _en_curso.add(rel_path)
+    _executor.submit(_tarea, ruta_original, rel_path, base_folder)
+
+
+def obtener_derivado(rel_path, size, acepta_webp=False, base_folder=None):
+    """
+    Ruta absoluta del derivado más adecuado, generándolo si todavía no existe.
+    Devuelve None si `size` no es válido o el original no es una imagen; en ese
+    caso se debe usar el original.
+    """
+    if size not in SIZES or not es_imagen(rel_path):
+        return None
+    base = base_folder or UPLOAD_FOLDER
+    formatos = ['webp', 'jpg'] if acepta_webp else ['jpg']
+    for fmt in formatos:
+        ruta = ruta_derivado(rel_path, size, fmt, base)
+        if os.path.exists(ruta):
+            return ruta
+
+    original = os.path.join(base, rel_path)
+    if generar_derivados(original, rel_path, base):
+        ruta = ruta_derivado(rel_path, size, formatos[0], base)
+        return ruta if os.path.exists(ruta) else None
+    return None
+
+
+def dimensiones_imagen(ruta):
+    """
+    (ancho, alto) de una imagen leyendo sólo su encabezado; se recuerda por
+    (ruta, mtime, tamaño). Devuelve None si no es una imagen legible.
+    """
+    try:
+        st = os.stat(ruta)
+    except OSError:
+        return None
+    llave = (ruta, st.st_mtime_ns, st.st_size)
+    with _lock:
+        if llave in _dimensiones:
+            _dimensiones.move_to_end(llave)
+            return _dimensiones[llave]
+
+    try:
+        with Image.open(ruta) as img:  # Pillow no decodifica los píxeles hasta load()
+            dims = img.size
+    except Exception:
+        return None
+
+    with _lock:
+        _dimensiones[llave] = dims
+        while len(_dimensiones) > DIMENSIONES_CACHE_MAX:
+            _dimensiones.popitem(last=False)
+    return dims
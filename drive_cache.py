@@ -0,0 +1,324 @@
+# drive_cache.py
+"""
+Cache en disco de los archivos descargados de Google Drive.
+
+Cada archivo se guarda como `<file_id>.cache` con un sidecar `<file_id>.json`
+que registra mimetype, etag (md5 del contenido, el mismo valor que Drive
+reporta como md5Checksum), tamaño y la última vez que se validó contra Drive.
+
+- Presupuesto en bytes con desalojo LRU (el orden de uso se conserva entre
+  reinicios a través del mtime del archivo de datos).
+- El presupuesto es del directorio, no de cada proceso: con varios workers
+  cada uno lleva su índice en memoria, pero antes de guardar vuelve a leer
+  el directorio si pasaron REESCANEO_SEGUNDOS, adopta los archivos que
+  escribieron los demás y desaloja por mtime sobre el total. Entre dos
+  reescaneos el disco puede excederse, a lo más, en lo que guardaron los
+  otros procesos en ese lapso.
+- Una entrada vencida no se vuelve a descargar a ciegas: se compara su etag
+  con el md5Checksum de Drive (una llamada de metadatos pequeña) y sólo se
+  descarga si cambió. Si Drive no responde se sirve la copia guardada.
+- El mimetype se detecta del contenido, sin pedir metadatos en cada fallo.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+from config import IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_REVALIDATE_SECONDS
+
+_ID_VALIDO = re.compile(r'^[A-Za-z0-9_-]{1,200}$')
+REESCANEO_SEGUNDOS = 60   # Cada cuánto se relee el directorio compartido antes de guardar
+
+# Firmas de archivo para los tipos que no reconoce Pillow
+_FIRMAS = [
+    (b'%PDF', 'application/pdf'),
+    (b'PK\x03\x04', 'application/zip'),
+]
+
+
+def sniff_mimetype(content, default='application/octet-stream'):
+    """Detecta el mimetype a partir de los primeros bytes del contenido."""
+    if not content:
+        return default
+    for firma, mimetype in _FIRMAS:
+        if content.startswith(firma):
+            return mimetype
+    try:
+        with Image.open(io.BytesIO(content)) as img:
+            return Image.MIME.get(img.format, default)
+    except Exception:
+        return default
+
+
+class DiskImageCache:
+    """Cache LRU en disco con límite de bytes y metadatos por entrada."""
+
+    def __init__(self, directory, max_bytes, revalidate_after):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()   # file_id -> metadatos, del menos al más usado
+        self._bytes = 0
+        self._escaneado = 0.0
+        self._stats = {'hits': 0, 'misses': 0, 'desalojos': 0, 'revalidaciones': 0,
+                       'revalidaciones_sin_cambio': 0, 'errores': 0}
+        os.makedirs(directory, exist_ok=True)
+        self._cargar_indice()
+
+    # --- Rutas ---
+
+    def _ruta_datos(self, file_id):
+        return os.path.join(self.directory, f"{file_id}.cache")
+
+    def _ruta_meta(self, file_id):
+        return os.path.join(self.directory, f"{file_id}.json")
+
+    # --- Índice en memoria ---
+
+    def _leer_entrada(self, file_id):
+        """(mtime, metadatos) de un .cache en disco, o None si no existe."""
+        try:
+            st = os.stat(self._ruta_datos(file_id))
+        except OSError:
+            return None
+        meta = {'size': st.st_size, 'mimetype': None, 'etag': None, 'validado': 0}
+        try:
+            with open(self._ruta_meta(file_id), 'r', encoding='utf-8') as f:
+                meta.update(json.load(f))
+            meta['size'] = st.st_size
+        except (OSError, ValueError):
+            pass  # Entrada antigua o sin sidecar: etag y mimetype se calculan en el primer uso
+        return st.st_mtime, meta
+
+    def _escanear(self):
+        """Índice ordenado por mtime (del menos al más usado) de todos los .cache del directorio."""
+        encontrados = []
+        for nombre in os.listdir(self.directory):
+            if not nombre.endswith('.cache'):
+                continue
+            file_id = nombre[:-len('.cache')]
+            entrada = self._leer_entrada(file_id)
+            if entrada:
+                encontrados.append((entrada[0], file_id, entrada[1]))
+        entradas = OrderedDict()
+        for _, file_id, meta in sorted(encontrados, key=lambda e: e[0]):
+            entradas[file_id] = meta
+        return entradas
+
+    def _cargar_indice(self):
+        """Reconstruye el índice desde el disco, incluidos los archivos de otros procesos."""
+        entradas = self._escanear()   # Fuera del lock: listdir/stat de todo el directorio
+        with self._lock:
+            self._entradas = entradas
+            self._bytes = sum(meta['size'] for meta in entradas.values())
+            self._escaneado = time.monotonic()
+            self._desalojar()
+
+    def _desalojar(self):
+        """Elimina las entradas menos usadas hasta quedar dentro del presupuesto."""
+        while self._bytes > self.max_bytes and self._entradas:
+            file_id, meta = self._entradas.popitem(last=False)
+            self._bytes -= meta['size']
+            self._stats['desalojos'] += 1
+            for ruta in (self._ruta_datos(file_id), self._ruta_meta(file_id)):
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+
+    def _escribir_meta(self, file_id, meta):
+        tmp = f"{self._ruta_meta(file_id)}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._ruta_meta(file_id))
+
+    def _quitar(self, file_id):
+        meta = self._entradas.pop(file_id, None)
+        if meta:
+            self._bytes -= meta['size']
+        for ruta in (self._ruta_datos(file_id), self._ruta_meta(file_id)):
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+    # --- API ---
+
+    def get(self, file_id):
+        """
+        Devuelve (contenido, metadatos, vigente) o None si no está en cache.
+        `vigente` es False cuando la entrada debe revalidarse contra Drive.
+        """
+        if not _ID_VALIDO.match(file_id or ''):
+            return None
+        with self._lock:
+            meta = self._entradas.get(file_id)
+            if meta is not None:
+                self._entradas.move_to_end(file_id)
+                meta = dict(meta)
+        if meta is None:
+            # Puede haberlo guardado otro proceso: se adopta en vez de descargarlo otra vez
+            entrada = self._leer_entrada(file_id)
+            with self._lock:
+                if entrada is None:
+                    self._stats['misses'] += 1
+                    return None
+                meta = entrada[1]
+                if file_id not in self._entradas:
+                    self._entradas[file_id] = meta
+                    self._bytes += meta['size']
+                meta = dict(meta)
+
+        ruta = self._ruta_datos(file_id)
+        try:
+            with open(ruta, 'rb') as f:
+                content = f.read()
+            os.utime(ruta, None)  # Conserva el orden LRU entre reinicios
+        except OSError as e:
+            print(f"Error leyendo cache {file_id}: {e}")
+            with self._lock:
+                self._quitar(file_id)
+                self._stats['errores'] += 1
+                self._stats['misses'] += 1
+            return None
+
+        if not meta.get('etag') or not meta.get('mimetype'):
+            # Entrada heredada del formato anterior: completar su sidecar
+            meta['etag'] = hashlib.md5(content).hexdigest()
+            meta['mimetype'] = sniff_mimetype(content)
+            with self._lock:
+                if file_id in self._entradas:
+                    self._entradas[file_id].update(meta)
+            try:
+                self._escribir_meta(file_id, meta)
+            except OSError:
+                pass
+
+        with self._lock:
+            self._stats['hits'] += 1
+        vigente = time.time() - meta.get('validado', 0) < self.revalidate_after
+        return content, meta, vigente
+
+    def peek(self, file_id):
+        """Metadatos de una entrada vigente sin leer su contenido (para responder 304)."""
+        with self._lock:
+            meta = self._entradas.get(file_id)
+            if not meta or not meta.get('etag'):
+                return None
+            if time.time() - meta.get('validado', 0) >= self.revalidate_after:
+                return None
+            self._entradas.move_to_end(file_id)
+            self._stats['hits'] += 1
+            meta = dict(meta)
+        try:
+            os.utime(self._ruta_datos(file_id), None)  # El reescaneo ordena por mtime
+        except OSError:
+            pass
+        return meta
+
+    def put(self, file_id, content, mimetype=None):
+        """Guarda el contenido y su sidecar; devuelve los metadatos aunque no haya cabido en cache."""
+        if content is None:
+            return None
+        meta = {
+            'size': len(content),
+            'mimetype': mimetype or sniff_mimetype(content),
+            'etag': hashlib.md5(content).hexdigest(),
+            'validado': time.time(),
+        }
+        if not _ID_VALIDO.match(file_id or '') or meta['size'] > self.max_bytes:
+            return meta  # Id no apto como nombre de archivo o no cabe: se sirve sin guardar
+
+        ruta = self._ruta_datos(file_id)
+        try:
+            tmp = f"{ruta}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(content)
+            os.replace(tmp, ruta)
+            self._escribir_meta(file_id, meta)
+        except OSError as e:
+            print(f"Error guardando en cache {file_id}: {e}")
+            with self._lock:
+                self._stats['errores'] += 1
+            return meta
+
+        if time.monotonic() - self._escaneado >= REESCANEO_SEGUNDOS:
+            self._cargar_indice()   # Aplica el presupuesto sobre lo que escribieron todos los procesos
+
+        with self._lock:
+            anterior = self._entradas.pop(file_id, None)
+            if anterior:
+                self._bytes -= anterior['size']
+            self._entradas[file_id] = meta
+            self._bytes += meta['size']
+            self._desalojar()
+        return meta
+
+    def marcar_validado(self, file_id):
+        """Registra que la copia guardada sigue igual a la de Drive."""
+        with self._lock:
+            meta = self._entradas.get(file_id)
+            if meta is None:
+                return
+            meta['validado'] = time.time()
+            meta = dict(meta)
+            self._stats['revalidaciones'] += 1
+            self._stats['revalidaciones_sin_cambio'] += 1
+        try:
+            self._escribir_meta(file_id, meta)
+        except OSError:
+            pass
+
+    def registrar_revalidacion(self):
+        with self._lock:
+            self._stats['revalidaciones'] += 1
+
+    def stats(self):
+        with self._lock:
+            datos = dict(self._stats)
+            datos['entradas'] = len(self._entradas)
+            datos['bytes'] = self._bytes
+            datos['max_bytes'] = self.max_bytes
+        consultas = datos['hits'] + datos['misses']
+        datos['tasa_aciertos'] = round(datos['hits'] / consultas, 3) if consultas else None
+        return datos
+
+
+image_cache = DiskImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_REVALIDATE_SECONDS)
+
+
+def fetch_drive_file(drive_service, file_id):
+    """
+    Devuelve (contenido, metadatos) de un archivo de Drive pasando por la cache,
+    o (None, None) si no se pudo obtener. Los metadatos incluyen 'mimetype' y 'etag'.
+    """
+    cached = image_cache.get(file_id)
+    if cached:
+        content, meta, vigente = cached
+        if vigente or not drive_service:
+            return content, meta
+        # Revalidación condicional: sólo se descarga si el md5 cambió en Drive
+        try:
+            remoto = drive_service.get_md5_checksum(file_id)
+        except Exception as e:
+            print(f"No se pudo revalidar {file_id}, se sirve la copia en cache: {e}")
+            return content, meta
+        if remoto and remoto == meta['etag']:
+            image_cache.marcar_validado(file_id)
+            return content, meta
+        image_cache.registrar_revalidacion()
+
+    if not drive_service:
+        return None, None
+    content = drive_service.download_file(file_id)
+    if not content:
+        return None, None
+    meta = image_cache.put(file_id, content)
+    return content, meta
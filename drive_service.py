@@ -13,6 +13,8 @@ from google.auth.transport.requests import Request
 from googleapiclient.errors import HttpError
 from flask import Response
 from google.oauth2 import service_account
+from config import IMAGE_CACHE_DIR
+from drive_cache import image_cache, fetch_drive_file
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -40,9 +42,7 @@ TEMP_UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads_temp')
 if not os.path.exists(TEMP_UPLOAD_FOLDER):
     os.makedirs(TEMP_UPLOAD_FOLDER)
 
-CACHE_DIR = os.path.join(os.path.dirname(__file__), 'image_cache')
-if not os.path.exists(CACHE_DIR):
-    os.makedirs(CACHE_DIR)
+CACHE_DIR = IMAGE_CACHE_DIR
 
 class DriveImageService:
     def __init__(self, client_secret, token_file):
@@ -195,6 +195,17 @@ class DriveImageService:
             print(f"Error al obtener metadata {file_id}: {e}")
             raise e
 
+    def get_md5_checksum(self, file_id):
+        """md5Checksum actual del archivo en Drive (para revalidar la cache sin descargarlo)."""
+        if not self.service:
+            raise Exception("Servicio de Drive no inicializado")
+        file_metadata = self._execute_with_retry(
+            self.service.files().get,
+            fileId=file_id,
+            fields='md5Checksum'
+        )
+        return file_metadata.get('md5Checksum')
+
     def download_file(self, file_id):
         """
         Método mejorado para descargar archivos usando MediaIoBaseDownload
@@ -252,28 +263,16 @@ except Exception as e:
     print(f"❌ Error crítico al inicializar Drive Service: {e}")
     drive_service = None
 
-# --- Funciones de Caché (mejoradas) ---
+# --- Funciones de Caché (envoltorios de drive_cache.image_cache) ---
 def get_cached_image(file_id):
-    cache_file = os.path.join(CACHE_DIR, f"{file_id}.cache")
-    if os.path.exists(cache_file):
-        if time.time() - os.path.getmtime(cache_file) < 3600:
-            try:
-                with open(cache_file, 'rb') as f:
-                    return f.read()
-            except Exception as e:
-                print(f"Error leyendo cache: {e}")
-                os.remove(cache_file)
+    """Contenido guardado en cache o None; una entrada vencida se trata como ausente."""
+    cached = image_cache.get(file_id)
+    if cached and cached[2]:
+        return cached[0]
     return None
 
 def save_to_cache(file_id, content):
-    try:
-        cache_file = os.path.join(CACHE_DIR, f"{file_id}.cache")
-        with open(cache_file, 'wb') as f:
-            f.write(content)
-        return True
-    except Exception as e:
-        print(f"Error guardando en cache: {e}")
-        return False
+    return image_cache.put(file_id, content) is not None
 
 def serve_drive_image(file_id):
     """
@@ -282,23 +281,11 @@ def serve_drive_image(file_id):
     if not drive_service or not drive_service.service:
         return serve_default_image()
     
-    # Verificar caché primero
-    cached_content = get_cached_image(file_id)
-    if cached_content:
-        return Response(cached_content, mimetype='image/jpeg')
-    
     try:
-        print(f"Descargando imagen {file_id} desde Drive...")
-        
-        # Usar el método de descarga mejorado
-        file_content = drive_service.download_file(file_id)
-        
+        file_content, meta = fetch_drive_file(drive_service, file_id)
         if file_content:
-            # Guardar en caché
-            save_to_cache(file_id, file_content)
-            return Response(file_content, mimetype='image/jpeg')
-        else:
-            return serve_default_image()
+            return Response(file_content, mimetype=meta['mimetype'])
+        return serve_default_image()
             
     except Exception as e:
         print(f"Error al servir archivo {file_id} desde Drive: {e}")
@@ -0,0 +1,139 @@
+# excel_export.py
+"""
+Escritura de Excel en streaming para las exportaciones de plantillas.
+
+- Las filas llegan de un iterable (cursor del lado del servidor) y se
+  escriben con XlsxWriter en modo `constant_memory`: cada fila se vuelca a un
+  archivo temporal en cuanto se pasa a la siguiente, así la memoria no crece
+  con el número de registros.
+- Las fotos se incrustan desde la miniatura JPEG en disco (XlsxWriter la lee
+  al cerrar el libro); la escala se calcula con las dimensiones recordadas de
+  la miniatura, sin abrir la imagen dos veces por celda.
+"""
+import os
+import urllib.parse
+
+import xlsxwriter
+
+from derivatives import obtener_derivado, dimensiones_imagen
+
+IMAGEN_ANCHO_MAX = 180   # px disponibles en una celda de imagen (ancho 25)
+IMAGEN_ALTO_MAX = 150
+ALTO_FILA_IMAGEN = 120
+COLUMNAS_IMAGEN = ('imagenPath_bien', 'imagenPath_resguardo')
+
+
+def _ruta_relativa(valor):
+    """Acepta rutas relativas o URLs /uploads/<ruta> y devuelve la ruta relativa."""
+    url_str = str(valor)
+    if '/uploads/' in url_str:
+        relative_path = url_str.split('/uploads/')[-1]
+    else:
+        relative_path = url_str.lstrip('/')
+    return urllib.parse.unquote(relative_path.split('?')[0])
+
+
+def _encabezado(column_name):
+    if column_name.startswith('imagen_bien_'):
+        return f'Img Bien {column_name.split("_")[2]}'
+    if column_name.startswith('imagen_resguardo_'):
+        return f'Img Resguardo {column_name.split("_")[2]}'
+    return column_name.replace('_', ' ').title()
+
+
+def escribir_excel_plantilla(ruta, nombre_hoja, selected_columns, filas, max_bien_images,
+                             max_resguardo_images, base_folder, progreso=None):
+    """
+    Escribe `filas` (iterable de dicts, ver iter_filtered_resguardo_rows) en
+    `ruta`. `progreso(n)` se llama tras cada fila. Devuelve las filas escritas.
+    """
+    workbook = xlsxwriter.Workbook(ruta, {
+        'constant_memory': True,
+        'tmpdir': os.path.dirname(ruta),
+    })
+    try:
+        worksheet = workbook.add_worksheet(nombre_hoja)
+
+        # Formatos
+        header_format = workbook.add_format({'bg_color': '#4A90E2', 'font_color': 'white', 'bold': True, 'align': 'center', 'valign': 'vcenter', 'border': 1})
+        data_format = workbook.add_format({'align': 'center', 'valign': 'vcenter', 'border': 1, 'text_wrap': True})
+        image_cell_format = workbook.add_format({'align': 'center', 'valign': 'top', 'border': 1})
+
+        # Orden de columnas: primero las de datos, luego una por imagen
+        columnas = [col for col in selected_columns if col not in COLUMNAS_IMAGEN]
+        columnas += [f'imagen_bien_{i+1}' for i in range(max_bien_images)]
+        columnas += [f'imagen_resguardo_{i+1}' for i in range(max_resguardo_images)]
+
+        # En constant_memory los anchos y encabezados van antes de las filas
+        for col_num, col_name in enumerate(columnas):
+            worksheet.set_column(col_num, col_num, 25 if col_name.startswith('imagen_') else 20)
+        worksheet.set_default_row(30)  # Altura por defecto para filas de texto
+        for col_num, col_name in enumerate(columnas):
+            worksheet.write(0, col_num, _encabezado(col_name), header_format)
+
+        escritas = 0
+        for row_data in filas:
+            escritas += 1
+            excel_row = escritas
+
+            imagenes = {}
+            for i, path in enumerate(row_data.get('imagenPath_bien') or []):
+                if i < max_bien_images:
+                    imagenes[f'imagen_bien_{i+1}'] = path
+            for i, path in enumerate(row_data.get('imagenPath_resguardo') or []):
+                if i < max_resguardo_images:
+                    imagenes[f'imagen_resguardo_{i+1}'] = path
+
+            # set_row debe ir antes de escribir cualquier celda de la fila
+            if imagenes:
+                worksheet.set_row(excel_row, ALTO_FILA_IMAGEN)
+
+            for col_num, col_name in enumerate(columnas):
+                if not col_name.startswith('imagen_'):
+                    worksheet.write(excel_row, col_num, row_data.get(col_name, ''), data_format)
+                    continue
+
+                value = imagenes.get(col_name)
+                if not value:
+                    worksheet.write(excel_row, col_num, 'Sin imagen', data_format)
+                    continue
+
+                try:
+                    relative_path = _ruta_relativa(value)
+                    # Excel no soporta incrustar PDF
+                    if os.path.splitext(relative_path)[1].lower() == '.pdf':
+                        worksheet.write(excel_row, col_num, 'Archivo PDF (No visualizable)', data_format)
+                        continue
+
+                    # Miniatura JPEG (XlsxWriter no admite WebP); si no se puede, el original
+                    full_path = (obtener_derivado(relative_path, 'thumb', base_folder=base_folder)
+                                 or os.path.join(base_folder, relative_path))
+                    if not os.path.exists(full_path):
+                        print(f"EXCEL DEBUG: No encontrado -> {full_path}")
+                        worksheet.write(excel_row, col_num, 'Archivo no encontrado', data_format)
+                        continue
+
+                    dims = dimensiones_imagen(full_path)
+                    if not dims or not dims[0] or not dims[1]:
+                        worksheet.write(excel_row, col_num, 'Formato img inválido', data_format)
+                        continue
+
+                    # Mantener proporción y no agrandar
+                    scale = min(IMAGEN_ANCHO_MAX / dims[0], IMAGEN_ALTO_MAX / dims[1], 1.0)
+                    worksheet.write_blank(excel_row, col_num, None, image_cell_format)
+                    worksheet.insert_image(excel_row, col_num, full_path, {
+                        'x_scale': scale,
+                        'y_scale': scale,
+                        'x_offset': 5,
+                        'y_offset': 5,
+                        'object_position': 1,  # Mover y cambiar tamaño con celdas
+                    })
+                except Exception as e:
+                    print(f"EXCEL ERROR en fila {excel_row}: {e}")
+                    worksheet.write(excel_row, col_num, 'Error al procesar', data_format)
+
+            if progreso:
+                progreso(escritas)
+    finally:
+        workbook.close()
+    return escritas
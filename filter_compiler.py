@@ -0,0 +1,274 @@
+# filter_compiler.py
+"""
+Compilador de los filtros de plantillas (árbol JSON de grupos y reglas) a SQL.
+
+Antes de generar el WHERE el árbol se normaliza y simplifica:
+- Se aplanan los grupos anidados con la misma condición (AND dentro de AND)
+  y los grupos de un solo elemento.
+- Se eliminan reglas repetidas y tautologías (contiene/inicia con vacío).
+- Varias igualdades sobre el mismo campo en un OR se unen en un IN. En un AND
+  sólo se conserva la más restrictiva cuando sus valores (sin distinguir
+  mayúsculas) están en todas las demás; si no, la conjunción queda para
+  MySQL, cuya collation y conversión numérica deciden ('Dell' = 'DELL',
+  100 = '100.00'). Nunca se declara una contradicción.
+- `>=` y `<=` sobre el mismo campo en un AND se vuelven BETWEEN.
+
+Operadores: ==, !=, >, <, >=, <=, contains, starts_with (LIKE 'x%', puede
+usar índice), in y between ("desde,hasta"). Las reglas inválidas se ignoran,
+igual que antes. Los comodines de LIKE (% y _) del valor se escapan.
+
+El SQL compilado se memoriza por (id de plantilla, filtros).
+"""
+import json
+import threading
+from collections import OrderedDict
+
+OPERADORES_COMPARACION = {'==': '=', '!=': '!=', '>': '>', '<': '<', '>=': '>=', '<=': '<='}
+MEMO_MAX = 256
+
+
+class _Constante:
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def __repr__(self):
+        return self.nombre
+
+
+VERDADERO = _Constante('VERDADERO')   # No restringe (se omite del WHERE)
+FALSO = _Constante('FALSO')           # Ninguna fila cumple
+IGNORAR = _Constante('IGNORAR')       # Regla inválida o incompleta
+
+
+def _escapar_like(valor):
+    return valor.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _lista(valor):
+    if isinstance(valor, (list, tuple)):
+        return [str(v).strip() for v in valor if str(v).strip()]
+    return [v.strip() for v in str(valor or '').split(',') if v.strip()]
+
+
+class FilterCompiler:
+    """Normaliza y compila árboles de filtros sobre un mapa {campo: 'tabla.columna'}."""
+
+    def __init__(self, columnas, memo_max=MEMO_MAX):
+        self.columnas = columnas
+        self.memo_max = memo_max
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- Normalización ---
+    # Reglas: ('regla', campo, operador, valor); grupos: ('grupo', 'AND'|'OR', (hijos...))
+
+    def _regla(self, rule):
+        field = rule.get('field')
+        operator = rule.get('operator')
+        value = rule.get('value')
+        if not field or not self.columnas.get(field):
+            return IGNORAR
+        texto = '' if value is None else str(value).strip()
+
+        if operator in OPERADORES_COMPARACION:
+            # Números y booleanos del JSON se envían tal cual, como antes
+            if value is None or isinstance(value, (bool, int, float)):
+                return ('regla', field, operator, value)
+            return ('regla', field, operator, texto)
+        if operator in ('contains', 'starts_with'):
+            # LIKE '%%' no filtra nada (salvo NULL): se trata como tautología
+            return ('regla', field, operator, texto) if texto else VERDADERO
+        if operator == 'in':
+            valores = tuple(dict.fromkeys(_lista(value)))
+            if not valores:
+                return IGNORAR
+            return ('regla', field, '==', valores[0]) if len(valores) == 1 else ('regla', field, 'in', valores)
+        if operator == 'between':
+            limites = (_lista(value) + ['', ''])[:2]
+            desde, hasta = limites
+            if desde and hasta:
+                return ('regla', field, 'between', (desde, hasta))
+            if desde:
+                return ('regla', field, '>=', desde)
+            if hasta:
+                return ('regla', field, '<=', hasta)
+        return IGNORAR
+
+    def _nodo(self, data):
+        if not isinstance(data, dict):
+            return IGNORAR
+        if 'condition' in data or 'rules' in data:
+            condicion = 'OR' if str(data.get('condition', 'AND')).upper() == 'OR' else 'AND'
+            return self._grupo(condicion, [self._nodo(r) for r in data.get('rules') or []])
+        return self._regla(data)
+
+    @staticmethod
+    def _valores_igualdad(regla):
+        if regla[2] == '==':
+            return (regla[3],)
+        if regla[2] == 'in':
+            return regla[3]
+        return None
+
+    @staticmethod
+    def _mas_restrictiva(conjuntos):
+        """
+        AND de igualdades sobre un campo: el conjunto de valores contenido
+        (sin distinguir mayúsculas) en todos los demás, que equivale a la
+        conjunción con una collation _ci. None si no hay uno así.
+        """
+        def llave(v):
+            return v.casefold() if isinstance(v, str) else v
+
+        llaves = [{llave(v) for v in c} for c in conjuntos]
+        for i in sorted(range(len(conjuntos)), key=lambda i: len(llaves[i])):
+            if all(llaves[i] <= otras for otras in llaves):
+                return conjuntos[i]
+        return None
+
+    def _unir_igualdades(self, condicion, hijos):
+        """OR: igualdades/IN del mismo campo -> un IN. AND: la más restrictiva, si es segura."""
+        por_campo = OrderedDict()
+        resto = []
+        for h in hijos:
+            if isinstance(h, tuple) and h[0] == 'regla' and self._valores_igualdad(h) is not None:
+                por_campo.setdefault(h[1], []).append(self._valores_igualdad(h))
+            else:
+                resto.append(h)
+
+        unidos = []
+        for campo, conjuntos in por_campo.items():
+            if condicion == 'OR':
+                valores = tuple(dict.fromkeys(v for c in conjuntos for v in c))
+            else:
+                valores = self._mas_restrictiva(conjuntos)
+                if valores is None:
+                    # No se puede decidir aquí: cada igualdad queda como estaba
+                    unidos.extend(('regla', campo, '==', c[0]) if len(c) == 1 else ('regla', campo, 'in', c)
+                                  for c in conjuntos)
+                    continue
+            unidos.append(('regla', campo, '==', valores[0]) if len(valores) == 1 else ('regla', campo, 'in', valores))
+        return unidos + resto
+
+    @staticmethod
+    def _unir_rangos(hijos):
+        """AND: un `>=` y un `<=` sobre el mismo campo -> BETWEEN (aprovecha índices de rango)."""
+        minimos, maximos = {}, {}
+        for h in hijos:
+            if isinstance(h, tuple) and h[0] == 'regla':
+                if h[2] == '>=':
+                    minimos.setdefault(h[1], []).append(h)
+                elif h[2] == '<=':
+                    maximos.setdefault(h[1], []).append(h)
+
+        resultado = []
+        usados = set()
+        for h in hijos:
+            if h in usados:
+                continue
+            if isinstance(h, tuple) and h[0] == 'regla' and h[2] in ('>=', '<='):
+                campo = h[1]
+                if len(minimos.get(campo, [])) == 1 and len(maximos.get(campo, [])) == 1:
+                    minimo, maximo = minimos[campo][0], maximos[campo][0]
+                    usados.update((minimo, maximo))
+                    resultado.append(('regla', campo, 'between', (minimo[3], maximo[3])))
+                    continue
+            resultado.append(h)
+        return resultado
+
+    def _grupo(self, condicion, hijos):
+        hijos = [h for h in hijos if h is not IGNORAR]
+        if not hijos:
+            return IGNORAR
+
+        # Aplanar grupos con la misma condición
+        planos = []
+        for h in hijos:
+            if isinstance(h, tuple) and h[0] == 'grupo' and h[1] == condicion:
+                planos.extend(h[2])
+            else:
+                planos.append(h)
+
+        # Constantes: VERDADERO es neutro en AND y absorbente en OR (FALSO al revés)
+        neutro, absorbente = (VERDADERO, FALSO) if condicion == 'AND' else (FALSO, VERDADERO)
+        if any(h is absorbente for h in planos):
+            return absorbente
+        planos = list(dict.fromkeys(h for h in planos if h is not neutro))  # Sin repetidos
+
+        planos = self._unir_igualdades(condicion, planos)
+        if FALSO in planos:
+            return FALSO
+        if condicion == 'AND':
+            planos = self._unir_rangos(planos)
+
+        if not planos:
+            return neutro
+        if len(planos) == 1:
+            return planos[0]
+        return ('grupo', condicion, tuple(planos))
+
+    def normalizar(self, filtros):
+        """Árbol simplificado (forma interna) o una de las constantes."""
+        return self._nodo(filtros) if filtros else IGNORAR
+
+    # --- Generación de SQL ---
+
+    def _sql(self, nodo, params, raiz=False):
+        if nodo is FALSO:
+            return "1 = 0"
+        if nodo is VERDADERO:
+            return "1 = 1"
+        if nodo[0] == 'grupo':
+            sql = f" {nodo[1]} ".join(self._sql(h, params) for h in nodo[2])
+            return sql if raiz else f"({sql})"
+
+        _, campo, operador, valor = nodo
+        columna = self.columnas[campo]
+        if operador in OPERADORES_COMPARACION:
+            params.append(valor)
+            return f"{columna} {OPERADORES_COMPARACION[operador]} %s"
+        if operador == 'contains':
+            params.append(f"%{_escapar_like(valor)}%")
+            return f"{columna} LIKE %s"
+        if operador == 'starts_with':
+            params.append(f"{_escapar_like(valor)}%")
+            return f"{columna} LIKE %s"
+        if operador == 'in':
+            params.extend(valor)
+            return f"{columna} IN ({', '.join(['%s'] * len(valor))})"
+        if operador == 'between':
+            params.extend(valor)
+            return f"{columna} BETWEEN %s AND %s"
+        raise ValueError(f"Operador no soportado: {operador}")
+
+    def compilar(self, filtros, template_id=None):
+        """Devuelve (where_sql, params); where_sql vacío si no hay filtro."""
+        llave = (template_id, json.dumps(filtros or {}, sort_keys=True, default=str))
+        with self._lock:
+            if llave in self._memo:
+                self._memo.move_to_end(llave)
+                sql, params = self._memo[llave]
+                return sql, list(params)
+
+        nodo = self.normalizar(filtros)
+        params = []
+        sql = "" if nodo in (IGNORAR, VERDADERO) else self._sql(nodo, params, raiz=True)
+
+        with self._lock:
+            self._memo[llave] = (sql, tuple(params))
+            while len(self._memo) > self.memo_max:
+                self._memo.popitem(last=False)
+        return sql, params
+
+    def a_json(self, nodo):
+        """Árbol normalizado en el mismo formato que guarda el editor de plantillas."""
+        if nodo is IGNORAR or nodo is VERDADERO:
+            return {}
+        if nodo is FALSO:
+            return {'falso': True}
+        if nodo[0] == 'grupo':
+            return {'condition': nodo[1], 'rules': [self.a_json(h) for h in nodo[2]]}
+        _, campo, operador, valor = nodo
+        if isinstance(valor, tuple):
+            valor = ','.join(valor)
+        return {'field': campo, 'operator': operador, 'value': valor}
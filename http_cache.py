@@ -0,0 +1,74 @@
+# http_cache.py
+"""
+Política de cache HTTP para /images (Drive) y /uploads (archivos locales).
+
+- ETag fuerte: md5 del contenido. Para Drive es el mismo etag que guarda
+  drive_cache; para archivos locales se calcula una vez y se recuerda por
+  (ruta, mtime, tamaño), así no se vuelve a leer el archivo en cada petición.
+- Cache-Control `private` (las rutas requieren sesión) con max-age largo;
+  los archivos subidos llevan nombre único, por eso se marcan `immutable`.
+  Si se pidió ?size= y no se pudo generar el derivado se sirve el original
+  con un max-age corto y sin `immutable`, para no fijarlo bajo esa URL.
+- If-None-Match / If-Modified-Since -> 304 y peticiones Range las resuelve
+  werkzeug (make_conditional / send_file(conditional=True)).
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from config import UPLOADS_HTTP_MAX_AGE, DRIVE_IMAGES_HTTP_MAX_AGE
+
+ETAG_CACHE_MAX = 4096   # Archivos locales cuyo hash se recuerda
+RESPALDO_MAX_AGE = 300  # Original servido en lugar de un derivado que falló
+
+_etags = OrderedDict()
+_etags_lock = threading.Lock()
+
+
+def etag_archivo(ruta):
+    """md5 del archivo, recordado mientras no cambien su mtime ni su tamaño."""
+    st = os.stat(ruta)
+    llave = (ruta, st.st_mtime_ns, st.st_size)
+    with _etags_lock:
+        etag = _etags.get(llave)
+        if etag is not None:
+            _etags.move_to_end(llave)
+            return etag
+
+    md5 = hashlib.md5()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(bloque)
+    etag = md5.hexdigest()
+
+    with _etags_lock:
+        _etags[llave] = etag
+        while len(_etags) > ETAG_CACHE_MAX:
+            _etags.popitem(last=False)
+    return etag
+
+
+def aplicar_cache_archivo_subido(response, respaldo=False):
+    """
+    Archivos de UPLOAD_FOLDER: nombre único, contenido inmutable.
+    `respaldo=True` cuando se pidió un derivado y se entrega el original:
+    el navegador debe volver a pedirlo pronto, cuando el derivado exista.
+    """
+    response.cache_control.private = True
+    response.cache_control.public = False
+    if respaldo:
+        response.cache_control.max_age = RESPALDO_MAX_AGE
+        response.cache_control.immutable = False
+    else:
+        response.cache_control.max_age = UPLOADS_HTTP_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def aplicar_cache_drive(response, etag):
+    """Imágenes de Drive: ETag del contenido y revalidación tras DRIVE_IMAGES_HTTP_MAX_AGE."""
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = DRIVE_IMAGES_HTTP_MAX_AGE
+    return response
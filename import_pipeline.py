@@ -0,0 +1,463 @@
+# import_pipeline.py
+"""
+Pipeline de importación masiva de resguardos desde Excel.
+
+La hoja se lee por bloques con openpyxl en modo read_only (no se carga el
+libro completo), cada columna se convierte de forma vectorizada con pandas y
+las escrituras se hacen con executemany. Cada bloque se confirma por separado,
+así un archivo de 20k filas no mantiene abierta una sola transacción.
+"""
+import traceback
+from decimal import Decimal, InvalidOperation
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from config import COLUMN_MAPPING, BIENES_COLUMNS, RESGUARDOS_COLUMNS, EXCEL_AREA_COL_NAME
+from search import normalizar
+import area_stats
+
+CHUNK_SIZE = 1000       # Filas de Excel por bloque (una transacción por bloque)
+IN_CHUNK_SIZE = 500     # Valores máximos por cada IN (...) de las búsquedas masivas
+
+# --- Definición de Tipos de Columna ---
+# IMPORTANTE: Estos son los nombres de las columnas de la BASE DE DATOS
+# (los 'values' de tu COLUMN_MAPPING)
+
+# Columnas que se convertirán a FECHA (formato YYYY-MM-DD)
+DATE_COLS = [
+    "Fecha_Poliza",
+    "Fecha_Factura",
+    "Fecha_Documento_Propiedad",
+    "Fecha_Adquisicion_Alta",
+    "Fecha_Resguardo"
+]
+
+# Columnas que se convertirán a NÚMERO DECIMAL (para dinero)
+DECIMAL_COLS = [
+    "Costo_Inicial",
+    "Depreciacion_Acumulada",
+    "Costo_Final",
+    "Valor_En_Libros"
+]
+
+# Columnas que se convertirán a NÚMERO ENTERO
+INT_COLS = [
+    "Cantidad",
+    "Tipo_De_Resguardo",
+    "No_Nomina_Trabajador"
+]
+
+# Valores por defecto de los campos obligatorios del modelo Bienes
+BIEN_DEFAULTS = {
+    'Clasificacion_Legal': 'Dominio Privado',
+    'Activo': 1,
+}
+
+
+def convert_to_db_type(db_col, value):
+    """
+    Limpia y convierte un valor de Excel al tipo de dato correcto
+    para la base de datos (como string, Decimal, int, o None).
+
+    :param db_col: El nombre de la columna (del encabezado de Excel).
+    :param value: El valor de la celda.
+    :return: El valor limpio y tipado.
+    """
+
+    # 1. FILTRO UNIVERSAL DE NULOS
+    if pd.isna(value) or value is None or str(value).strip() == '':
+        return None
+
+    str_value = str(value).strip()
+
+    # 2. FILTRO DE FECHAS
+    if db_col in DATE_COLS:
+
+        # Corrección para el error '1970-01-01'
+        if str_value == '0' or value == 0:
+            return None
+
+        # Primero: Intenta ver si es un número (serial de Excel como 45789)
+        if isinstance(value, (int, float)):
+            try:
+                # Convertir número de serie de Excel
+                return pd.to_datetime(value, unit='D', origin='1899-12-30').strftime('%Y-%m-%d')
+            except (ValueError, TypeError):
+                raise ValueError(f"Número de serie de fecha no válido: '{value}' en '{db_col}'")
+
+        # Segundo: Si no es un número, intenta parsearlo como texto (ej. "24/10/2025")
+        try:
+            return pd.to_datetime(str_value, dayfirst=True).strftime('%Y-%m-%d')
+        except (ValueError, TypeError):
+            raise ValueError(f"Formato de fecha no válido: '{value}' en columna '{db_col}'")
+
+    # 3. FILTRO DE NÚMEROS DECIMALES (Costos, Valores)
+    elif db_col in DECIMAL_COLS:
+
+        cleaned_value = str_value.replace('$', '').replace(',', '').strip()
+
+        if cleaned_value == '':
+            return None
+
+        try:
+            return Decimal(cleaned_value)
+        except InvalidOperation:
+            raise ValueError(f"Formato de número decimal no válido: '{value}' en columna '{db_col}'")
+
+    # 4. FILTRO DE NÚMEROS ENTEROS (Cantidad, etc.)
+    elif db_col in INT_COLS:
+
+        cleaned_value = str_value.replace(',', '').strip()
+
+        if cleaned_value.endswith('.0'):
+            cleaned_value = cleaned_value[:-2]
+
+        if cleaned_value == '':
+            return None
+
+        try:
+            return int(cleaned_value)
+        except (ValueError, TypeError):
+            raise ValueError(f"Formato de número entero no válido: '{value}' en columna '{db_col}'")
+
+    # 5. FILTRO PARA TODO LO DEMÁS (Texto)
+    else:
+        # Devuelve el string limpio
+        return str_value
+
+
+# --- Conversión vectorizada por columna ---
+
+def _parse_fechas_texto(serie):
+    try:
+        return pd.to_datetime(serie, dayfirst=True, errors='coerce', format='mixed')
+    except (TypeError, ValueError):
+        # pandas < 2.0 no conoce format='mixed'
+        return serie.map(lambda v: pd.to_datetime(v, dayfirst=True, errors='coerce'))
+
+
+def convert_column(db_col, serie):
+    """
+    Versión vectorizada de convert_to_db_type para una columna completa.
+
+    Devuelve (valores, errores): la lista de valores ya convertidos (None para
+    vacíos) y un dict {posición: mensaje} con las celdas que no se pudieron
+    convertir, con los mismos mensajes que convert_to_db_type.
+    """
+    serie = pd.Series(serie, dtype=object).reset_index(drop=True)
+    texto = serie.map(lambda v: '' if v is None else str(v)).str.strip()
+    nulos = serie.isna() | (texto == '')
+    resultado = pd.Series([None] * len(serie), dtype=object)
+    errores = {}
+
+    if db_col in DATE_COLS:
+        es_numero = serie.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool))
+        ceros = (texto == '0') | (es_numero & (pd.to_numeric(serie.where(es_numero), errors='coerce') == 0))
+        validos = ~nulos & ~ceros
+        fechas = pd.Series(pd.NaT, index=serie.index, dtype='datetime64[ns]')
+
+        numericos = validos & es_numero
+        if numericos.any():
+            fechas[numericos] = pd.to_datetime(pd.to_numeric(serie[numericos]), unit='D', origin='1899-12-30', errors='coerce')
+        es_fecha = serie.map(lambda v: hasattr(v, 'year') and hasattr(v, 'month'))
+        directos = validos & es_fecha
+        if directos.any():
+            fechas[directos] = pd.to_datetime(serie[directos], errors='coerce')
+        textos = validos & ~es_numero & ~es_fecha
+        if textos.any():
+            fechas[textos] = _parse_fechas_texto(texto[textos])
+
+        for pos in fechas.index[validos & fechas.isna()]:
+            if es_numero[pos]:
+                errores[pos] = f"Número de serie de fecha no válido: '{serie[pos]}' en '{db_col}'"
+            else:
+                errores[pos] = f"Formato de fecha no válido: '{serie[pos]}' en columna '{db_col}'"
+        correctos = validos & fechas.notna()
+        resultado[correctos] = fechas[correctos].dt.strftime('%Y-%m-%d')
+
+    elif db_col in DECIMAL_COLS:
+        limpio = texto.str.replace('$', '', regex=False).str.replace(',', '', regex=False).str.strip()
+        validos = ~nulos & (limpio != '')
+        correctos = validos & limpio.str.fullmatch(r'[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?')
+        resultado[correctos] = limpio[correctos].map(Decimal)
+        for pos in limpio.index[validos & ~correctos]:
+            errores[pos] = f"Formato de número decimal no válido: '{serie[pos]}' en columna '{db_col}'"
+
+    elif db_col in INT_COLS:
+        limpio = texto.str.replace(',', '', regex=False).str.strip().str.replace(r'\.0$', '', regex=True)
+        validos = ~nulos & (limpio != '')
+        correctos = validos & limpio.str.fullmatch(r'[-+]?\d+')
+        resultado[correctos] = limpio[correctos].map(int)
+        for pos in limpio.index[validos & ~correctos]:
+            errores[pos] = f"Formato de número entero no válido: '{serie[pos]}' en columna '{db_col}'"
+
+    else:
+        resultado[~nulos] = texto[~nulos]
+
+    return resultado.tolist(), errores
+
+
+# --- Lectura por bloques ---
+
+def leer_bloques(fuente, chunk_size=CHUNK_SIZE):
+    """
+    Lee la primera hoja del libro en modo read_only.
+    Genera (encabezados, [(numero_fila_excel, valores), ...]) por bloque y omite filas vacías.
+    """
+    wb = load_workbook(fuente, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        filas = ws.iter_rows(values_only=True)
+        encabezados = next(filas, None)
+        if encabezados is None:
+            return
+        encabezados = [str(h).strip() if h is not None else '' for h in encabezados]
+        bloque = []
+        for numero, valores in enumerate(filas, start=2):
+            if all(v is None or str(v).strip() == '' for v in valores):
+                continue
+            bloque.append((numero, valores))
+            if len(bloque) >= chunk_size:
+                yield encabezados, bloque
+                bloque = []
+        if bloque:
+            yield encabezados, bloque
+    finally:
+        wb.close()
+
+
+def contar_filas(fuente):
+    """Filas declaradas en la hoja (aproximado, sin recorrerla); None si el archivo no lo indica."""
+    wb = load_workbook(fuente, read_only=True, data_only=True)
+    try:
+        max_row = wb.worksheets[0].max_row
+        return max(max_row - 1, 0) if max_row else None
+    finally:
+        wb.close()
+
+
+# --- Búsquedas masivas ---
+
+def _en_trozos(valores, tamano=IN_CHUNK_SIZE):
+    valores = list(valores)
+    for i in range(0, len(valores), tamano):
+        yield valores[i:i + tamano]
+
+
+def _buscar_ids(cursor, tabla, columna, valores):
+    """SELECT id, columna ... WHERE columna IN (...) en trozos; devuelve {normalizar(valor): id}."""
+    encontrados = {}
+    for trozo in _en_trozos(valores):
+        marcadores = ', '.join(['%s'] * len(trozo))
+        cursor.execute(f"SELECT id, `{columna}` FROM {tabla} WHERE `{columna}` IN ({marcadores})", tuple(trozo))
+        for row in cursor.fetchall():
+            encontrados[normalizar(row[columna]).strip()] = row['id']
+    return encontrados
+
+
+class _ContextoImportacion:
+    """Estado que se comparte entre bloques de una misma importación."""
+
+    def __init__(self, cursor, upload_id, user_id):
+        self.upload_id = upload_id
+        self.user_id = user_id
+        self.areas = {}                  # normalizar(nombre) -> id
+        self.bienes_con_resguardo = set()  # id_bien que ya recibieron resguardo en esta carga
+        cursor.execute("DESCRIBE resguardo_errores")
+        self.columnas_error = {col['Field'] for col in cursor.fetchall()}
+
+    def snapshot(self):
+        return dict(self.areas), set(self.bienes_con_resguardo)
+
+    def restaurar(self, estado):
+        self.areas, self.bienes_con_resguardo = estado
+
+
+def _procesar_bloque(cursor, contexto, columnas, area_idx, filas):
+    """
+    Convierte, valida y escribe un bloque de filas.
+    Devuelve (insertados, filas_con_error) donde filas_con_error es [(numero_fila, valores, mensaje)].
+    """
+    n = len(filas)
+    errores = {}
+
+    # 1. Conversión vectorizada por columna
+    convertidos = {}
+    for db_col, idx in columnas.items():
+        serie = [valores[idx] if idx < len(valores) else None for _, valores in filas]
+        convertidos[db_col], errores_col = convert_column(db_col, serie)
+        for pos, mensaje in errores_col.items():
+            errores.setdefault(pos, mensaje)
+
+    # 2. Armar los datos de bienes y resguardos por fila
+    bienes, resguardos, areas = [None] * n, [None] * n, [None] * n
+    for pos in range(n):
+        if pos in errores:
+            continue
+        bien_data = {c: v[pos] for c, v in convertidos.items() if c in BIENES_COLUMNS}
+        resguardo_data = {c: v[pos] for c, v in convertidos.items() if c in RESGUARDOS_COLUMNS}
+        if not bien_data.get('No_Inventario'):
+            errores[pos] = "La columna 'No_Inventario' es obligatoria."
+            continue
+        valores = filas[pos][1]
+        area = valores[area_idx] if area_idx is not None and area_idx < len(valores) else None
+        area = str(area).strip() if area is not None and not pd.isna(area) else ''
+        if not area:
+            errores[pos] = "El campo 'Area' es obligatorio."
+            continue
+        for campo, defecto in BIEN_DEFAULTS.items():
+            if bien_data.get(campo) is None:
+                bien_data[campo] = defecto
+        bien_data['usuario_id_registro'] = contexto.user_id
+        bienes[pos], resguardos[pos], areas[pos] = bien_data, resguardo_data, area
+
+    validas = [pos for pos in range(n) if bienes[pos] is not None]
+
+    # 3. Áreas: resolver en bloque y crear las que falten
+    faltantes = {}
+    for pos in validas:
+        clave = normalizar(areas[pos])
+        if clave not in contexto.areas:
+            faltantes.setdefault(clave, areas[pos])
+    if faltantes:
+        contexto.areas.update(_buscar_ids(cursor, 'areas', 'nombre', faltantes.values()))
+        nuevas = [nombre for clave, nombre in faltantes.items() if clave not in contexto.areas]
+        if nuevas:
+            cursor.executemany("INSERT IGNORE INTO areas (nombre) VALUES (%s)", [(a,) for a in nuevas])
+            contexto.areas.update(_buscar_ids(cursor, 'areas', 'nombre', nuevas))
+
+    # 4. Bienes: resolver No_Inventario en bloque y crear los que falten
+    inventarios = {}
+    for pos in validas:
+        inventarios.setdefault(normalizar(bienes[pos]['No_Inventario']), pos)
+    ids_bien = _buscar_ids(cursor, 'bienes', 'No_Inventario', [bienes[p]['No_Inventario'] for p in inventarios.values()])
+    por_crear = [pos for clave, pos in inventarios.items() if clave not in ids_bien]
+    if por_crear:
+        cols = list(bienes[por_crear[0]].keys())
+        cols_sql = ', '.join(f"`{c}`" for c in cols)
+        cursor.executemany(
+            f"INSERT INTO bienes ({cols_sql}) VALUES ({', '.join(['%s'] * len(cols))})",
+            [tuple(bienes[pos].get(c) for c in cols) for pos in por_crear]
+        )
+        ids_bien.update(_buscar_ids(cursor, 'bienes', 'No_Inventario', [bienes[p]['No_Inventario'] for p in por_crear]))
+
+    # 5. Resguardos activos existentes, en una sola consulta
+    activos = set()
+    for trozo in _en_trozos(set(ids_bien.values())):
+        marcadores = ', '.join(['%s'] * len(trozo))
+        cursor.execute(f"SELECT id_bien FROM resguardos WHERE Activo = 1 AND id_bien IN ({marcadores})", tuple(trozo))
+        activos.update(row['id_bien'] for row in cursor.fetchall())
+
+    # 6. Armar e insertar los resguardos
+    nuevos = []
+    for pos in validas:
+        no_inventario = bienes[pos]['No_Inventario']
+        id_bien = ids_bien.get(normalizar(no_inventario))
+        id_area = contexto.areas.get(normalizar(areas[pos]))
+        if id_bien is None or id_area is None:
+            errores[pos] = f"No se pudo registrar el bien '{no_inventario}' o el área '{areas[pos]}'."
+            continue
+        if id_bien in activos or id_bien in contexto.bienes_con_resguardo:
+            errores[pos] = f"El bien con ID {id_bien} (Inventario: {no_inventario}) ya tiene un resguardo activo."
+            continue
+        contexto.bienes_con_resguardo.add(id_bien)
+        resguardo_data = dict(resguardos[pos])
+        resguardo_data.update({'id_bien': id_bien, 'id_area': id_area, 'Activo': 1, 'usuario_id_registro': contexto.user_id})
+        nuevos.append(resguardo_data)
+
+    if nuevos:
+        cols = list(nuevos[0].keys())
+        cols_sql = ', '.join(f"`{c}`" for c in cols)
+        cursor.executemany(
+            f"INSERT INTO resguardos ({cols_sql}) VALUES ({', '.join(['%s'] * len(cols))})",
+            [tuple(r.get(c) for c in cols) for r in nuevos]
+        )
+
+    filas_con_error = [(filas[pos][0], filas[pos][1], errores[pos]) for pos in sorted(errores)]
+    return len(nuevos), filas_con_error
+
+
+def _guardar_errores(cursor, contexto, columnas, filas_con_error):
+    """Inserta las filas rechazadas en resguardo_errores con un solo executemany."""
+    if not filas_con_error:
+        return
+    cols = [c for c in columnas if c in contexto.columnas_error]
+    cols_sql = ', '.join(f"`{c}`" for c in ['upload_id', 'error_message'] + cols)
+    placeholders = ', '.join(['%s'] * (len(cols) + 2))
+    valores = []
+    for numero, fila, mensaje in filas_con_error:
+        crudos = []
+        for c in cols:
+            idx = columnas[c]
+            valor = fila[idx] if idx < len(fila) else None
+            crudos.append(str(valor) if valor is not None and not pd.isna(valor) else None)
+        valores.append(tuple([contexto.upload_id, f"Error en fila {numero}: {mensaje}"] + crudos))
+    cursor.executemany(f"INSERT INTO resguardo_errores ({cols_sql}) VALUES ({placeholders})", valores)
+
+
+def _refrescar_estadisticas(conn, contexto):
+    try:
+        conn.rollback()
+        area_stats.refrescar_areas(conn.cursor(), contexto.areas.values())
+        conn.commit()
+    except Exception as e:
+        print(f"Error al refrescar area_stats tras la importación {contexto.upload_id}: {e}")
+
+
+def importar_excel(conn, fuente, upload_id, user_id, chunk_size=CHUNK_SIZE, progreso=None):
+    """
+    Importa el archivo `fuente` (ruta o archivo abierto) confirmando por bloque.
+
+    `progreso(filas_procesadas, insertados, errores)` se llama al terminar cada bloque.
+    Devuelve un dict con 'filas', 'insertados' y 'errores'. Si ocurre un error
+    fatal, los bloques anteriores ya quedaron confirmados.
+    """
+    cursor = conn.cursor()
+    contexto = _ContextoImportacion(cursor, upload_id, user_id)
+    total_filas = total_insertados = total_errores = 0
+
+    try:
+        for encabezados, filas in leer_bloques(fuente, chunk_size):
+            indice = {h.upper().strip(): i for i, h in enumerate(encabezados) if h}
+            columnas = {db_col: indice[h.upper().strip()] for h, db_col in COLUMN_MAPPING.items()
+                        if h.upper().strip() in indice}
+            area_idx = indice.get(EXCEL_AREA_COL_NAME.upper().strip())
+
+            estado = contexto.snapshot()
+            try:
+                insertados, filas_con_error = _procesar_bloque(cursor, contexto, columnas, area_idx, filas)
+                _guardar_errores(cursor, contexto, columnas, filas_con_error)
+                conn.commit()
+            except Exception:
+                # Algún valor rompió el INSERT en bloque: se reintenta fila por fila
+                # para aislar la fila culpable, como hacía la importación original.
+                traceback.print_exc()
+                conn.rollback()
+                contexto.restaurar(estado)
+                insertados, filas_con_error = 0, []
+                for fila in filas:
+                    estado = contexto.snapshot()
+                    try:
+                        ok, errs = _procesar_bloque(cursor, contexto, columnas, area_idx, [fila])
+                        conn.commit()
+                        insertados += ok
+                        filas_con_error.extend(errs)
+                    except Exception as err:
+                        conn.rollback()
+                        contexto.restaurar(estado)
+                        filas_con_error.append((fila[0], fila[1], str(err)))
+                _guardar_errores(cursor, contexto, columnas, filas_con_error)
+                conn.commit()
+
+            total_filas += len(filas)
+            total_insertados += insertados
+            total_errores += len(filas_con_error)
+            if progreso:
+                progreso(total_filas, total_insertados, total_errores)
+    finally:
+        # Estadísticas de las áreas del archivo, una vez al final (incluye
+        # los bloques confirmados si la importación se interrumpió)
+        _refrescar_estadisticas(conn, contexto)
+
+    return {'filas': total_filas, 'insertados': total_insertados, 'errores': total_errores}
@@ -0,0 +1,415 @@
+# jobs.py
+"""
+Ejecutor de trabajos en segundo plano, sin broker externo.
+
+Las rutas pesadas (importación de Excel, exportación de plantillas, PDF de
+inventario) registran un trabajo en la tabla `background_jobs` y responden de
+inmediato; un pool de hilos del mismo proceso lo ejecuta y va guardando el
+progreso, que el navegador consulta en /jobs/<id>/estado.
+
+La tabla es la cola: al arrancar, los trabajos que quedaron 'En Cola' se
+vuelven a enviar. Un trabajo sólo lo toma quien logra pasarlo de 'En Cola' a
+'En Proceso', así varios procesos pueden compartir la misma tabla.
+
+Cada proceso anota en `propietario` (host:pid) los trabajos que toma y un
+hilo de latido renueva su `fecha_latido` cada JOB_HEARTBEAT_SECONDS. Un
+trabajo 'En Proceso' que pierde tres latidos quedó huérfano (el proceso se
+reinició o murió) y cualquier proceso vivo lo marca como 'Error' en su
+siguiente latido, sin esperar a JOB_STALE_MINUTES. Todas las fechas del
+latido las pone MySQL (NOW()), así no influye el reloj de cada servidor.
+"""
+import atexit
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask_login import login_user
+
+from database import get_db_connection
+from config import (JOBS_FOLDER, JOB_WORKERS, JOBS_SYNC, JOB_STALE_MINUTES, JOB_HEARTBEAT_SECONDS,
+                    JOB_RESULT_TTL_HOURS)
+
+JOB_HANDLERS = {}          # tipo -> función(ctx, **parametros)
+PROGRESO_INTERVALO = 1.0   # Segundos mínimos entre escrituras de progreso
+
+_executor = None
+_app = None
+_lock = threading.Lock()
+_latido = None
+_en_curso = set()          # Ids que ejecuta este proceso; los renueva el hilo de latido
+_en_curso_lock = threading.Lock()
+
+
+def _propietario():
+    return f"{socket.gethostname()}:{os.getpid()}"[:100]
+
+
+class JobError(Exception):
+    """Error esperado de un trabajo; su mensaje se muestra tal cual al usuario."""
+
+
+def register_job(tipo):
+    """Decorador que registra la función que ejecuta los trabajos de `tipo`."""
+    def decorator(f):
+        JOB_HANDLERS[tipo] = f
+        return f
+    return decorator
+
+
+class JobContext:
+    """Lo que recibe un manejador: identidad del trabajo, progreso y archivo de salida."""
+
+    def __init__(self, job_id, tipo, user_id):
+        self.job_id = job_id
+        self.tipo = tipo
+        self.user_id = user_id
+        self.ruta_resultado = None
+        self.nombre_descarga = None
+        self.mimetype = None
+        self._ultima_escritura = 0.0
+
+    def progreso(self, pct, mensaje=None):
+        """Guarda el avance (0-100); se limita la frecuencia para no saturar la BD."""
+        pct = max(0, min(int(pct or 0), 100))
+        ahora = time.monotonic()
+        if pct < 100 and ahora - self._ultima_escritura < PROGRESO_INTERVALO:
+            return
+        self._ultima_escritura = ahora
+        campos = {'progreso': pct}
+        if mensaje:
+            campos['mensaje'] = mensaje[:255]
+        _actualizar(self.job_id, **campos)
+
+    def archivo_resultado(self, nombre_descarga, mimetype):
+        """Reserva la ruta donde el manejador debe escribir el archivo descargable."""
+        _, ext = os.path.splitext(nombre_descarga)
+        self.ruta_resultado = os.path.join(JOBS_FOLDER, f"{self.job_id}{ext}")
+        self.nombre_descarga = nombre_descarga
+        self.mimetype = mimetype
+        return self.ruta_resultado
+
+
+# --- Persistencia (tabla background_jobs) ---
+
+def _actualizar(job_id, **campos):
+    conn = get_db_connection()
+    if not conn:
+        print(f"JOBS: sin conexión para actualizar el trabajo {job_id}")
+        return 0
+    try:
+        cursor = conn.cursor()
+        asignaciones = ', '.join(f"{col} = %s" for col in campos)
+        cursor.execute(f"UPDATE background_jobs SET {asignaciones} WHERE id = %s",
+                       tuple(campos.values()) + (job_id,))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+
+def _finalizar(job_id, **campos):
+    """
+    Escribe el estado final sólo si el trabajo sigue 'En Proceso' a nombre de
+    este proceso; si otro ya lo dio por huérfano no se revierte ese 'Error'.
+    """
+    conn = get_db_connection()
+    if not conn:
+        print(f"JOBS: sin conexión para cerrar el trabajo {job_id}")
+        return 0
+    try:
+        cursor = conn.cursor()
+        asignaciones = ', '.join(f"{col} = %s" for col in campos)
+        cursor.execute(
+            f"UPDATE background_jobs SET {asignaciones} "
+            "WHERE id = %s AND estatus = 'En Proceso' AND propietario = %s",
+            tuple(campos.values()) + (job_id, _propietario())
+        )
+        conn.commit()
+        if cursor.rowcount == 0:
+            print(f"JOBS: el trabajo {job_id} ya no es de este proceso (marcado como huérfano); "
+                  f"se descarta su estado final '{campos.get('estatus')}'.")
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+
+def _reclamar(job_id):
+    """Pasa el trabajo a 'En Proceso' sólo si sigue 'En Cola'; None si otro hilo lo tomó."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE background_jobs SET estatus = 'En Proceso', fecha_inicio = %s, mensaje = %s, "
+            "propietario = %s, fecha_latido = NOW() "
+            "WHERE id = %s AND estatus = 'En Cola'",
+            (datetime.now(), 'Procesando...', _propietario(), job_id)
+        )
+        conn.commit()
+        if cursor.rowcount != 1:
+            return None
+        cursor.execute("SELECT tipo, parametros, id_usuario FROM background_jobs WHERE id = %s", (job_id,))
+        return cursor.fetchone()
+    finally:
+        conn.close()
+
+
+def _cargar_json(valor):
+    if valor is None or isinstance(valor, (dict, list)):
+        return valor
+    try:
+        return json.loads(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_job(job_id):
+    """Devuelve el trabajo como dict (con parametros/resultado ya decodificados) o None."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM background_jobs WHERE id = %s", (job_id,))
+        job = cursor.fetchone()
+        if job:
+            job['parametros'] = _cargar_json(job['parametros'])
+            job['resultado'] = _cargar_json(job['resultado'])
+        return job
+    finally:
+        conn.close()
+
+
+def job_activo(tipo, **parametros):
+    """
+    Id del trabajo de `tipo` que sigue 'En Cola' o 'En Proceso' con esos
+    parámetros (p. ej. inventario_id=42), o None.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor()
+        condiciones = ''.join(f" AND JSON_EXTRACT(parametros, '$.{nombre}') = %s" for nombre in parametros)
+        cursor.execute(
+            "SELECT id FROM background_jobs WHERE tipo = %s AND estatus IN ('En Cola', 'En Proceso')"
+            f"{condiciones} ORDER BY fecha_creacion DESC LIMIT 1",
+            (tipo, *parametros.values())
+        )
+        job = cursor.fetchone()
+        return job['id'] if job else None
+    finally:
+        conn.close()
+
+
+# --- Ejecución ---
+
+def _ejecutar(job_id):
+    with _app.app_context():
+        job = _reclamar(job_id)
+        if not job:
+            return
+        tipo = job['tipo']
+        parametros = _cargar_json(job['parametros']) or {}
+        base_url = parametros.pop('_base_url', None) or 'http://localhost/'
+        ctx = JobContext(job_id, tipo, job['id_usuario'])
+        with _en_curso_lock:
+            _en_curso.add(job_id)
+
+        # Contexto de petición simulado: url_for, render_template y current_user
+        # funcionan igual que en la ruta original.
+        with _app.test_request_context(base_url=base_url):
+            try:
+                handler = JOB_HANDLERS.get(tipo)
+                if handler is None:
+                    raise JobError(f"No hay manejador registrado para '{tipo}'.")
+                if ctx.user_id:
+                    from models import User
+                    usuario = User.query.get(ctx.user_id)
+                    if usuario:
+                        login_user(usuario)
+
+                resultado = handler(ctx, **parametros)
+
+                _finalizar(
+                    job_id,
+                    estatus='Completado',
+                    progreso=100,
+                    mensaje=((resultado or {}).get('mensaje') or 'Completado')[:255],
+                    resultado=json.dumps(resultado or {}, default=str),
+                    ruta_resultado=ctx.ruta_resultado,
+                    nombre_descarga=ctx.nombre_descarga,
+                    mimetype=ctx.mimetype,
+                    fecha_fin=datetime.now()
+                )
+            except Exception as e:
+                if not isinstance(e, JobError):
+                    traceback.print_exc()
+                mensaje = str(e) if isinstance(e, JobError) else f"Error inesperado: {e}"
+                try:
+                    _finalizar(job_id, estatus='Error', mensaje=mensaje[:255], fecha_fin=datetime.now())
+                except Exception as err:
+                    print(f"JOBS: no se pudo marcar el error del trabajo {job_id}: {err}")
+            finally:
+                with _en_curso_lock:
+                    _en_curso.discard(job_id)
+                from extensions import db
+                db.session.remove()
+
+
+def submit_job(tipo, parametros=None, user_id=None, job_id=None, base_url=None):
+    """
+    Registra un trabajo 'En Cola' y lo envía al pool. Devuelve su id.
+
+    `parametros` debe ser serializable a JSON; se guarda para poder reencolar
+    el trabajo si el proceso se reinicia antes de ejecutarlo.
+    """
+    if tipo not in JOB_HANDLERS:
+        raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+    job_id = job_id or str(uuid.uuid4())
+    parametros = dict(parametros or {})
+    if base_url:
+        parametros['_base_url'] = base_url
+
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("No se pudo conectar a la base de datos para registrar el trabajo.")
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO background_jobs (id, tipo, estatus, progreso, mensaje, parametros, id_usuario) "
+            "VALUES (%s, %s, 'En Cola', 0, %s, %s, %s)",
+            (job_id, tipo, 'En cola', json.dumps(parametros, default=str), user_id)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    _enviar(job_id)
+    return job_id
+
+
+def _enviar(job_id):
+    if JOBS_SYNC or _executor is None:
+        _ejecutar(job_id)
+    else:
+        _executor.submit(_ejecutar, job_id)
+
+
+def _marcar_huerfanos(cursor):
+    """
+    Marca como 'Error' los trabajos 'En Proceso' cuyo propietario dejó de
+    latir (tres latidos perdidos). Las filas sin latido, anteriores a esta
+    columna, conservan el criterio de JOB_STALE_MINUTES.
+    """
+    cursor.execute(
+        "UPDATE background_jobs SET estatus = 'Error', mensaje = %s, fecha_fin = %s "
+        "WHERE estatus = 'En Proceso' AND ("
+        "  fecha_latido < NOW() - INTERVAL %s SECOND"
+        "  OR (fecha_latido IS NULL AND fecha_inicio < NOW() - INTERVAL %s MINUTE))",
+        ('Interrumpido: el proceso que lo ejecutaba dejó de responder.', datetime.now(),
+         3 * JOB_HEARTBEAT_SECONDS, JOB_STALE_MINUTES)
+    )
+    if cursor.rowcount:
+        print(f"JOBS: {cursor.rowcount} trabajo(s) huérfano(s) marcados como interrumpidos.")
+
+
+def _latir():
+    """Renueva el latido de los trabajos de este proceso y marca los huérfanos de otros."""
+    with _en_curso_lock:
+        ids = list(_en_curso)
+    conn = get_db_connection()
+    if not conn:
+        print("JOBS: sin conexión para el latido de los trabajos.")
+        return
+    try:
+        cursor = conn.cursor()
+        if ids:
+            cursor.execute(
+                f"UPDATE background_jobs SET fecha_latido = NOW() "
+                f"WHERE estatus = 'En Proceso' AND id IN ({', '.join(['%s'] * len(ids))})",
+                ids
+            )
+        _marcar_huerfanos(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _bucle_latido():
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            with _app.app_context():
+                _latir()
+        except Exception as e:
+            print(f"JOBS: error en el latido de los trabajos: {e}")
+
+
+def _recuperar():
+    """Marca como interrumpidos los trabajos huérfanos, reencola los pendientes y limpia resultados viejos."""
+    conn = get_db_connection()
+    if not conn:
+        print("JOBS: sin conexión, no se recuperaron trabajos pendientes.")
+        return
+    try:
+        cursor = conn.cursor()
+        _marcar_huerfanos(cursor)
+
+        caducidad = datetime.now() - timedelta(hours=JOB_RESULT_TTL_HOURS)
+        cursor.execute(
+            "SELECT id, ruta_resultado FROM background_jobs "
+            "WHERE estatus IN ('Completado', 'Error') AND fecha_fin < %s AND ruta_resultado IS NOT NULL",
+            (caducidad,)
+        )
+        for job in cursor.fetchall():
+            if os.path.exists(job['ruta_resultado']):
+                os.remove(job['ruta_resultado'])
+            cursor.execute("UPDATE background_jobs SET ruta_resultado = NULL WHERE id = %s", (job['id'],))
+        conn.commit()
+
+        cursor.execute("SELECT id FROM background_jobs WHERE estatus = 'En Cola' ORDER BY fecha_creacion")
+        pendientes = [row['id'] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+    for job_id in pendientes:
+        print(f"JOBS: reencolando trabajo pendiente {job_id}")
+        _enviar(job_id)
+
+
+def _detener():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def init_app(app):
+    """Crea el pool de hilos y el latido y recupera la cola. Llamar después de registrar los blueprints."""
+    global _app, _executor, _latido
+    _app = app
+    os.makedirs(JOBS_FOLDER, exist_ok=True)
+    with _lock:
+        if _executor is None and not JOBS_SYNC:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+            atexit.register(_detener)
+        # También con JOBS_SYNC: un trabajo largo ejecutado en la petición debe seguir latiendo
+        if _latido is None:
+            _latido = threading.Thread(target=_bucle_latido, name='job-latido', daemon=True)
+            _latido.start()
+
+    with app.app_context():
+        try:
+            _recuperar()
+        except Exception as e:
+            # Por ejemplo, durante `flask db upgrade` la tabla aún no existe
+            print(f"JOBS: no se pudo recuperar la cola de trabajos: {e}")
@@ -1,44 +1,204 @@
-from extensions import db
-from models import ActivityLog
-from flask_login import current_user
+# log_activity.py
+"""
+Bitácora de actividad (tabla activity_log).
+
+log_activity() no usa db.session: arma la fila y la encola en memoria. Un
+hilo de fondo la escribe junto con las demás en lotes (executemany, una sola
+transacción) cuando se juntan ACTIVITY_LOG_BATCH_SIZE entradas o pasan
+ACTIVITY_LOG_FLUSH_SECONDS. Así una acción registrada ya no cuesta una
+transacción extra ni descarta el trabajo pendiente de la sesión del llamador.
+
+- Al terminar el proceso (atexit) se escribe lo que quede en la cola.
+- Con ACTIVITY_LOG_SYNC=true, o si no se llamó iniciar_escritor() (scripts),
+  cada entrada se escribe en el momento con su propia conexión.
+- Si la cola se llena, la entrada se escribe en el momento en lugar de perderse.
+- vaciar() espera a que la cola quede escrita (pruebas, benchmarks).
+"""
+import atexit
+import queue
+import threading
+import time
 from datetime import datetime
 
+from flask_login import current_user
+
+from config import ACTIVITY_LOG_SYNC, ACTIVITY_LOG_BATCH_SIZE, ACTIVITY_LOG_FLUSH_SECONDS, ACTIVITY_LOG_QUEUE_MAX
+from database import get_db_connection
+
+SQL_INSERT = ("INSERT INTO activity_log (timestamp, user_id, action, category, details, resource_id) "
+              "VALUES (%s, %s, %s, %s, %s, %s)")
+
+
+def _recortar(valor, maximo):
+    if valor is None:
+        return None
+    valor = str(valor)
+    return valor[:maximo] if len(valor) > maximo else valor
+
+
+def _usuario_actual():
+    try:
+        return current_user.id if current_user and current_user.is_authenticated else None
+    except Exception:
+        return None
+
+
+class ActivityLogWriter:
+    """Cola en memoria + hilo que escribe la bitácora por lotes."""
+
+    def __init__(self, batch_size, flush_seconds, queue_max):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._cola = queue.Queue(maxsize=queue_max)
+        self._app = None
+        self._hilo = None
+        self._detenido = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {'encoladas': 0, 'escritas': 0, 'lotes': 0, 'directas': 0, 'errores': 0}
+
+    def _contar(self, nombre, valor=1):
+        with self._lock:
+            self._stats[nombre] += valor
+
+    # --- Escritura ---
+
+    def _conexion(self):
+        if self._app is not None:
+            with self._app.app_context():
+                return get_db_connection()   # Préstamo del pool compartido
+        return get_db_connection()           # Sin app: conexión directa
+
+    def escribir(self, filas):
+        """Escribe `filas` en una transacción; si el lote falla, fila por fila para aislar la culpable."""
+        if not filas:
+            return
+        conn = self._conexion()
+        if conn is None:
+            print(f"BITÁCORA: sin conexión, se pierden {len(filas)} entradas.")
+            self._contar('errores', len(filas))
+            return
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany(SQL_INSERT, filas)
+                conn.commit()
+                self._contar('escritas', len(filas))
+                self._contar('lotes')
+                return
+            except Exception as e:
+                print(f"BITÁCORA: error al escribir un lote de {len(filas)}: {e}")
+                conn.rollback()
+            for fila in filas:
+                try:
+                    cursor.execute(SQL_INSERT, fila)
+                    conn.commit()
+                    self._contar('escritas')
+                except Exception as e:
+                    conn.rollback()
+                    self._contar('errores')
+                    print(f"BITÁCORA: entrada descartada ({fila[2]}): {e}")
+        finally:
+            conn.close()
+
+    # --- Cola ---
+
+    def encolar(self, fila):
+        if self._hilo is None or ACTIVITY_LOG_SYNC:
+            self._contar('directas')
+            self.escribir([fila])
+            return
+        try:
+            self._cola.put_nowait(fila)
+            self._contar('encoladas')
+        except queue.Full:
+            # Mejor una transacción extra que perder el registro
+            self._contar('directas')
+            self.escribir([fila])
+
+    def _bucle(self):
+        lote = []
+        limite = None
+        while True:
+            espera = self.flush_seconds if limite is None else max(0.0, limite - time.monotonic())
+            try:
+                item = self._cola.get(timeout=espera)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, threading.Event):   # Marca de vaciar()
+                self.escribir(lote)
+                lote, limite = [], None
+                item.set()
+                continue
+            if item is not None:
+                lote.append(item)
+                if limite is None:
+                    limite = time.monotonic() + self.flush_seconds
+
+            if lote and (len(lote) >= self.batch_size or time.monotonic() >= limite):
+                self.escribir(lote)
+                lote, limite = [], None
+            if self._detenido.is_set() and self._cola.empty():
+                self.escribir(lote)
+                return
+
+    def vaciar(self, timeout=10):
+        """Espera a que todo lo encolado hasta ahora quede escrito."""
+        if self._hilo is None:
+            return True
+        listo = threading.Event()
+        self._cola.put(listo)
+        return listo.wait(timeout)
+
+    def iniciar(self, app):
+        self._app = app
+        if self._hilo is None and not ACTIVITY_LOG_SYNC:
+            self._hilo = threading.Thread(target=self._bucle, name='bitacora', daemon=True)
+            self._hilo.start()
+            atexit.register(self.detener)
+
+    def detener(self, timeout=10):
+        """Escribe lo pendiente y termina el hilo (se llama al salir del proceso)."""
+        if self._hilo is None:
+            return
+        self._detenido.set()
+        self.vaciar(timeout)
+        self._hilo.join(timeout)
+        self._hilo = None
+
+    def stats(self):
+        with self._lock:
+            datos = dict(self._stats)
+        datos['pendientes'] = self._cola.qsize()
+        datos['asincrona'] = self._hilo is not None
+        return datos
+
+
+escritor = ActivityLogWriter(ACTIVITY_LOG_BATCH_SIZE, ACTIVITY_LOG_FLUSH_SECONDS, ACTIVITY_LOG_QUEUE_MAX)
+
+
+def iniciar_escritor(app):
+    """Arranca el hilo de escritura. Llamar una vez al crear la app."""
+    escritor.iniciar(app)
+
+
+def vaciar(timeout=10):
+    return escritor.vaciar(timeout)
+
+
 def log_activity(action, category=None, details=None, resource_id=None):
     """
-    Versión mejorada con manejo de errores y límites de longitud
+    Registra una acción del usuario actual. No toca db.session: la fila se
+    escribe aparte (en lote o de inmediato según la configuración).
     """
     try:
-        # Asegurar que la sesión esté limpia
-        db.session.rollback()
-        
-        # Limitar longitudes para evitar truncamiento
-        if resource_id and len(str(resource_id)) > 50:
-            resource_id = str(resource_id)[:50]
-        
-        if details and len(str(details)) > 500:
-            details = str(details)[:500]
-        
-        if category and len(str(category)) > 100:
-            category = str(category)[:100]
-        
-        if action and len(str(action)) > 100:
-            action = str(action)[:100]
-
-        # Asegurarse de que hay un usuario autenticado
-        user_id = current_user.id if current_user and current_user.is_authenticated else None
-
-        log_entry = ActivityLog(
-            user_id=user_id,
-            action=action,
-            category=category,
-            details=details,
-            resource_id=resource_id,
-            timestamp=datetime.utcnow()
-        )
-        
-        db.session.add(log_entry)
-        db.session.commit()
-        
+        escritor.encolar((
+            datetime.utcnow(),
+            _usuario_actual(),
+            _recortar(action, 100),
+            _recortar(category, 100),
+            _recortar(details, 500),
+            _recortar(resource_id, 50),
+        ))
     except Exception as e:
         print(f"Error al registrar actividad: {e}")
-        db.session.rollback()  # Siempre hacer rollback en caso de error
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""Tabla area_stats: estadísticas materializadas por área
+
+Revision ID: a3c5e7f9b1d4
+Revises: f1a8c3e5b7d2
+Create Date: 2026-10-18 18:12:45.602331
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c5e7f9b1d4'
+down_revision = 'f1a8c3e5b7d2'
+branch_labels = None
+depends_on = None
+
+
+def _contador(nombre, comentario=None):
+    return sa.Column(nombre, sa.Integer(), server_default=sa.text('0'), nullable=False, comment=comentario)
+
+
+def upgrade():
+    op.create_table('area_stats',
+        sa.Column('id_area', sa.Integer(), nullable=False),
+        _contador('num_resguardos'),
+        _contador('num_bienes_normal', 'Tipo_De_Resguardo = 0'),
+        _contador('num_bienes_control', 'Tipo_De_Resguardo = 1 (sujetos a control)'),
+        sa.Column('valor_en_libros', sa.Numeric(precision=16, scale=2), server_default=sa.text('0'), nullable=False),
+        sa.Column('jefe_de_area', sa.String(length=255), nullable=True, comment='Del resguardo activo más reciente que lo indica.'),
+        _contador('num_activo'),
+        _contador('num_en_mantenimiento'),
+        _contador('num_en_proceso_baja'),
+        _contador('num_baja'),
+        _contador('num_faltante'),
+        sa.Column('fecha_actualizacion', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.ForeignKeyConstraint(['id_area'], ['areas.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id_area')
+    )
+    # Carga inicial (misma agregación que area_stats.SQL_REFRESCO, sin filtro de áreas)
+    op.execute("""
+        INSERT INTO area_stats (id_area, num_resguardos, num_bienes_normal, num_bienes_control, valor_en_libros,
+                                jefe_de_area, num_activo, num_en_mantenimiento, num_en_proceso_baja, num_baja,
+                                num_faltante, fecha_actualizacion)
+        SELECT
+            a.id,
+            COUNT(r.id),
+            COUNT(DISTINCT CASE WHEN r.Tipo_De_Resguardo = 0 THEN r.id_bien END),
+            COUNT(DISTINCT CASE WHEN r.Tipo_De_Resguardo = 1 THEN r.id_bien END),
+            COALESCE(SUM(b.Valor_En_Libros), 0),
+            SUBSTRING_INDEX(GROUP_CONCAT(NULLIF(TRIM(r.Nombre_Director_Jefe_De_Area), '')
+                                         ORDER BY r.id DESC SEPARATOR '\\n'), '\\n', 1),
+            COUNT(DISTINCT CASE WHEN b.estatus_actual = 'Activo' THEN b.id END),
+            COUNT(DISTINCT CASE WHEN b.estatus_actual = 'En Mantenimiento' THEN b.id END),
+            COUNT(DISTINCT CASE WHEN b.estatus_actual = 'En Proceso de Baja' THEN b.id END),
+            COUNT(DISTINCT CASE WHEN b.estatus_actual = 'Baja' THEN b.id END),
+            COUNT(DISTINCT CASE WHEN b.estatus_actual = 'Faltante' THEN b.id END),
+            NOW()
+        FROM areas a
+        LEFT JOIN resguardos r ON r.id_area = a.id AND r.Activo = 1
+        LEFT JOIN bienes b ON b.id = r.id_bien
+        GROUP BY a.id
+    """)
+
+
+def downgrade():
+    op.drop_table('area_stats')
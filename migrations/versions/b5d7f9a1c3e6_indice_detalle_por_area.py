@@ -0,0 +1,29 @@
+"""Índice de inventario_detalle por inventario, área y estatus
+
+Revision ID: b5d7f9a1c3e6
+Revises: a3c5e7f9b1d4
+Create Date: 2026-10-18 19:05:12.417803
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d7f9a1c3e6'
+down_revision = 'a3c5e7f9b1d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # gestionar_inventario: conteos por área (GROUP BY id_area_esperada) sólo
+    # desde el índice, y páginas de un área con o sin estatus ordenadas por id
+    with op.batch_alter_table('inventario_detalle', schema=None) as batch_op:
+        batch_op.create_index('ix_detalle_inventario_area_estatus',
+                              ['id_inventario', 'id_area_esperada', 'estatus_hallazgo'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('inventario_detalle', schema=None) as batch_op:
+        batch_op.drop_index('ix_detalle_inventario_area_estatus')
@@ -0,0 +1,39 @@
+"""Índices FULLTEXT para la búsqueda de bienes, resguardos y áreas
+
+Revision ID: c3d9a5e1f2b4
+Revises: 7aafa1095ce9
+Create Date: 2026-10-18 10:12:41.208331
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d9a5e1f2b4'
+down_revision = '7aafa1095ce9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Las columnas deben coincidir con search.INDICES_FULLTEXT (mismo orden)
+    with op.batch_alter_table('bienes', schema=None) as batch_op:
+        batch_op.create_index('ft_bienes_busqueda', ['No_Inventario', 'Descripcion_Del_Bien', 'Descripcion_Corta_Del_Bien', 'Marca', 'Modelo', 'Numero_De_Serie', 'Proveedor'], unique=False, mysql_prefix='FULLTEXT')
+
+    with op.batch_alter_table('resguardos', schema=None) as batch_op:
+        batch_op.create_index('ft_resguardos_busqueda', ['No_Resguardo', 'Nombre_Del_Resguardante', 'Nombre_Director_Jefe_De_Area'], unique=False, mysql_prefix='FULLTEXT')
+
+    with op.batch_alter_table('areas', schema=None) as batch_op:
+        batch_op.create_index('ft_areas_nombre', ['nombre'], unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade():
+    with op.batch_alter_table('areas', schema=None) as batch_op:
+        batch_op.drop_index('ft_areas_nombre')
+
+    with op.batch_alter_table('resguardos', schema=None) as batch_op:
+        batch_op.drop_index('ft_resguardos_busqueda')
+
+    with op.batch_alter_table('bienes', schema=None) as batch_op:
+        batch_op.drop_index('ft_bienes_busqueda')
@@ -0,0 +1,28 @@
+"""Índice de inventario_detalle por inventario y bien
+
+Revision ID: c7e9a1b3d5f8
+Revises: b5d7f9a1c3e6
+Create Date: 2026-10-18 20:41:37.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e9a1b3d5f8'
+down_revision = 'b5d7f9a1c3e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # cedulas.SQL_CEDULA_AREA: NOT EXISTS (id_inventario, id_bien) para no duplicar bienes.
+    # No es UNIQUE: las bases existentes pueden tener duplicados de la generación anterior.
+    with op.batch_alter_table('inventario_detalle', schema=None) as batch_op:
+        batch_op.create_index('ix_detalle_inventario_bien', ['id_inventario', 'id_bien'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('inventario_detalle', schema=None) as batch_op:
+        batch_op.drop_index('ix_detalle_inventario_bien')
@@ -0,0 +1,53 @@
+"""Índices compuestos/cubrientes para las consultas más frecuentes
+
+Revision ID: d7f3a9c2b815
+Revises: 5b8e21f4a7c0
+Create Date: 2026-10-18 12:20:45.318604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7f3a9c2b815'
+down_revision = '5b8e21f4a7c0'
+branch_labels = None
+depends_on = None
+
+
+# (tabla, nombre, columnas). benchmarks/indices.py lee esta lista para medir
+# los planes antes y después; deben coincidir con los __table_args__ de models.py.
+INDICES = [
+    # _get_resguardos_list: WHERE Tipo_De_Resguardo = ? ORDER BY id DESC (keyset)
+    ('resguardos', 'ix_resguardos_tipo_id', ['Tipo_De_Resguardo', 'id']),
+    # crear_inventario y conteo por área: id_area IN (...) AND Activo = 1 AND Tipo = ?;
+    # cubre id_bien y el resguardante para no leer la fila completa
+    ('resguardos', 'ix_resguardos_area_activo_tipo', ['id_area', 'Activo', 'Tipo_De_Resguardo', 'id_bien', 'Nombre_Del_Resguardante']),
+    # Resguardo activo de un bien (traspasos, bajas, inventarios)
+    ('resguardos', 'ix_resguardos_bien_activo', ['id_bien', 'Activo']),
+    # Búsqueda por prefijo (LIKE 'x%') y orden por número de resguardo / resguardante
+    ('resguardos', 'ix_resguardos_no_resguardo', ['No_Resguardo']),
+    ('resguardos', 'ix_resguardos_resguardante', ['Nombre_Del_Resguardante']),
+    # cambiar_estatus_inventario / finalizar_inventario: pendientes de un inventario
+    ('inventario_detalle', 'ix_detalle_inventario_estatus', ['id_inventario', 'estatus_hallazgo', 'id_bien']),
+    # view_activity_log: ORDER BY timestamp DESC con filtros opcionales (la migración
+    # e2c4b7a9d1f6 reemplaza los de categoría/usuario por (columna, id) al paginar por id)
+    ('activity_log', 'ix_activity_log_timestamp', ['timestamp']),
+    ('activity_log', 'ix_activity_log_categoria_fecha', ['category', 'timestamp']),
+    ('activity_log', 'ix_activity_log_usuario_fecha', ['user_id', 'timestamp']),
+    # select_error_batch: GROUP BY upload_id con MAX(Fecha_Registro), sólo desde el índice
+    ('resguardo_errores', 'ix_resguardo_errores_upload_fecha', ['upload_id', 'Fecha_Registro']),
+]
+
+
+def upgrade():
+    for tabla, nombre, columnas in INDICES:
+        with op.batch_alter_table(tabla, schema=None) as batch_op:
+            batch_op.create_index(nombre, columnas, unique=False)
+
+
+def downgrade():
+    for tabla, nombre, columnas in reversed(INDICES):
+        with op.batch_alter_table(tabla, schema=None) as batch_op:
+            batch_op.drop_index(nombre)
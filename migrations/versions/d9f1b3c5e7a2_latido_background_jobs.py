@@ -0,0 +1,31 @@
+"""background_jobs: propietario y latido de los trabajos en curso
+
+Revision ID: d9f1b3c5e7a2
+Revises: c7e9a1b3d5f8
+Create Date: 2026-10-18 21:02:54.331870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f1b3c5e7a2'
+down_revision = 'c7e9a1b3d5f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('background_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('propietario', sa.String(length=100), nullable=True, comment='Proceso que lo ejecuta (host:pid).'))
+        batch_op.add_column(sa.Column('fecha_latido', sa.DateTime(), nullable=True, comment='Último latido del proceso propietario (hora de MySQL).'))
+        # jobs._marcar_huerfanos: 'En Proceso' con latido vencido
+        batch_op.create_index('ix_background_jobs_estatus_latido', ['estatus', 'fecha_latido'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('background_jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_background_jobs_estatus_latido')
+        batch_op.drop_column('fecha_latido')
+        batch_op.drop_column('propietario')
@@ -0,0 +1,49 @@
+"""Bitácora: FULLTEXT en acción/detalles e índices para paginar por id
+
+Revision ID: e2c4b7a9d1f6
+Revises: d7f3a9c2b815
+Create Date: 2026-10-18 14:05:12.774120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2c4b7a9d1f6'
+down_revision = 'd7f3a9c2b815'
+branch_labels = None
+depends_on = None
+
+
+# view_activity_log pagina por llave (ORDER BY id DESC): los filtros por
+# categoría/usuario necesitan el id como segunda columna.
+# (tabla, índice anterior de d7f3a9c2b815, nuevo, columnas). benchmarks/indices.py
+# aplica estos reemplazos a la lista de esa migración para medir el esquema vigente.
+REEMPLAZOS = [
+    ('activity_log', 'ix_activity_log_categoria_fecha', 'ix_activity_log_categoria_id', ['category', 'id']),
+    ('activity_log', 'ix_activity_log_usuario_fecha', 'ix_activity_log_usuario_id', ['user_id', 'id']),
+]
+
+
+def upgrade():
+    with op.batch_alter_table('activity_log', schema=None) as batch_op:
+        # Los nuevos se crean antes de quitar los anteriores (la FK de user_id necesita un índice)
+        for _, _, nuevo, columnas in REEMPLAZOS:
+            batch_op.create_index(nuevo, columnas, unique=False)
+        for _, anterior, _, _ in REEMPLAZOS:
+            batch_op.drop_index(anterior)
+        # Búsqueda exacta/por prefijo del id de recurso
+        batch_op.create_index('ix_activity_log_resource_id', ['resource_id'], unique=False)
+        # Columnas de search.INDICE_BITACORA (mismo orden)
+        batch_op.create_index('ft_activity_log_texto', ['action', 'details'], unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade():
+    with op.batch_alter_table('activity_log', schema=None) as batch_op:
+        batch_op.drop_index('ft_activity_log_texto')
+        batch_op.drop_index('ix_activity_log_resource_id')
+        batch_op.create_index('ix_activity_log_usuario_fecha', ['user_id', 'timestamp'], unique=False)
+        batch_op.create_index('ix_activity_log_categoria_fecha', ['category', 'timestamp'], unique=False)
+        batch_op.drop_index('ix_activity_log_usuario_id')
+        batch_op.drop_index('ix_activity_log_categoria_id')
@@ -0,0 +1,32 @@
+"""Tabla cache_versions para invalidar los catálogos en memoria entre workers
+
+Revision ID: f1a8c3e5b7d2
+Revises: e2c4b7a9d1f6
+Create Date: 2026-10-18 16:40:27.318905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a8c3e5b7d2'
+down_revision = 'e2c4b7a9d1f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tabla = op.create_table('cache_versions',
+        sa.Column('nombre', sa.String(length=64), nullable=False, comment="Catálogo: 'areas', 'usuarios', 'roles'."),
+        sa.Column('version', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('fecha_actualizacion', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.PrimaryKeyConstraint('nombre')
+    )
+    op.bulk_insert(tabla, [{'nombre': 'areas', 'version': 0},
+                           {'nombre': 'usuarios', 'version': 0},
+                           {'nombre': 'roles', 'version': 0}])
+
+
+def downgrade():
+    op.drop_table('cache_versions')
@@ -43,8 +43,18 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
 
     def is_admin(self):
+        # Si el usuario vino de permisos_cache, sus roles ya están resueltos
+        acceso = getattr(self, '_acceso', None)
+        if acceso is not None:
+            return acceso.es_admin
         return any(role.name == 'admin' for role in self.roles)
 
+    def tiene_permiso(self, endpoint):
+        acceso = getattr(self, '_acceso', None)
+        if acceso is not None:
+            return endpoint in acceso.permisos
+        return any(permission.endpoint == endpoint for role in self.roles for permission in role.permissions)
+
 class Role(db.Model):
     __tablename__ = 'role'
     id = db.Column(db.Integer, primary_key=True)
@@ -67,6 +77,10 @@ class Area(db.Model):
     
     resguardos = db.relationship('Resguardo', back_populates='area', lazy=True)
 
+    __table_args__ = (
+        db.Index('ft_areas_nombre', 'nombre', mysql_prefix='FULLTEXT'),
+    )
+
 
 class Bienes(db.Model):
     __tablename__ = 'bienes'
@@ -116,6 +130,12 @@ class Bienes(db.Model):
     imagenes = db.relationship('ImagenesBien', backref='bien', lazy=True, cascade="all, delete-orphan")
     usuario_id_registro = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    # Índice de búsqueda (ver search.INDICES_FULLTEXT)
+    __table_args__ = (
+        db.Index('ft_bienes_busqueda', 'No_Inventario', 'Descripcion_Del_Bien', 'Descripcion_Corta_Del_Bien',
+                 'Marca', 'Modelo', 'Numero_De_Serie', 'Proveedor', mysql_prefix='FULLTEXT'),
+    )
+
 
 class Resguardo(db.Model):
     __tablename__ = 'resguardos'
@@ -144,6 +164,19 @@ class Resguardo(db.Model):
     oficios_traspaso_anteriores = db.relationship('OficiosTraspaso', foreign_keys='OficiosTraspaso.id_resguardo_anterior', back_populates='resguardo_anterior')
     oficios_traspaso_actuales = db.relationship('OficiosTraspaso', foreign_keys='OficiosTraspaso.id_resguardo_actual', back_populates='resguardo_actual')
     usuario_id_registro = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+    # Índice de búsqueda (ver search.INDICES_FULLTEXT) e índices de las
+    # consultas frecuentes (migración d7f3a9c2b815)
+    __table_args__ = (
+        db.Index('ft_resguardos_busqueda', 'No_Resguardo', 'Nombre_Del_Resguardante',
+                 'Nombre_Director_Jefe_De_Area', mysql_prefix='FULLTEXT'),
+        db.Index('ix_resguardos_tipo_id', 'Tipo_De_Resguardo', 'id'),
+        db.Index('ix_resguardos_area_activo_tipo', 'id_area', 'Activo', 'Tipo_De_Resguardo',
+                 'id_bien', 'Nombre_Del_Resguardante'),
+        db.Index('ix_resguardos_bien_activo', 'id_bien', 'Activo'),
+        db.Index('ix_resguardos_no_resguardo', 'No_Resguardo'),
+        db.Index('ix_resguardos_resguardante', 'Nombre_Del_Resguardante'),
+    )
     
 class ImagenesBien(db.Model):
     __tablename__ = 'imagenes_bien'
@@ -171,6 +204,15 @@ class ActivityLog(db.Model):
     resource_id = db.Column(db.String(50))  # ← CAMBIAR de Integer a String(50)
     user = db.relationship('User', back_populates='activity_logs')
 
+    __table_args__ = (
+        db.Index('ix_activity_log_timestamp', 'timestamp'),
+        db.Index('ix_activity_log_categoria_id', 'category', 'id'),
+        db.Index('ix_activity_log_usuario_id', 'user_id', 'id'),
+        db.Index('ix_activity_log_resource_id', 'resource_id'),
+        # Búsqueda de la bitácora (ver search.INDICE_BITACORA)
+        db.Index('ft_activity_log_texto', 'action', 'details', mysql_prefix='FULLTEXT'),
+    )
+
 class Traspaso(db.Model):
     __tablename__ = 'traspaso'
     id = db.Column(db.Integer, primary_key=True)
@@ -305,6 +347,10 @@ class ResguardoErrores(db.Model):
     Fecha_Registro = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
     Fecha_Ultima_Modificacion = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP'))
 
+    __table_args__ = (
+        db.Index('ix_resguardo_errores_upload_fecha', 'upload_id', 'Fecha_Registro'),
+    )
+
 
 # --- MODELOS PARA EL PROCESO DE BAJA DE BIENES ---
 
@@ -518,6 +564,12 @@ class InventarioDetalle(db.Model):
     # --- Relación con Fotos ---
     fotos = db.relationship('InventarioFoto', back_populates='detalle', cascade="all, delete-orphan")
 
+    __table_args__ = (
+        db.Index('ix_detalle_inventario_estatus', 'id_inventario', 'estatus_hallazgo', 'id_bien'),
+        db.Index('ix_detalle_inventario_area_estatus', 'id_inventario', 'id_area_esperada', 'estatus_hallazgo'),
+        db.Index('ix_detalle_inventario_bien', 'id_inventario', 'id_bien'),
+    )
+
 class InventarioFoto(db.Model):
     """
     Almacena las rutas de las fotografías tomadas para un bien específico
@@ -590,4 +642,76 @@ class InventarioSobranteFoto(db.Model):
     fecha_carga = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
     
     # --- Relación de vuelta ---
-    sobrante = db.relationship('InventarioSobrante', back_populates='fotos')
\ No newline at end of file
+    sobrante = db.relationship('InventarioSobrante', back_populates='fotos')
+
+
+class BackgroundJob(db.Model):
+    """
+    Trabajo pesado (importación, exportación, PDF) que se ejecuta en segundo
+    plano. La ruta que lo crea responde de inmediato y el navegador consulta
+    el progreso hasta que el resultado está listo para descargarse.
+    """
+    __tablename__ = 'background_jobs'
+
+    id = db.Column(db.String(36), primary_key=True, comment="UUID del trabajo; en importaciones es el upload_id.")
+    tipo = db.Column(db.String(50), nullable=False, comment="Manejador registrado en jobs.py, ej: 'importar_excel'.")
+    estatus = db.Column(
+        Enum('En Cola', 'En Proceso', 'Completado', 'Error', name='estatus_job_enum'),
+        nullable=False,
+        default='En Cola',
+        index=True
+    )
+    progreso = db.Column(db.Integer, nullable=False, default=0, comment="Porcentaje de avance (0-100).")
+    mensaje = db.Column(db.String(255))
+    parametros = db.Column(db.JSON, comment="Argumentos del manejador; permiten reencolar tras un reinicio.")
+    resultado = db.Column(db.JSON, comment="Resumen del resultado (conteos, enlaces, etc.).")
+    ruta_resultado = db.Column(db.String(512), comment="Archivo generado, dentro de JOBS_FOLDER.")
+    nombre_descarga = db.Column(db.String(255))
+    mimetype = db.Column(db.String(100))
+
+    id_usuario = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
+    fecha_creacion = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+    fecha_inicio = db.Column(db.DateTime, nullable=True)
+    fecha_fin = db.Column(db.DateTime, nullable=True)
+    propietario = db.Column(db.String(100), nullable=True, comment="Proceso que lo ejecuta (host:pid).")
+    fecha_latido = db.Column(db.DateTime, nullable=True, comment="Último latido del proceso propietario (hora de MySQL).")
+
+    __table_args__ = (
+        db.Index('ix_background_jobs_estatus_latido', 'estatus', 'fecha_latido'),
+    )
+
+
+class AreaStats(db.Model):
+    """
+    Estadísticas por área de los resguardos activos, materializadas. Las
+    mantiene area_stats.py (refresco por área en cada escritura y
+    reconstrucción completa con `python -m area_stats`).
+    """
+    __tablename__ = 'area_stats'
+
+    id_area = db.Column(db.Integer, db.ForeignKey('areas.id', ondelete='CASCADE'), primary_key=True)
+    num_resguardos = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    num_bienes_normal = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'), comment="Tipo_De_Resguardo = 0")
+    num_bienes_control = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'), comment="Tipo_De_Resguardo = 1 (sujetos a control)")
+    valor_en_libros = db.Column(db.Numeric(16, 2), nullable=False, default=0, server_default=text('0'))
+    jefe_de_area = db.Column(db.String(255), comment="Del resguardo activo más reciente que lo indica.")
+    num_activo = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    num_en_mantenimiento = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    num_en_proceso_baja = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    num_baja = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    num_faltante = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    fecha_actualizacion = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+
+
+class CacheVersion(db.Model):
+    """
+    Versión compartida de un catálogo en memoria (ver catalogos.py). Se
+    incrementa en la misma transacción que modifica el catálogo; cada worker
+    la consulta periódicamente para descartar su copia.
+    """
+    __tablename__ = 'cache_versions'
+
+    nombre = db.Column(db.String(64), primary_key=True, comment="Catálogo: 'areas', 'usuarios', 'roles'.")
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default=text('0'))
+    fecha_actualizacion = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'),
+                                    server_onupdate=text('CURRENT_TIMESTAMP'))
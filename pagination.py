@@ -0,0 +1,179 @@
+# pagination.py
+"""
+Paginación por llave (keyset / seek) para los listados grandes.
+
+En lugar de LIMIT/OFFSET, cada página se pide "después del último id visto"
+(WHERE id < %s ORDER BY id DESC), así el costo no crece con el número de
+página. El id frontera viaja en un cursor opaco y firmado; el total de
+registros se guarda en una cache con TTL para no contar en cada petición.
+"""
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+
+COUNT_CACHE_TTL = 60      # Segundos que un total se considera vigente
+COUNT_CACHE_MAX = 256     # Máximo de combinaciones de filtros guardadas
+
+
+class CountCache:
+    """Cache LRU con TTL para los COUNT(*) de los listados."""
+
+    def __init__(self, ttl=COUNT_CACHE_TTL, max_entries=COUNT_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entrada = self._datos.get(key)
+            if entrada is None:
+                return None
+            valor, guardado = entrada
+            if time.time() - guardado > self.ttl:
+                del self._datos[key]
+                return None
+            self._datos.move_to_end(key)
+            return valor
+
+    def set(self, key, valor):
+        with self._lock:
+            self._datos[key] = (valor, time.time())
+            self._datos.move_to_end(key)
+            while len(self._datos) > self.max_entries:
+                self._datos.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+
+count_cache = CountCache()
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='paginacion-keyset')
+
+
+def huella_filtros(*partes):
+    """Resumen corto de los filtros activos; un cursor sólo vale para los mismos filtros."""
+    crudo = json.dumps(partes, default=str, sort_keys=True)
+    return hashlib.md5(crudo.encode('utf-8')).hexdigest()[:12]
+
+
+def encode_cursor(boundary_id, direccion, pagina, huella):
+    """Genera el token opaco para pedir la página siguiente ('n') o anterior ('p')."""
+    return _serializer().dumps({'id': int(boundary_id), 'd': direccion, 'p': int(pagina), 'f': huella})
+
+
+def decode_cursor(token, huella):
+    """
+    Devuelve el contenido del cursor, o None si falta, fue alterado o
+    pertenece a otra búsqueda (en ese caso se vuelve a la primera página).
+    """
+    if not token:
+        return None
+    try:
+        datos = _serializer().loads(token)
+    except BadSignature:
+        return None
+    if not isinstance(datos, dict) or datos.get('f') != huella or datos.get('d') not in ('n', 'p'):
+        return None
+    try:
+        datos['id'] = int(datos['id'])
+        datos['p'] = max(int(datos.get('p', 1)), 1)
+    except (TypeError, ValueError):
+        return None
+    return datos
+
+
+class KeysetPage:
+    """Resultado de una página: filas, posición y cursores de navegación."""
+
+    def __init__(self, rows, page, total_items, limit, next_cursor, prev_cursor):
+        self.rows = rows
+        self.page = page
+        self.total_items = total_items
+        self.total_pages = max(math.ceil(total_items / limit), 1) if limit else 1
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def paginar_keyset(cursor, select_sql, from_sql, where_clauses, params, id_col, limit,
+                   token=None, count_expr='COUNT(*)', group_by=None, cache_key=None):
+    """
+    Ejecuta una página en modo keyset ordenada por `id_col` descendente.
+
+    - where_clauses / params: filtros ya armados por la ruta (lista de SQL y valores).
+    - token: cursor recibido en la petición (?cursor=...).
+    - count_expr: expresión de conteo, p. ej. 'COUNT(DISTINCT b.id)'.
+    - cache_key: nombre del listado; junto con los filtros forma la llave del total cacheado.
+    """
+    huella = huella_filtros(cache_key, where_clauses, params)
+    datos_cursor = decode_cursor(token, huella)
+
+    # --- Total de registros (cacheado) ---
+    total_key = (cache_key, huella)
+    total_items = count_cache.get(total_key)
+    if total_items is None:
+        count_query = f"SELECT {count_expr} AS total {from_sql}"
+        if where_clauses:
+            count_query += " WHERE " + " AND ".join(where_clauses)
+        cursor.execute(count_query, tuple(params))
+        total_items = cursor.fetchone()['total']
+        count_cache.set(total_key, total_items)
+
+    # --- Página actual ---
+    clauses = list(where_clauses)
+    page_params = list(params)
+    direccion = 'n'
+    pagina = 1
+    if datos_cursor:
+        direccion = datos_cursor['d']
+        pagina = datos_cursor['p']
+        clauses.append(f"{id_col} < %s" if direccion == 'n' else f"{id_col} > %s")
+        page_params.append(datos_cursor['id'])
+
+    query = f"{select_sql} {from_sql}"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    if group_by:
+        query += f" GROUP BY {group_by}"
+    # Hacia atrás se recorre en orden ascendente y luego se invierte
+    query += f" ORDER BY {id_col} {'DESC' if direccion == 'n' else 'ASC'} LIMIT %s"
+    page_params.append(limit + 1)
+
+    cursor.execute(query, tuple(page_params))
+    rows = list(cursor.fetchall())
+    hay_mas = len(rows) > limit
+    rows = rows[:limit]
+    if direccion == 'p':
+        rows.reverse()
+
+    id_key = id_col.split('.')[-1]
+    next_cursor = prev_cursor = None
+    if rows:
+        if direccion == 'n':
+            tiene_siguiente, tiene_anterior = hay_mas, datos_cursor is not None
+        else:
+            tiene_siguiente, tiene_anterior = True, hay_mas and pagina > 1
+        if tiene_siguiente:
+            next_cursor = encode_cursor(rows[-1][id_key], 'n', pagina + 1, huella)
+        if tiene_anterior:
+            prev_cursor = encode_cursor(rows[0][id_key], 'p', pagina - 1, huella)
+
+    return KeysetPage(rows, pagina, total_items, limit, next_cursor, prev_cursor)
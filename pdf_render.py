@@ -0,0 +1,117 @@
+# pdf_render.py
+"""
+Generación de PDF con memoria acotada (WeasyPrint + pypdf).
+
+- Las fotos no se incrustan como data URI en base64: la plantilla las
+  referencia como `pdfimg:<ruta relativa>` y un url_fetcher propio entrega
+  una versión reducida a resolución de impresión.
+- Esas versiones se guardan en disco con llave por hash de contenido
+  (UPLOAD_FOLDER/_derivados/pdf/<md5>_<px>.jpg), así un PDF repetido no
+  vuelve a decodificar las fotos originales.
+- El documento se genera por secciones: cada parte se escribe a un PDF
+  temporal y al final se unen con pypdf, de modo que WeasyPrint nunca tiene
+  en memoria el layout de todo el reporte.
+"""
+import os
+import tempfile
+import threading
+import urllib.parse
+
+from flask import current_app
+from PIL import Image, ImageOps
+from pypdf import PdfWriter
+from weasyprint import HTML, default_url_fetcher
+from werkzeug.utils import safe_join
+
+from config import UPLOAD_FOLDER, PDF_IMAGE_MAX_PX
+from derivatives import DERIVADOS_DIR, es_imagen
+from http_cache import etag_archivo
+
+ESQUEMA_IMAGEN = 'pdfimg:'
+CALIDAD_JPEG = 80
+
+
+def url_imagen_pdf(rel_path):
+    """URL que la plantilla del PDF usa para una foto de UPLOAD_FOLDER."""
+    return ESQUEMA_IMAGEN + urllib.parse.quote(rel_path.replace('\\', '/'))
+
+
+def rendicion_impresion(ruta_original, max_px=PDF_IMAGE_MAX_PX, base_folder=None):
+    """Ruta de la versión reducida (JPEG) de una foto, generándola si no existe en cache."""
+    digest = etag_archivo(ruta_original)
+    destino = os.path.join(base_folder or UPLOAD_FOLDER, DERIVADOS_DIR, 'pdf', f"{digest}_{max_px}.jpg")
+    if os.path.exists(destino):
+        return destino
+
+    with Image.open(ruta_original) as img:
+        # draft() decodifica el JPEG ya reducido (1/2, 1/4, 1/8): no se carga la foto completa
+        img.draft('RGB', (max_px * 2, max_px * 2))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.thumbnail((max_px, max_px), Image.LANCZOS)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        tmp = f"{destino}.{threading.get_ident()}.tmp"
+        img.save(tmp, 'JPEG', quality=CALIDAD_JPEG, optimize=True)
+        os.replace(tmp, destino)
+    return destino
+
+
+def crear_url_fetcher(base_folder, static_folder=None):
+    """
+    url_fetcher para WeasyPrint: resuelve `pdfimg:` y /static/ desde disco
+    (sin pedir por HTTP al propio servidor); el resto usa el comportamiento normal.
+    """
+    def fetcher(url):
+        if url.startswith(ESQUEMA_IMAGEN):
+            rel_path = urllib.parse.unquote(url[len(ESQUEMA_IMAGEN):])
+            ruta = safe_join(base_folder, rel_path)
+            if ruta is None or not os.path.isfile(ruta) or not es_imagen(ruta):
+                raise ValueError(f"Imagen no disponible para el PDF: {rel_path}")
+            return {
+                'file_obj': open(rendicion_impresion(ruta, base_folder=base_folder), 'rb'),
+                'mime_type': 'image/jpeg',
+                'redirected_url': url,
+            }
+
+        if static_folder:
+            ruta_url = urllib.parse.urlparse(url).path
+            if ruta_url.startswith('/static/'):
+                ruta = safe_join(static_folder, ruta_url[len('/static/'):])
+                if ruta and os.path.isfile(ruta):
+                    return {'file_obj': open(ruta, 'rb'), 'redirected_url': url}
+
+        return default_url_fetcher(url)
+    return fetcher
+
+
+def escribir_pdf_por_secciones(partes_html, destino, base_url, base_folder=None, progreso=None):
+    """
+    Convierte cada parte HTML (iterable, puede ser un generador) en un PDF
+    temporal y los une en `destino`. `progreso(n)` se llama tras cada parte.
+    """
+    base_folder = base_folder or current_app.config.get('UPLOAD_FOLDER') or UPLOAD_FOLDER
+    fetcher = crear_url_fetcher(base_folder, current_app.static_folder)
+    temporales = []
+    try:
+        for n, html_string in enumerate(partes_html, start=1):
+            fd, tmp = tempfile.mkstemp(suffix='.pdf', dir=os.path.dirname(destino))
+            os.close(fd)
+            temporales.append(tmp)
+            HTML(string=html_string, base_url=base_url, url_fetcher=fetcher).write_pdf(target=tmp)
+            if progreso:
+                progreso(n)
+
+        writer = PdfWriter()
+        for tmp in temporales:
+            writer.append(tmp)
+        with open(destino, 'wb') as f:
+            writer.write(f)
+        writer.close()
+    finally:
+        for tmp in temporales:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+    return destino
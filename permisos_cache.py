@@ -0,0 +1,152 @@
+# permisos_cache.py
+"""
+Cache por proceso de usuarios y permisos para login_manager.user_loader.
+
+Sin cache, cada petición consultaba el usuario, y permission_required /
+is_admin() recorrían roles y permisos con cargas perezosas (una consulta por
+rol). Ahora:
+
+- Al fallar el cache se carga el usuario con sus roles y los permisos de
+  cada rol de una sola vez (selectinload) y se calculan los conjuntos de
+  nombres de rol y de endpoints permitidos (Acceso).
+- El usuario se guarda desprendido de la sesión (LRU por user_id). En cada
+  petición se incorpora a db.session con merge(load=False), que no consulta
+  la base; roles y permisos ya vienen cargados.
+- Cada entrada recuerda la versión vigente al cargarla. La versión sube
+  cuando se confirma una transacción que escribió en user, user_roles, role,
+  role_permissions o permission (hook de commit de database.py), así que las
+  ediciones de admin_users y de Flask-Admin invalidan el cache sin llamadas
+  explícitas. El TTL acota el atraso de los demás workers.
+
+Con el cache caliente, cargar el usuario y autorizar cuesta cero consultas.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.orm import selectinload
+
+from config import PERMISSION_CACHE_MAX_USERS, PERMISSION_CACHE_TTL_SECONDS
+from database import registrar_hook_commit
+from extensions import db
+from models import User, Role
+
+TABLAS_PERMISOS = frozenset(('user', 'user_roles', 'role', 'role_permissions', 'permission'))
+
+_version = 0
+_version_lock = threading.Lock()
+
+
+def _al_confirmar(tablas):
+    global _version
+    if TABLAS_PERMISOS & set(tablas):
+        with _version_lock:
+            _version += 1
+
+
+def version_actual():
+    with _version_lock:
+        return _version
+
+
+registrar_hook_commit(_al_confirmar)
+
+
+class Acceso:
+    """Roles y endpoints permitidos de un usuario, ya resueltos."""
+    __slots__ = ('roles', 'permisos', 'es_admin')
+
+    def __init__(self, usuario):
+        self.roles = frozenset(role.name for role in usuario.roles)
+        self.permisos = frozenset(p.endpoint for role in usuario.roles for p in role.permissions)
+        self.es_admin = 'admin' in self.roles
+
+
+class PermissionCache:
+    """LRU de usuarios desprendidos con su Acceso, validados por versión y TTL."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()   # user_id -> (usuario, acceso, version, creado)
+        self._stats = {'hits': 0, 'misses': 0, 'invalidaciones': 0, 'expirados': 0, 'desalojos': 0}
+
+    def _vigente(self, user_id):
+        with self._lock:
+            entrada = self._entradas.get(user_id)
+            if entrada is None:
+                self._stats['misses'] += 1
+                return None
+            if entrada[2] != version_actual():
+                del self._entradas[user_id]
+                self._stats['invalidaciones'] += 1
+                self._stats['misses'] += 1
+                return None
+            if time.time() - entrada[3] > self.ttl:
+                del self._entradas[user_id]
+                self._stats['expirados'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entradas.move_to_end(user_id)
+            self._stats['hits'] += 1
+            return entrada
+
+    def _cargar(self, user_id):
+        # La versión se toma antes de leer: una escritura concurrente deja la entrada ya vencida
+        version = version_actual()
+        usuario = (User.query
+                   .options(selectinload(User.roles).selectinload(Role.permissions))
+                   .filter_by(id=user_id)
+                   .first())
+        if usuario is None:
+            return None
+        acceso = Acceso(usuario)
+        # Se desprende todo lo cargado para que la copia en cache no dependa de esta sesión
+        for role in usuario.roles:
+            for permiso in role.permissions:
+                db.session.expunge(permiso)
+            db.session.expunge(role)
+        db.session.expunge(usuario)
+        entrada = (usuario, acceso, version, time.time())
+        with self._lock:
+            self._entradas[user_id] = entrada
+            self._entradas.move_to_end(user_id)
+            while len(self._entradas) > self.max_entries:
+                self._entradas.popitem(last=False)
+                self._stats['desalojos'] += 1
+        return entrada
+
+    def usuario(self, user_id):
+        """User en la sesión actual (o None si no existe), con su Acceso en `_acceso`."""
+        entrada = self._vigente(user_id) or self._cargar(user_id)
+        if entrada is None:
+            return None
+        usuario = db.session.merge(entrada[0], load=False)
+        usuario._acceso = entrada[1]
+        return usuario
+
+    def invalidar(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            datos = dict(self._stats)
+            datos['entradas'] = len(self._entradas)
+        datos['version'] = version_actual()
+        return datos
+
+
+permission_cache = PermissionCache(PERMISSION_CACHE_MAX_USERS, PERMISSION_CACHE_TTL_SECONDS)
+
+
+def cargar_usuario(user_id):
+    """Para login_manager.user_loader."""
+    try:
+        return permission_cache.usuario(int(user_id))
+    except (TypeError, ValueError):
+        return None
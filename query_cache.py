@@ -0,0 +1,132 @@
+# query_cache.py
+"""
+Cache en memoria de resultados de plantillas de consulta.
+
+- Llave: (tipo de consulta, columnas, JSON normalizado de filtros, límite).
+- Cada entrada recuerda la versión de las tablas de las que depende
+  (bienes, resguardos, areas e imágenes). Las versiones son contadores por
+  tabla que database.py incrementa al confirmar una transacción que escribió
+  en ellas, tanto por get_db_connection como por db.session. Si alguna
+  versión cambió, la entrada se descarta.
+- Límite de memoria en bytes (LRU) y TTL; el TTL también acota cuánto puede
+  atrasarse un proceso cuando la escritura ocurrió en otro worker.
+- Los valores se guardan serializados (pickle): el tamaño es exacto y cada
+  lectura entrega una copia que el llamador puede modificar.
+"""
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from config import QUERY_CACHE_MAX_BYTES, QUERY_CACHE_TTL_SECONDS
+from database import registrar_hook_commit
+
+# Tablas que lee una plantilla (ver plantillas._consulta_resguardos)
+TABLAS_PLANTILLAS = ('bienes', 'resguardos', 'areas', 'imagenes_bien', 'imagenes_resguardo')
+
+_versiones = {}
+_versiones_lock = threading.Lock()
+
+
+def incrementar_versiones(tablas):
+    with _versiones_lock:
+        for tabla in tablas:
+            _versiones[tabla] = _versiones.get(tabla, 0) + 1
+
+
+def version_tablas(tablas):
+    with _versiones_lock:
+        return tuple(_versiones.get(t, 0) for t in tablas)
+
+
+registrar_hook_commit(incrementar_versiones)
+
+
+def clave_plantilla(tipo, columnas, filtros, limite=None):
+    """Llave estable: el mismo árbol de filtros da la misma llave sin importar el orden de sus claves."""
+    return (tipo, tuple(columnas or ()), json.dumps(filtros or {}, sort_keys=True, separators=(',', ':'), default=str), limite)
+
+
+class QueryResultCache:
+    """Resultados serializados con LRU por bytes, TTL y validación por versión de tablas."""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()   # llave -> (datos, tablas, versiones, creado)
+        self._bytes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'invalidaciones': 0, 'expirados': 0,
+                       'desalojos': 0, 'demasiado_grandes': 0}
+
+    def _quitar(self, llave):
+        datos = self._entradas.pop(llave)[0]
+        self._bytes -= len(datos)
+
+    def get(self, llave):
+        """Devuelve (True, valor) si hay un resultado vigente, si no (False, None)."""
+        with self._lock:
+            entrada = self._entradas.get(llave)
+            if entrada is None:
+                self._stats['misses'] += 1
+                return False, None
+            datos, tablas, versiones, creado = entrada
+            if time.time() - creado > self.ttl:
+                self._quitar(llave)
+                self._stats['expirados'] += 1
+                self._stats['misses'] += 1
+                return False, None
+            if version_tablas(tablas) != versiones:
+                self._quitar(llave)
+                self._stats['invalidaciones'] += 1
+                self._stats['misses'] += 1
+                return False, None
+            self._entradas.move_to_end(llave)
+            self._stats['hits'] += 1
+        return True, pickle.loads(datos)
+
+    def put(self, llave, tablas, valor, versiones=None):
+        """
+        Guarda `valor`. `versiones` debe tomarse ANTES de consultar, así una
+        escritura confirmada durante la consulta deja la entrada ya inválida.
+        """
+        datos = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        versiones = versiones if versiones is not None else version_tablas(tablas)
+        with self._lock:
+            if len(datos) > self.max_bytes // 4:
+                self._stats['demasiado_grandes'] += 1
+                return
+            if llave in self._entradas:
+                self._quitar(llave)
+            self._entradas[llave] = (datos, tuple(tablas), versiones, time.time())
+            self._bytes += len(datos)
+            while self._bytes > self.max_bytes and self._entradas:
+                self._quitar(next(iter(self._entradas)))
+                self._stats['desalojos'] += 1
+
+    def obtener_o_calcular(self, llave, tablas, calcular):
+        """Devuelve el resultado en cache o ejecuta `calcular()` y lo guarda."""
+        encontrado, valor = self.get(llave)
+        if encontrado:
+            return valor
+        versiones = version_tablas(tablas)
+        valor = calcular()
+        self.put(llave, tablas, valor, versiones)
+        return valor
+
+    def stats(self):
+        with self._lock:
+            datos = dict(self._stats)
+            datos['entradas'] = len(self._entradas)
+            datos['bytes'] = self._bytes
+            datos['max_bytes'] = self.max_bytes
+            datos['ttl_segundos'] = self.ttl
+        consultas = datos['hits'] + datos['misses']
+        datos['tasa_aciertos'] = round(datos['hits'] / consultas, 3) if consultas else None
+        with _versiones_lock:
+            datos['versiones_tablas'] = dict(_versiones)
+        return datos
+
+
+query_cache = QueryResultCache(QUERY_CACHE_MAX_BYTES, QUERY_CACHE_TTL_SECONDS)
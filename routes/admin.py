@@ -1,5 +1,5 @@
 # routes/admin.py
-from flask import Blueprint, redirect, url_for, flash, request, render_template
+from flask import Blueprint, redirect, url_for, flash, request, render_template, jsonify
 from flask_login import login_required,  current_user
 from flask_admin.contrib.sqla import ModelView
 from extensions import db
@@ -12,8 +12,24 @@ from flask import render_template, request
 from flask_login import login_required
 from models import ActivityLog, User # Asegúrate de importar tus modelos
 
-from sqlalchemy import or_
 import traceback
+from database import get_pool_stats
+from drive_cache import image_cache
+from query_cache import query_cache
+import pymysql
+from database import get_db_connection
+from pagination import paginar_keyset, CountCache
+from search import build_search_bitacora
+import sql_profiler
+from log_activity import escritor as escritor_bitacora
+from permisos_cache import permission_cache
+import catalogos
+from config import SLOW_QUERY_MS
+
+# Listas de los filtros de la bitácora (usuarios, categorías): cambian poco
+_filtros_bitacora = CountCache(ttl=300, max_entries=4)
+DASHBOARD_TOTALES = ('num_resguardos', 'valor_en_libros', 'num_bienes_normal', 'num_bienes_control',
+                     'num_activo', 'num_en_mantenimiento', 'num_en_proceso_baja', 'num_baja', 'num_faltante')
 
 # Define the blueprint for your custom admin routes.
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -65,8 +81,59 @@ class AdminRoleView(ModelView):
 @admin_bp.route('/')
 @login_required
 def admin_dashboard():
-    # You can pass data to the template here, e.g., statistics
-    return render_template('admin/dashboard.html')
+    # Cifras por área de la tabla materializada area_stats (sin recorrer resguardos)
+    try:
+        areas = catalogos.area_stats()
+    except Exception as e:
+        print(f"Error al leer area_stats: {e}")
+        areas = []
+    totales = {campo: sum(a[campo] for a in areas) for campo in DASHBOARD_TOTALES}
+    areas_top = sorted(areas, key=lambda a: a['valor_en_libros'], reverse=True)[:10]
+    return render_template('admin/dashboard.html', totales=totales, areas_top=areas_top)
+
+@admin_bp.route('/rendimiento')
+@login_required
+@admin_required
+def estadisticas_rendimiento():
+    """Contadores internos de rendimiento (pool de conexiones, etc.) en JSON."""
+    return jsonify({
+        'pool_conexiones': get_pool_stats(),
+        'cache_imagenes': image_cache.stats(),
+        'cache_consultas': query_cache.stats(),
+        'perfil_sql': sql_profiler.resumen_endpoints(limite=10),
+        'bitacora': escritor_bitacora.stats(),
+        'cache_permisos': permission_cache.stats(),
+        'catalogos': catalogos.reference_cache.stats(),
+    })
+
+
+@admin_bp.route('/sql')
+@login_required
+@admin_required
+def perfil_sql():
+    """
+    Endpoints con más tiempo en la base (o más consultas, ?orden=consultas_promedio)
+    y las últimas consultas lentas con su EXPLAIN. ?formato=json devuelve los datos.
+    """
+    orden = request.args.get('orden', 'tiempo_db_ms')
+    datos = {
+        'umbral_ms': SLOW_QUERY_MS,
+        'orden': orden,
+        'endpoints': sql_profiler.resumen_endpoints(orden),
+        'lentas': sql_profiler.consultas_lentas(),
+    }
+    if request.args.get('formato') == 'json':
+        return jsonify(datos)
+    return render_template('admin/perfil_sql.html', **datos)
+
+
+@admin_bp.route('/sql/reiniciar', methods=['POST'])
+@login_required
+@admin_required
+def reiniciar_perfil_sql():
+    sql_profiler.reiniciar()
+    flash('Estadísticas de SQL reiniciadas.', 'success')
+    return redirect(url_for('admin.perfil_sql'))
 
 @admin_bp.route('/settings')
 @login_required
@@ -78,71 +145,76 @@ def admin_settings():
 @login_required
 @permission_required('admin.view_activity_log')
 def view_activity_log():
+    """
+    Bitácora paginada por llave (id DESC, sin OFFSET). La búsqueda usa el
+    índice FULLTEXT de acción/detalles; las listas de usuarios y categorías
+    de los filtros se cachean.
+    """
+    conn = None
     try:
-        # --- ESTA ES LA CORRECIÓN DEL ERROR ---
-        # 1. Copia todos los argumentos de la URL
-        filters = request.args.copy()
-        
-        # 2. Usa .pop() para OBTENER y QUITAR 'page' del dict de filtros.
-        #    'filters' ya no tendrá la clave 'page'.
-        try:
-            page = int(filters.pop('page', 1))
-        except ValueError:
-            page = 1
-        # --- FIN DE LA CORRECIÓN ---
-
-        # Valores de los filtros
+        # Filtros de la URL, sin el cursor de paginación (sí viajan en los enlaces)
+        filters = {k: v for k, v in request.args.items() if k not in ('cursor', 'page') and v}
+        page_cursor = request.args.get('cursor')
+
         user_id = filters.get('user_id')
         category = filters.get('category')
         start_date = filters.get('start_date')
         end_date = filters.get('end_date')
         search_term = filters.get('search_term')
 
-        # Consulta base
-        query = ActivityLog.query.order_by(ActivityLog.timestamp.desc())
-
-        # Aplicar filtros
+        where_clauses = []
+        params = []
         if user_id:
-            query = query.filter(ActivityLog.user_id == user_id)
+            where_clauses.append("l.user_id = %s")
+            params.append(user_id)
         if category:
-            query = query.filter(ActivityLog.category == category)
+            where_clauses.append("l.category = %s")
+            params.append(category)
         if start_date:
-            query = query.filter(ActivityLog.timestamp >= start_date)
+            where_clauses.append("l.timestamp >= %s")
+            params.append(start_date)
         if end_date:
             # Añadimos +1 día al end_date para incluir todo el día
-            from datetime import datetime, timedelta
             end_date_dt = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
-            query = query.filter(ActivityLog.timestamp < end_date_dt)
-        if search_term:
-            like_term = f"%{search_term}%"
-            query = query.filter(
-                or_(
-                    ActivityLog.action.like(like_term),
-                    ActivityLog.details.like(like_term),
-                    ActivityLog.resource_id.like(like_term)
-                )
-            )
-
-        # Cargar datos para los <select> del formulario
-        users = User.query.order_by(User.username).all()
-        # Obtener categorías únicas
-        categories_db = db.session.query(ActivityLog.category).distinct().order_by(ActivityLog.category).all()
-        categories = [c[0] for c in categories_db if c[0]] # Lista de strings
-
-        # Paginar la consulta
-        logs_pagination = query.paginate(page=page, per_page=50, error_out=False)
-
-        # Ahora 'filters' se puede pasar de forma segura a url_for
+            where_clauses.append("l.timestamp < %s")
+            params.append(end_date_dt)
+        busqueda = build_search_bitacora(search_term, 'l')
+        if busqueda:
+            where_clauses.append(busqueda.where)
+            params.extend(busqueda.params)
+
+        conn = get_db_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        logs = paginar_keyset(
+            cursor,
+            "SELECT l.id, l.timestamp, l.user_id, l.action, l.category, l.details, l.resource_id, u.username",
+            "FROM activity_log l LEFT JOIN user u ON u.id = l.user_id",
+            where_clauses, params, id_col='l.id', limit=50, token=page_cursor, cache_key='bitacora'
+        )
+
         return render_template(
-            'admin/activity_log.html', 
-            logs=logs_pagination, 
-            users=users, 
-            categories=categories, 
-            filters=filters # Este dict ya no tiene 'page'
+            'admin/activity_log.html',
+            logs=logs,
+            users=catalogos.usuarios(),
+            categories=_categorias_filtro(cursor),
+            filters=filters
         )
 
     except Exception as e:
         traceback.print_exc()
         flash(f"Error al cargar la bitácora: {e}", "danger")
         return redirect(url_for('admin.admin_dashboard')) # O a donde prefieras
+    finally:
+        if conn:
+            conn.close()
+
+
+def _categorias_filtro(cursor):
+    categorias = _filtros_bitacora.get('categorias')
+    if categorias is None:
+        # DISTINCT sobre ix_activity_log_categoria_id (recorrido suelto del índice)
+        cursor.execute("SELECT DISTINCT category FROM activity_log WHERE category IS NOT NULL ORDER BY category")
+        categorias = [row['category'] for row in cursor.fetchall() if row['category']]
+        _filtros_bitacora.set('categorias', categorias)
+    return categorias
 
@@ -11,6 +11,7 @@ import pymysql
 # Se importan las funciones y variables de tus otros archivos
 from database import get_db_connection
 from log_activity import log_activity
+import catalogos
 
 admin_users_bp = Blueprint('admin_users', __name__, url_prefix='/admin/users')
 
@@ -55,14 +56,8 @@ def permission_required(endpoint_name):
 @login_required
 @admin_required
 def list_roles():
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-
-        # La consulta no cambia
-        cursor.execute("SELECT id, name, description FROM role ORDER BY name")
-        roles = cursor.fetchall()
+        roles = catalogos.roles()
         
         # ✅ CAMBIO: Apunta a la nueva plantilla unificada
         return render_template('admin/admin_roles.html', roles=roles)
@@ -70,9 +65,6 @@ def list_roles():
     except Exception as e:
         flash(f"Error al listar roles: {e}", 'danger')
         return redirect(url_for('admin.admin_dashboard')) # Redirige al dashboard en caso de error
-    finally:
-       if conn:
-        conn.close() 
 
 @admin_users_bp.route('/roles/create', methods=['GET', 'POST'])
 @login_required
@@ -189,8 +181,7 @@ def create_user():
         conn = get_db_connection()
         cursor = conn.cursor(pymysql.cursors.DictCursor)
 
-        cursor.execute("SELECT id, name FROM role ORDER BY name")
-        all_roles = cursor.fetchall()
+        all_roles = catalogos.roles()
         
         if request.method == 'POST':
             # ... (tu lógica POST se queda exactamente igual) ...
@@ -275,8 +266,7 @@ def edit_user(user_id):
         if not user:
             abort(404)
         
-        cursor.execute("SELECT id, name FROM role ORDER BY name")
-        all_roles = cursor.fetchall()
+        all_roles = catalogos.roles()
         
         cursor.execute("SELECT role_id FROM user_roles WHERE user_id = %s", (user_id,))
         user_role_ids = {row['role_id'] for row in cursor.fetchall()}
@@ -376,8 +366,7 @@ def manage_permissions():
         # ✅ CAMBIO 1: Obtener el ID del rol desde los argumentos de la URL
         selected_role_id = request.args.get('role_id', type=int)
 
-        cursor.execute("SELECT id, name FROM role ORDER BY name")
-        all_roles = cursor.fetchall()
+        all_roles = catalogos.roles()
         cursor.execute("SELECT id, endpoint, description FROM permission ORDER BY endpoint")
         all_permissions = cursor.fetchall()
         
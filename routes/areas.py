@@ -10,6 +10,7 @@ from werkzeug.utils import secure_filename
 from decorators import permission_required
 from database import get_db_connection, get_db_connection, get_table_columns
 from log_activity import log_activity
+from catalogos import areas as catalogo_areas, respuesta_json
 import pymysql
 
 areas_bp = Blueprint('areas', __name__)
@@ -23,33 +24,12 @@ def get_areas():
     API route to fetch all unique areas (id and name) from the 'areas' table.
     Returns a JSON array of objects.
     """
-    conn = None
-    cursor = None
     try:
-        # Use a dictionary cursor to get results as key-value pairs
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Failed to connect to the database"}), 500
-        
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-        # Select both id and name from the areas table
-        cursor.execute("SELECT id, nombre FROM areas ORDER BY nombre ASC")
-        areas = cursor.fetchall()
-        
-        # The cursor returns a list of dictionaries, which is the format
-        # the frontend needs to populate the dropdown with both ID and name.
-        return jsonify(areas)
-    
-    except mysql.connector.Error as e:
-        print(f"Database error fetching areas: {e}")
-        return jsonify({"error": "Failed to fetch areas"}), 500
+        # Catálogo en memoria con ETag: el navegador revalida y casi siempre recibe 304
+        return respuesta_json('areas', campos=('id', 'nombre'))
     except Exception as e:
         print(f"Unexpected error: {e}")
         return jsonify({"error": "An unexpected error occurred"}), 500
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
 
 
 @areas_bp.route('/add_area', methods=['POST'])
@@ -174,10 +154,7 @@ def manage_areas():
             return redirect(url_for('areas.manage_areas'))
 
         else: # GET request
-            cursor.execute("SELECT id, nombre, numero FROM areas ORDER BY nombre ASC")
-            # El DictCursor hace que 'row' sea un diccionario
-            areas_data = cursor.fetchall() 
-            print(areas_data)
+            areas_data = catalogo_areas()
             return render_template('areas.html', areas=areas_data)
 
     # --- CORRECCIÓN 4: Manejo de errores de PyMySQL ---
@@ -12,8 +12,10 @@ import traceback
 import os
 from decorators import login_required, permission_required
 from werkzeug.utils import secure_filename
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, desc
 from log_activity import log_activity
+import area_stats
+from search import build_search
 from flask import send_from_directory, abort, send_file
 import json
 from .workflows import WORKFLOWS, DEFAULT_WORKFLOW
@@ -112,32 +114,21 @@ def buscar_bienes_para_baja():
         return jsonify({"error": "Parámetro de búsqueda 'q' es requerido"}), 400
     
     try:
-        # Campos en los que se realizará la búsqueda
-        searchable_fields = [
-            Bienes.No_Inventario, Bienes.Descripcion_Del_Bien,
-            Bienes.Descripcion_Corta_Del_Bien, Bienes.Marca,
-            Bienes.Modelo, Bienes.Numero_De_Serie
-        ]
-        
-        search_terms = query_string.split()
-        conditions = [
-            or_(*[field.ilike(f'%{term}%') for field in searchable_fields])
-            for term in search_terms
-        ]
+        # Búsqueda por el subsistema común; el modelo Bienes usa la tabla 'bienes' sin alias
+        busqueda = build_search(query_string, {'bienes': 'bienes'})
+        if not busqueda:
+            return jsonify([])
 
         # --- MODIFICADO: Se añade la nueva condición al filtro base ---
         # Construye la consulta para bienes activos que NO estén en un proceso de baja.
         query = db.session.query(Bienes).filter(
             Bienes.Activo == 1,
             Bienes.estatus_actual == 'Activo',
-            Bienes.proceso_baja_activo == None  # <-- LÍNEA AÑADIDA
+            Bienes.proceso_baja_activo == None,  # <-- LÍNEA AÑADIDA
+            busqueda.where_text()
         )
 
-        # Aplica todas las condiciones de búsqueda de texto
-        if conditions:
-            query = query.filter(and_(*conditions))
-        
-        bienes_encontrados = query.limit(50).all()
+        bienes_encontrados = query.order_by(desc(busqueda.score_text()), Bienes.id.desc()).limit(50).all()
 
         # Prepara la respuesta JSON
         resultado_json = []
@@ -518,6 +509,9 @@ def actualizar_estatus(proceso_id):
         # Actualiza el estatus del proceso y guarda todos los cambios
         proceso.estatus = nuevo_estatus
         db.session.commit()
+        if nuevo_estatus == 'Finalizado' and bien_a_dar_de_baja:
+            # El bien cambió a 'Baja': se recalcula el área de su resguardo activo
+            area_stats.refrescar(ids_bien=[bien_a_dar_de_baja.id])
 
         # Registra la actividad principal
         log_activity(
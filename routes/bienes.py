@@ -10,9 +10,13 @@ import pymysql.cursors
 
 # Se importan las funciones y variables de tus otros archivos
 from database import get_db_connection
+from pagination import paginar_keyset
+from search import build_search
 from config import UPLOAD_FOLDER, ALLOWED_EXTENSIONS
+from derivatives import programar_derivados
 from decorators import permission_required
 from log_activity import log_activity
+import area_stats
 from drive_service import (
     drive_service, 
     BIENES_FOLDER_ID, 
@@ -42,9 +46,8 @@ def listar_bienes():
         # CORRECCIÓN: PyMySQL usa DictCursor, no dictionary=True
         cursor = conn.cursor(pymysql.cursors.DictCursor)
 
-        page = request.args.get('page', 1, type=int)
         items_per_page = 100
-        offset = (page - 1) * items_per_page
+        page_cursor = request.args.get('cursor')
         search_query = request.args.get('search_query', '').strip()
         
         # --- CAMBIO: Se añaden más columnas para mostrar en la lista ---
@@ -57,42 +60,30 @@ def listar_bienes():
         """
         from_base = "FROM bienes b LEFT JOIN resguardos r ON b.id = r.id_bien AND r.Activo = 1 LEFT JOIN areas a ON r.id_area = a.id"
         
-        where_clause = ""
+        where_clauses = []
         params = []
-        if search_query:
-            # --- CAMBIO: Se amplía la búsqueda a más campos útiles ---
-            searchable_fields = [
-                'b.No_Inventario', 'b.Descripcion_Corta_Del_Bien', 'b.Marca', 
-                'b.Modelo', 'b.Numero_De_Serie', 'b.Clasificacion_Legal', 
-                'r.Nombre_Del_Resguardante', 'a.nombre'
-            ]
-            where_clause = " WHERE " + " OR ".join([f"{field} LIKE %s" for field in searchable_fields])
-            params.extend([f"%{search_query}%"] * len(searchable_fields))
-            
-        count_query = f"SELECT COUNT(DISTINCT b.id) AS total {from_base} {where_clause}"
-        cursor.execute(count_query, tuple(params))
-        total_items = cursor.fetchone()['total']
-        total_pages = math.ceil(total_items / items_per_page)
-
-        # Se añaden los parámetros de paginación después del conteo
-        final_params = params + [items_per_page, offset]
+        # Búsqueda por el subsistema común (FULLTEXT + prefijos de No_Inventario/No_Resguardo)
+        busqueda = build_search(search_query, {'bienes': 'b', 'resguardos': 'r', 'areas': 'a'})
+        if busqueda:
+            where_clauses.append(busqueda.where)
+            params.extend(busqueda.params)
 
-        sql_query = f"""
-            {select_base}
-            {from_base}
-            {where_clause}
-            GROUP BY b.id
-            ORDER BY b.id DESC
-            LIMIT %s OFFSET %s
-        """
-        cursor.execute(sql_query, tuple(final_params))
-        bienes_data = cursor.fetchall()
+        # Paginación por llave sobre b.id (sin OFFSET); el total se cachea
+        pagina = paginar_keyset(
+            cursor, select_base, from_base, where_clauses, params,
+            id_col='b.id', limit=items_per_page, token=page_cursor,
+            count_expr='COUNT(DISTINCT b.id)', group_by='b.id', cache_key='bienes'
+        )
+        bienes_data = pagina.rows
         
         return render_template(
             'bienes/listar_bienes.html', 
             bienes=bienes_data, 
-            page=page, 
-            total_pages=total_pages,
+            page=pagina.page, 
+            total_pages=pagina.total_pages,
+            total_items=pagina.total_items,
+            next_cursor=pagina.next_cursor,
+            prev_cursor=pagina.prev_cursor,
             search_query=search_query
         )
         
@@ -185,6 +176,7 @@ def agregar_bien():
                     # 6. Crear la ruta relativa para la base de datos
                     # (ej: 'bienes/mi-archivo-uuid.jpg')
                     db_path = os.path.join('bienes', unique_filename)
+                    programar_derivados(save_path, db_path)
                     
                     # 7. Guardar la ruta relativa en la DB
                     cursor.execute("INSERT INTO imagenes_bien (id_bien, ruta_imagen) VALUES (%s, %s)", 
@@ -306,11 +298,14 @@ def editar_bien(bien_id):
                     
                     # 4. Definir ruta relativa para la BD (ej: 'bienes/foto.jpg')
                     db_path = os.path.join('bienes', unique_filename)
+                    programar_derivados(save_path, db_path)
                     
                     # 5. Insertar en BD
                     cursor.execute("INSERT INTO imagenes_bien (id_bien, ruta_imagen) VALUES (%s, %s)", 
                                    (bien_id, db_path))
 
+            # Valor en libros / estatus del bien cuentan en las estadísticas de su área
+            area_stats.refrescar_bienes(cursor, [bien_id])
             conn.commit()
             log_activity(
                 action="Edición de Bien", 
@@ -2,6 +2,7 @@
 from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required
 from database import get_db_connection
+from search import build_search
 from decorators import permission_required
 from pymysql.err import MySQLError
 import pymysql
@@ -33,9 +34,11 @@ def buscar_bienes():
         if not query_text:
             return jsonify([])
 
-        # Prepara la consulta para buscar en varias columnas
-        search_pattern = f"%{query_text}%"
-        sql_query = """
+        # Búsqueda por el subsistema común, ordenada por relevancia
+        busqueda = build_search(query_text, {'bienes': 'b', 'resguardos': 'r'})
+        if not busqueda:
+            return jsonify([])
+        sql_query = f"""
             SELECT
                 b.id AS id_bien,
                 r.id AS id_resguardo,
@@ -52,15 +55,12 @@ def buscar_bienes():
             JOIN
                 areas a ON r.id_area = a.id
             WHERE
-                
-                b.No_Inventario LIKE %s OR
-                b.Descripcion_Corta_Del_Bien LIKE %s OR
-                r.No_Resguardo LIKE %s OR
-                r.Nombre_Del_Resguardante LIKE %s
+                {busqueda.where}
+            ORDER BY {busqueda.score_sql} DESC, r.id DESC
             LIMIT 10
         """
         
-        cursor.execute(sql_query, (search_pattern, search_pattern, search_pattern, search_pattern))
+        cursor.execute(sql_query, busqueda.params + busqueda.score_params)
         results = cursor.fetchall()
         
         return jsonify(results)
@@ -1,5 +1,6 @@
 from flask import Blueprint, request, redirect, url_for, flash, session, render_template, jsonify, send_file
 import pandas as pd
+import os
 import uuid
 import traceback
 from datetime import datetime
@@ -8,120 +9,20 @@ import re
 from decimal import Decimal, InvalidOperation
 # Se importan las funciones y variables de tus otros archivos
 from database import get_db_connection
-from config import COLUMN_MAPPING, BIENES_COLUMNS, RESGUARDOS_COLUMNS, EXCEL_AREA_COL_NAME, FULL_DB_COLUMNS
+from config import COLUMN_MAPPING, BIENES_COLUMNS, RESGUARDOS_COLUMNS, EXCEL_AREA_COL_NAME, FULL_DB_COLUMNS, JOBS_FOLDER
 from decorators import permission_required
 from log_activity import log_activity
+import catalogos
+import area_stats
+from import_pipeline import importar_excel, contar_filas, convert_to_db_type, DATE_COLS, DECIMAL_COLS, INT_COLS
+from jobs import register_job, submit_job, JobError
+from routes.jobs import responder_job
 # CORRECCIÓN: Se añaden las importaciones que faltaban
 from flask_login import login_required, current_user
 import pymysql
 
 excel_import_bp = Blueprint('excel_import', __name__)
 
-# Columnas que se convertirán a FECHA (formato YYYY-MM-DD)
-# Columnas que se convertirán a FECHA (formato YYYY-MM-DD)
-# --- Definición de Tipos de Columna ---
-# IMPORTANTE: Estos son los nombres de las columnas de la BASE DE DATOS
-# (los 'values' de tu COLUMN_MAPPING)
-
-# Columnas que se convertirán a FECHA (formato YYYY-MM-DD)
-DATE_COLS = [
-    "Fecha_Poliza",
-    "Fecha_Factura",
-    "Fecha_Documento_Propiedad",
-    "Fecha_Adquisicion_Alta",
-    "Fecha_Resguardo"
-]
-
-# Columnas que se convertirán a NÚMERO DECIMAL (para dinero)
-DECIMAL_COLS = [
-    "Costo_Inicial",
-    "Depreciacion_Acumulada",
-    "Costo_Final",
-    "Valor_En_Libros"
-]
-
-# Columnas que se convertirán a NÚMERO ENTERO
-INT_COLS = [
-    "Cantidad",
-    "Tipo_De_Resguardo",
-    "No_Nomina_Trabajador"
-]
-
-
-def convert_to_db_type(db_col, value):
-    """
-    Limpia y convierte un valor de Excel al tipo de dato correcto 
-    para la base de datos (como string, Decimal, int, o None).
-    
-    :param db_col: El nombre de la columna (del encabezado de Excel).
-    :param value: El valor de la celda.
-    :return: El valor limpio y tipado.
-    """
-    
-    # 1. FILTRO UNIVERSAL DE NULOS
-    if pd.isna(value) or value is None or str(value).strip() == '':
-        return None
-
-    str_value = str(value).strip()
-
-    # 2. FILTRO DE FECHAS
-    if db_col in DATE_COLS:
-        
-        # Corrección para el error '1970-01-01'
-        if str_value == '0' or value == 0:
-            return None
-        
-        # --- ¡ESTA ES LA PARTE QUE SOLUCIONA TU ERROR! ---
-        # Primero: Intenta ver si es un número (serial de Excel como 45789)
-        if isinstance(value, (int, float)):
-            try:
-                # Convertir número de serie de Excel
-                return pd.to_datetime(value, unit='D', origin='1899-12-30').strftime('%Y-%m-%d')
-            except (ValueError, TypeError):
-                raise ValueError(f"Número de serie de fecha no válido: '{value}' en '{db_col}'")
-        
-        # Segundo: Si no es un número, intenta parsearlo como texto (ej. "24/10/2025")
-        try:
-            return pd.to_datetime(str_value, dayfirst=True).strftime('%Y-%m-%d')
-        except (ValueError, TypeError):
-            raise ValueError(f"Formato de fecha no válido: '{value}' en columna '{db_col}'")
-        # --- FIN DE LA CORRECCIÓN ---
-            
-    # 3. FILTRO DE NÚMEROS DECIMALES (Costos, Valores)
-    elif db_col in DECIMAL_COLS:
-        
-        cleaned_value = str_value.replace('$', '').replace(',', '').strip()
-        
-        if cleaned_value == '':
-            return None
-            
-        try:
-            return Decimal(cleaned_value)
-        except InvalidOperation:
-            raise ValueError(f"Formato de número decimal no válido: '{value}' en columna '{db_col}'")
-
-    # 4. FILTRO DE NÚMEROS ENTEROS (Cantidad, etc.)
-    elif db_col in INT_COLS:
-        
-        cleaned_value = str_value.replace(',', '').strip()
-        
-        if cleaned_value.endswith('.0'):
-            cleaned_value = cleaned_value[:-2]
-
-        if cleaned_value == '':
-            return None
-
-        try:
-            return int(cleaned_value)
-        except (ValueError, TypeError):
-            raise ValueError(f"Formato de número entero no válido: '{value}' en columna '{db_col}'")
-
-    # 5. FILTRO PARA TODO LO DEMÁS (Texto)
-    else:
-        # Devuelve el string limpio
-        return str_value
-
-
 def get_or_create_bien(cursor, bien_data):
     no_inventario = bien_data.get('No_Inventario')
     if not no_inventario:
@@ -189,206 +90,128 @@ def try_format_date_for_html(date_string):
         # Si falla, devuelve el string original para que el usuario pueda ver qué estaba mal
         return date_string
 
-@excel_import_bp.route('/upload_excel', methods=['POST'])
-@login_required
-@permission_required('excel_import.upload_excel')
-def upload_excel():
-    if 'excel_file' not in request.files or not request.files['excel_file'].filename:
-        flash("No se seleccionó ningún archivo.", 'danger')
-        return redirect(url_for('resguardos.crear_resguardo'))
-
-    file = request.files['excel_file']
+@register_job('importar_excel')
+def _job_importar_excel(ctx, ruta, nombre_archivo):
+    """Importación en segundo plano; el upload_id del lote es el id del trabajo."""
+    upload_id = ctx.job_id
     conn = None
-    inserted_count = 0
-    error_rows = []
-    upload_id = str(uuid.uuid4())
-    
-    # Registrar inicio de la actividad (SOLO si db está disponible)
     try:
-        from app import db  # Importar aquí para evitar errores
+        total_estimado = contar_filas(ruta)
+        conn = get_db_connection()
+        if not conn:
+            raise JobError("No se pudo conectar a la base de datos.")
+
+        def avance(filas, insertados, errores):
+            pct = filas * 100 // total_estimado if total_estimado else 0
+            ctx.progreso(min(pct, 99), f"{filas} filas procesadas: {insertados} insertadas, {errores} con error.")
+
+        # Lectura por bloques (openpyxl read_only) con escrituras en lote;
+        # cada bloque se confirma por separado.
+        resultado = importar_excel(conn, ruta, upload_id, ctx.user_id, progreso=avance)
+        inserted_count = resultado['insertados']
+        error_count = resultado['errores']
+
         log_activity(
-            action='INICIO_IMPORTACION_EXCEL',
+            action='ARCHIVO_LEIDO',
             category='IMPORTACION',
-            details=f"Usuario '{current_user.username}' inició importación desde archivo: {file.filename}",
+            details=f"Usuario '{current_user.username}' leyó el archivo {nombre_archivo}. Filas: {resultado['filas']}",
             resource_id=upload_id
-        ) 
-        db.session.commit()
-    except Exception as log_error:
-        print(f"Error inicial en log: {log_error}")
+        )
 
-    try:
-        df = pd.read_excel(file)
-        excel_headers_map = {str(col).upper().strip(): str(col) for col in df.columns}
-        conn = get_db_connection()  # ← MANTIENES tu conexión actual
-        cursor = conn.cursor(pymysql.cursors.DictCursor) 
-        
-        # Registrar lectura exitosa del archivo
-        try:
+        if inserted_count > 0:
             log_activity(
-                action='ARCHIVO_LEIDO',
+                action='DATOS_INSERTADOS',
                 category='IMPORTACION',
-                details=f"Usuario '{current_user.username}' leyó un archivo. Filas: {len(df)}, Columnas: {len(df.columns)}",
+                details=f"Usuario '{current_user.username}': {inserted_count} resguardos insertados exitosamente.",
                 resource_id=upload_id
             )
-            db.session.commit()
-        except Exception as log_error:
-            print(f"Error en log de archivo leído: {log_error}")
-        
-        for index, row in df.iterrows():
-            try:
-                bien_data = {}
-                resguardo_data = {}
-                
-                for excel_header, db_col in COLUMN_MAPPING.items():
-                    excel_col_name = excel_headers_map.get(excel_header.upper().strip())
-                    if excel_col_name and excel_col_name in row:
-                        value = row[excel_col_name]
-                        cleaned_value = convert_to_db_type(db_col, value)
-                        if db_col in BIENES_COLUMNS: bien_data[db_col] = cleaned_value
-                        elif db_col in RESGUARDOS_COLUMNS: resguardo_data[db_col] = cleaned_value
-                
-                id_bien = get_or_create_bien(cursor, bien_data)
-
-                # --- NUEVA VALIDACIÓN: Verificar si ya tiene resguardo activo ---
-                cursor.execute("SELECT id FROM resguardos WHERE id_bien = %s AND Activo = 1", (id_bien,))
-                existing_resguardo = cursor.fetchone()
-                
-                if existing_resguardo:
-                    # Si ya existe, lanzamos un error para que el bloque 'except' lo capture
-                    # y envíe esta fila a la tabla 'resguardo_errores'
-                    raise ValueError(f"El bien con ID {id_bien} (Inventario: {bien_data.get('No_Inventario')}) ya tiene un resguardo activo.")
-                # ---------------------------------------------------------------
-
-                area_name = row.get(excel_headers_map.get(EXCEL_AREA_COL_NAME.upper().strip()))
-                id_area = get_or_create_area(cursor, area_name)
-                if not id_area: raise ValueError("El campo 'Area' es obligatorio.")
-                
-                resguardo_data.update({'id_bien': id_bien, 'id_area': id_area, 'Activo': 1, 'usuario_id_registro': current_user.id})
-
-                cols = ', '.join(f"`{col}`" for col in resguardo_data.keys())
-                placeholders = ', '.join(['%s'] * len(resguardo_data))
-                query = f"INSERT INTO resguardos ({cols}) VALUES ({placeholders})"
-                
-                cursor.execute(query, tuple(resguardo_data.values()))
-                inserted_count += 1
 
-            except Exception as err:
-                error_msg = f"Error en fila {index + 2}: {err}"
-                error_row_data = {'upload_id': upload_id, 'error_message': error_msg}
-                
-                cursor.execute("DESCRIBE resguardo_errores")
-                error_table_cols = {col['Field'] for col in cursor.fetchall()}
-                
-                for excel_header, db_col in COLUMN_MAPPING.items():
-                    if db_col in error_table_cols:
-                        excel_col_name = excel_headers_map.get(excel_header.upper().strip())
-                        if excel_col_name and excel_col_name in row:
-                            value = row[excel_col_name]
-                            error_row_data[db_col] = str(value) if pd.notna(value) else None
-                
-                error_rows.append(error_row_data)
-                traceback.print_exc()
-
-        if inserted_count > 0: 
-            conn.commit()
-            # Registrar éxito en la inserción de datos
-            try:
-                log_activity(
-                    action='DATOS_INSERTADOS',
-                    category='IMPORTACION',
-                    details=f"Usuario '{current_user.username}': {inserted_count} resguardos insertados exitosamente.",
-                    resource_id=upload_id
-                )
-                db.session.commit()
-            except Exception as log_error:
-                print(f"Error en log de datos insertados: {log_error}")
-        
-        if error_rows:
-            error_cols_to_insert = list(error_rows[0].keys())
-            error_cols_sql = ', '.join(f"`{col}`" for col in error_cols_to_insert)
-            error_placeholders = ', '.join(['%s'] * len(error_cols_to_insert))
-            error_query = f"INSERT INTO resguardo_errores ({error_cols_sql}) VALUES ({error_placeholders})"
-            
-            error_values = [tuple(row.get(key) for key in error_cols_to_insert) for row in error_rows]
-            
-            cursor.executemany(error_query, error_values)
-            conn.commit()
-            session['upload_id'] = upload_id
-            
-            # Registrar errores encontrados
-            try:
-                log_activity(
-                    action='ERRORES_REGISTRADOS',
-                    category='IMPORTACION',
-                    details=f"Usuario '{current_user.username}': Se registraron {len(error_rows)} filas con problemas.",
-                    resource_id=upload_id
-                )
-                
-                log_activity(
-                    action='IMPORTACION_COMPLETADA_CON_ERRORES',
-                    category='IMPORTACION',
-                    details=f"Usuario '{current_user.username}': Importación completada. Exitosos: {inserted_count}, Errores: {len(error_rows)}",
-                    resource_id=upload_id
-                )
-                db.session.commit()
-            except Exception as log_error:
-                print(f"Error en log de errores: {log_error}")
-            
-            flash(f"Se importaron {inserted_count} resguardos y se omitieron {len(error_rows)} filas con errores. Por favor, revísalas.", 'warning')
-            return redirect(url_for('excel_import.handle_errors'))
-            
+        if error_count:
+            # Las filas con error ya quedaron en resguardo_errores
+            log_activity(
+                action='IMPORTACION_COMPLETADA_CON_ERRORES',
+                category='IMPORTACION',
+                details=f"Usuario '{current_user.username}': Importación completada. Exitosos: {inserted_count}, Errores: {error_count}",
+                resource_id=upload_id
+            )
+            resultado['mensaje'] = f"Se importaron {inserted_count} resguardos y se omitieron {error_count} filas con errores. Por favor, revísalas."
         elif inserted_count > 0:
-            flash(f"Se importaron {inserted_count} resguardos exitosamente.", 'success')
-            # Registrar finalización exitosa
-            try:
-                log_activity(
-                    action='IMPORTACION_COMPLETADA_EXITOSA',
-                    category='IMPORTACION',
-                    details=f"Usuario '{current_user.username}': Importación completada exitosamente. Total resguardos: {inserted_count}",
-                    resource_id=upload_id
-                )
-                db.session.commit()
-            except Exception as log_error:
-                print(f"Error en log de éxito: {log_error}")
-            
+            log_activity(
+                action='IMPORTACION_COMPLETADA_EXITOSA',
+                category='IMPORTACION',
+                details=f"Usuario '{current_user.username}': Importación completada exitosamente. Total resguardos: {inserted_count}",
+                resource_id=upload_id
+            )
+            resultado['mensaje'] = f"Se importaron {inserted_count} resguardos exitosamente."
         else:
-            flash("No se encontraron filas válidas para importar en el archivo.", 'info')
-            # Registrar que no había datos válidos
-            try:
-                log_activity(
-                    action='IMPORTACION_SIN_DATOS_VALIDOS',
-                    category='IMPORTACION',
-                    details=f"Usuario '{current_user.username}': El archivo no contenía filas válidas para importar.",
-                    resource_id=upload_id
-                )
-                db.session.commit()
-            except Exception as log_error:
-                print(f"Error en log sin datos: {log_error}")
-
-    except Exception as e:
-        if conn: 
-            conn.rollback()
-        
-        # Registrar error fatal
-        try:
             log_activity(
-                action='ERROR_FATAL_IMPORTACION',
+                action='IMPORTACION_SIN_DATOS_VALIDOS',
                 category='IMPORTACION',
-                details=f"Usuario '{current_user.username}': Error fatal al procesar archivo: {str(e)}",
+                details=f"Usuario '{current_user.username}': El archivo no contenía filas válidas para importar.",
                 resource_id=upload_id
             )
-            db.session.commit()
-        except Exception as log_error:
-            print(f"Error en log fatal: {log_error}")
-        
-        flash(f"Error fatal al procesar el archivo: {e}", 'danger')
-        traceback.print_exc()
-        
+            resultado['mensaje'] = "No se encontraron filas válidas para importar en el archivo."
+        return resultado
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        log_activity(
+            action='ERROR_FATAL_IMPORTACION',
+            category='IMPORTACION',
+            details=f"Usuario '{current_user.username}': Error fatal al procesar archivo: {str(e)}",
+            resource_id=upload_id
+        )
+        if isinstance(e, JobError):
+            raise
+        raise JobError(f"Error fatal al procesar el archivo: {e}. Los bloques anteriores al error sí se guardaron.")
     finally:
-        if conn: 
+        if conn:
             conn.close()
-    
-    return redirect(url_for('resguardos.crear_resguardo'))
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+
+@excel_import_bp.route('/upload_excel', methods=['POST'])
+@login_required
+@permission_required('excel_import.upload_excel')
+def upload_excel():
+    if 'excel_file' not in request.files or not request.files['excel_file'].filename:
+        flash("No se seleccionó ningún archivo.", 'danger')
+        return redirect(url_for('resguardos.crear_resguardo'))
+
+    file = request.files['excel_file']
+    upload_id = str(uuid.uuid4())
+
+    # El archivo se guarda en disco y la importación corre como trabajo en
+    # segundo plano; la petición responde de inmediato.
+    ruta = os.path.join(JOBS_FOLDER, f"importacion_{upload_id}.xlsx")
+    try:
+        os.makedirs(JOBS_FOLDER, exist_ok=True)
+        file.save(ruta)
+        log_activity(
+            action='INICIO_IMPORTACION_EXCEL',
+            category='IMPORTACION',
+            details=f"Usuario '{current_user.username}' inició importación desde archivo: {file.filename}",
+            resource_id=upload_id
+        )
+        submit_job(
+            'importar_excel',
+            {'ruta': ruta, 'nombre_archivo': file.filename},
+            user_id=current_user.id,
+            job_id=upload_id,
+            base_url=request.host_url
+        )
+    except Exception as e:
+        traceback.print_exc()
+        if os.path.exists(ruta):
+            os.remove(ruta)
+        flash(f"No se pudo iniciar la importación: {e}", 'danger')
+        return redirect(url_for('resguardos.crear_resguardo'))
+
+    # handle_errors sigue encontrando el lote en la sesión
+    session['upload_id'] = upload_id
+    return responder_job(upload_id, "La importación se está procesando en segundo plano.")
 
 
 @excel_import_bp.route('/handle_errors')
@@ -517,6 +340,7 @@ def edit_error_row(error_id):
                 query = f"INSERT INTO resguardos ({cols}) VALUES ({placeholders})"
                 
                 cursor.execute(query, tuple(resguardo_data.values()))
+                area_stats.refrescar_areas(cursor, [id_area])
                 
                 cursor.execute("DELETE FROM resguardo_errores WHERE id = %s", (error_id,))
                 
@@ -527,8 +351,7 @@ def edit_error_row(error_id):
             except Exception as err:
                 conn.rollback()
                 flash(f"Error al guardar la corrección: {err}", 'danger')
-                cursor.execute("SELECT nombre FROM areas ORDER BY nombre")
-                areas = [row['nombre'] for row in cursor.fetchall()]
+                areas = [area['nombre'] for area in catalogos.areas()]
                 return render_template('excel_import/edit_error_row.html', error_data=form_data, error_id=error_id, areas=areas)
 
         # Lógica para mostrar el formulario (GET)
@@ -543,8 +366,7 @@ def edit_error_row(error_id):
         error_data['Fecha_Poliza'] = try_format_date_for_html(error_data.get('Fecha_Poliza'))
         error_data['Fecha_Factura'] = try_format_date_for_html(error_data.get('Fecha_Factura'))
 
-        cursor.execute("SELECT nombre FROM areas ORDER BY nombre")
-        areas = [row['nombre'] for row in cursor.fetchall()]
+        areas = [area['nombre'] for area in catalogos.areas()]
         
         return render_template('excel_import/edit_error_row.html', error_data=error_data, error_id=error_id, areas=areas)
 
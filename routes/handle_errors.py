@@ -6,6 +6,8 @@ import pymysql.cursors
 
 from config import FULL_DB_COLUMNS, VALID_DB_COLUMNS
 from database import get_db_connection
+import catalogos
+import area_stats
 
 # Asegúrate de importar tu función de conversión. 
 # Si está en otro archivo (ej. utils.py), ajusta esta línea:
@@ -206,6 +208,7 @@ def save_error_row(upload_id, row_id):
         query = f"INSERT INTO resguardos ({cols}) VALUES ({placeholders})" 
         
         cursor.execute(query, tuple(insert_data.values()))
+        area_stats.refrescar_resguardos(cursor, [cursor.lastrowid])
         
         cursor.execute("DELETE FROM resguardo_errores WHERE id = %s AND upload_id = %s", (row_id, upload_id))
         
@@ -358,6 +361,7 @@ def edit_error_row(error_id):
                     current_user.id
                 )
                 cursor.execute(sql_resguardo, vals_resguardo)
+                area_stats.refrescar_areas(cursor, [id_area])
 
                 # D) ÉXITO: ELIMINAR EL ERROR Y CONFIRMAR
                 cursor.execute("DELETE FROM resguardo_errores WHERE id = %s", (error_id,))
@@ -377,9 +381,7 @@ def edit_error_row(error_id):
         # --- LÓGICA GET: PREPARAR DATOS ---
         
         # Obtener lista de áreas para el select
-        cursor.execute("SELECT nombre FROM areas ORDER BY nombre ASC")
-        areas_db = cursor.fetchall()
-        areas_list = [a['nombre'] for a in areas_db]
+        areas_list = [a['nombre'] for a in catalogos.areas()]
 
         return render_template('excel_import/edit_error_row.html', 
                                error_id=error_id,
@@ -3,6 +3,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, make_response, Response
 from flask_login import login_required, current_user
 import traceback
+import json
 import math
 from datetime import datetime
 import os
@@ -10,19 +11,25 @@ import uuid
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
 from flask import Response
-from weasyprint import HTML
-from PIL import Image # Para detectar el tipo de imagen
-import base64
-import io
 from config import ALLOWED_EXTENSIONS
 # Se importan las funciones y variables de tus otros archivos
 from database import get_db_connection
 from decorators import permission_required
 from log_activity import log_activity
+import catalogos
+import area_stats
+import cedulas
+from pagination import paginar_keyset
+from query_cache import version_tablas
+from search import build_search
 from flask import jsonify
 import pymysql
 import pymysql.cursors
 from drive_service import drive_service, INVENTARIOS_FOLDER_ID, get_cached_image, save_to_cache
+from jobs import register_job, submit_job, job_activo, JobError
+from routes.jobs import responder_job
+from derivatives import programar_derivados
+from pdf_render import url_imagen_pdf, escribir_pdf_por_secciones
 
 
 inventarios_bp = Blueprint('inventarios', __name__, url_prefix='/inventarios')
@@ -79,7 +86,7 @@ def crear_inventario():
     
     GET: Muestra el formulario con las áreas y usuarios disponibles.
     POST: Procesa los datos del formulario, crea el inventario, asigna áreas y
-          brigada, y genera la cédula de levantamiento inicial.
+          brigada, y encola la generación de la cédula de levantamiento.
     """
     conn = None
     try:
@@ -102,17 +109,8 @@ def crear_inventario():
                 flash('Todos los campos son obligatorios. Por favor, complete toda la información.', 'warning')
                 # Si la validación falla, debemos recargar los datos para volver a mostrar el formulario
                 # Esta lógica es idéntica a la de la petición GET
-                sql_areas_con_detalle = """
-                    SELECT a.id, a.nombre, COUNT(DISTINCT r.id_bien) AS num_bienes,
-                           (SELECT r2.Nombre_Director_Jefe_De_Area FROM resguardos r2 WHERE r2.id_area = a.id AND r2.Nombre_Director_Jefe_De_Area IS NOT NULL LIMIT 1) AS jefe_de_area
-                    FROM areas a
-                    LEFT JOIN resguardos r ON a.id = r.id_area AND r.Activo = 1
-                    GROUP BY a.id, a.nombre ORDER BY a.nombre
-                """
-                cursor.execute(sql_areas_con_detalle)
-                areas = cursor.fetchall()
-                cursor.execute("SELECT id, username FROM user ORDER BY username")
-                users = cursor.fetchall()
+                areas = catalogos.area_stats()
+                users = catalogos.usuarios()
                 # Devolvemos el formulario con los datos que el usuario ya había ingresado
                 return render_template('inventarios/crear_inventario.html', areas=areas, users=users, form_data=form_data)
 
@@ -138,71 +136,31 @@ def crear_inventario():
             user_values = [(inventario_id, int(user_id)) for user_id in user_ids]
             cursor.executemany(sql_brigada, user_values)
             
-            # 6. Generar la "Cédula de Levantamiento" inicial (registros en 'inventario_detalle')
-            format_strings = ','.join(['%s'] * len(area_ids))
-            sql_bienes_a_inventariar = f"""
-                SELECT b.id, r.id AS resguardo_id, r.id_area, r.Nombre_Del_Resguardante
-                FROM bienes b
-                JOIN resguardos r ON b.id = r.id_bien
-                WHERE r.Activo = 1 
-                  AND r.id_area IN ({format_strings})
-                  AND r.Tipo_De_Resguardo = %s
-            """
-            query_params = tuple(area_ids) + (tipo_resguardo_int,)
-            cursor.execute(sql_bienes_a_inventariar, query_params)
-            bienes_en_areas = cursor.fetchall()
-            
-            if bienes_en_areas:
-                sql_detalle = """
-                    INSERT INTO inventario_detalle (
-                        id_inventario, id_bien, id_resguardo_esperado, id_area_esperada, 
-                        nombre_resguardante_esperado, estatus_hallazgo
-                    ) VALUES (%s, %s, %s, %s, %s, 'Pendiente')
-                """
-                detalle_values = [
-                    (inventario_id, bien['id'], bien['resguardo_id'], bien['id_area'], bien['Nombre_Del_Resguardante'])
-                    for bien in bienes_en_areas
-                ]
-                cursor.executemany(sql_detalle, detalle_values)
-
-            # 7. Confirmar todos los cambios en la base de datos
+            # 6. Confirmar el inventario; la cédula se genera aparte (ver cedulas.py)
             conn.commit()
             
             log_activity(
                     action="Creación de Inventario", 
                     category="Inventarios", 
                     resource_id=inventario_id, 
-                    details=f"Usuario '{current_user.username}' creó el inventario '{nombre}' con {len(bienes_en_areas)} bienes a verificar."
+                    details=f"Usuario '{current_user.username}' creó el inventario '{nombre}' con {len(area_ids)} áreas."
                 ) 
-            flash(f'Inventario "{nombre}" creado exitosamente.', 'success')
-            return redirect(url_for('inventarios.listar_inventarios'))
+
+            # 7. Generar la "Cédula de Levantamiento" inicial en segundo plano
+            try:
+                job_id = submit_job('generar_cedula_inventario', {'inventario_id': inventario_id},
+                                    user_id=current_user.id, base_url=request.host_url)
+            except Exception as e:
+                traceback.print_exc()
+                flash(f'Inventario "{nombre}" creado, pero no se pudo iniciar la generación de la cédula: {e}. '
+                      'Puede volver a lanzarla desde la gestión del inventario.', 'warning')
+                return redirect(url_for('inventarios.gestionar_inventario', inventario_id=inventario_id))
+            return responder_job(job_id, f'Inventario "{nombre}" creado. La cédula de levantamiento se está generando.')
 
         # --- LÓGICA GET: MOSTRAR EL FORMULARIO INICIAL ---
-        sql_areas_con_detalle = """
-                    SELECT 
-                        a.id, 
-                        a.nombre,
-                        (SELECT r2.Nombre_Director_Jefe_De_Area 
-                        FROM resguardos r2 
-                        WHERE r2.id_area = a.id AND r2.Nombre_Director_Jefe_De_Area IS NOT NULL 
-                        LIMIT 1) AS jefe_de_area,
-                        
-                        -- Contar bienes de resguardo normal (Tipo_De_Resguardo = 0)
-                        COUNT(DISTINCT CASE WHEN r.Tipo_De_Resguardo = 0 THEN r.id_bien END) AS num_bienes_normal,
-                        
-                        -- Contar bienes sujetos a control (Tipo_De_Resguardo = 1)
-                        COUNT(DISTINCT CASE WHEN r.Tipo_De_Resguardo = 1 THEN r.id_bien END) AS num_bienes_control
-                        
-                    FROM areas a
-                    LEFT JOIN resguardos r ON a.id = r.id_area AND r.Activo = 1
-                    GROUP BY a.id, a.nombre
-                    ORDER BY a.nombre
-                """
-        cursor.execute(sql_areas_con_detalle)
-        areas = cursor.fetchall()
-        
-        cursor.execute("SELECT id, username FROM user ORDER BY username")
-        users = cursor.fetchall()
+        # Conteos por área y brigadistas salen de los catálogos en memoria
+        areas = catalogos.area_stats()
+        users = catalogos.usuarios()
         
         return render_template('inventarios/crear_inventario.html', areas=areas, users=users, form_data={})
 
@@ -222,54 +180,196 @@ def crear_inventario():
         if conn:
             conn.close()
 
+@register_job('generar_cedula_inventario')
+def _job_generar_cedula(ctx, inventario_id):
+    """
+    Genera la cédula de levantamiento (inventario_detalle) con un INSERT ...
+    SELECT por área; ver cedulas.generar. Reanudable: las áreas ya generadas
+    se omiten.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise JobError("No se pudo conectar a la base de datos.")
+    try:
+        ctx.progreso(1, "Generando la cédula de levantamiento...")
+        resumen = cedulas.generar(
+            conn, inventario_id,
+            progreso=lambda hechas, total, bienes: ctx.progreso(
+                hechas * 100 / total, f"{hechas} de {total} áreas ({bienes} bienes)")
+        )
+    except ValueError as e:
+        raise JobError(str(e))
+    finally:
+        conn.close()
+
+    log_activity(
+        action="Generación de Cédula",
+        category="Inventarios",
+        resource_id=inventario_id,
+        details=f"Cédula del inventario {inventario_id}: {resumen['bienes']} bienes a verificar "
+                f"en {resumen['areas']} áreas ({resumen['omitidas']} ya generadas)."
+    )
+    return {
+        'mensaje': f"Cédula generada: {resumen['bienes']} bienes a verificar en {resumen['areas']} áreas.",
+        'bienes': resumen['bienes'],
+        'areas': resumen['areas'],
+        'url': url_for('inventarios.gestionar_inventario', inventario_id=inventario_id),
+    }
+
+
+@inventarios_bp.route('/cedula/simular', methods=['POST'])
+@login_required
+@permission_required('inventarios.crear_inventario')
+def simular_cedula():
+    """
+    Simulación de la cédula para el formulario de creación: bienes que se
+    generarían por área con las áreas y el tipo de resguardo elegidos, sin
+    escribir nada.
+    """
+    datos = request.get_json(silent=True) or request.form
+    area_ids = datos.getlist('area_ids') if hasattr(datos, 'getlist') else datos.get('area_ids', [])
+    tipo_resguardo = datos.get('Tipo_De_Resguardo')
+    if not area_ids or tipo_resguardo in (None, ''):
+        return jsonify({'error': 'Seleccione al menos un área y el tipo de resguardo.'}), 400
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        conteos = cedulas.contar(cursor, area_ids, tipo_resguardo)
+        nombres = {area['id']: area['nombre'] for area in catalogos.areas()}
+        por_area = [{'id': area_id, 'nombre': nombres.get(area_id), 'bienes': bienes}
+                    for area_id, bienes in conteos.items()]
+        return jsonify({'por_area': por_area, 'total': sum(conteos.values())})
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Parámetros inválidos.'}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': f'Error de servidor: {e}'}), 500
+    finally:
+        if conn:
+            conn.close()
+
+
+@inventarios_bp.route('/<int:inventario_id>/cedula/generar', methods=['POST'])
+@login_required
+@permission_required('inventarios.gestionar_inventario')
+def generar_cedula(inventario_id):
+    """Vuelve a lanzar la generación de la cédula (completa las áreas que falten)."""
+    job_id = job_activo('generar_cedula_inventario', inventario_id=inventario_id)
+    if job_id:
+        return responder_job(job_id, "La cédula de este inventario ya se está generando.")
+    try:
+        job_id = submit_job('generar_cedula_inventario', {'inventario_id': inventario_id},
+                            user_id=current_user.id, base_url=request.host_url)
+    except Exception as e:
+        traceback.print_exc()
+        flash(f'No se pudo iniciar la generación de la cédula: {e}', 'danger')
+        return redirect(url_for('inventarios.gestionar_inventario', inventario_id=inventario_id))
+    return responder_job(job_id, "La cédula de levantamiento se está generando en segundo plano.")
+
+ESTATUS_HALLAZGO = ('Pendiente', 'Localizado', 'No Localizado', 'Localizado con Discrepancia')
+DETALLES_POR_PAGINA = 50
+DETALLES_POR_PAGINA_MAX = 200
+
+# from de la cédula; resguardos aporta el resguardante a la búsqueda
+FROM_DETALLES = """
+    FROM inventario_detalle d
+    JOIN bienes b ON d.id_bien = b.id
+    LEFT JOIN resguardos r ON d.id_resguardo_esperado = r.id
+"""
+
+
+def _filtros_detalle(inventario_id, args):
+    """
+    Condiciones comunes del resumen por área y de las páginas de detalles:
+    ?estatus= (estatus_hallazgo) y ?q= (búsqueda por inventario, descripción
+    o resguardante). Devuelve (where_clauses, params); ValueError si el
+    estatus no es válido.
+    """
+    where_clauses = ["d.id_inventario = %s"]
+    params = [inventario_id]
+    estatus = (args.get('estatus') or '').strip()
+    if estatus:
+        if estatus not in ESTATUS_HALLAZGO:
+            raise ValueError(f"Estatus de hallazgo inválido: {estatus}")
+        where_clauses.append("d.estatus_hallazgo = %s")
+        params.append(estatus)
+    busqueda = build_search(args.get('q', ''), {'bienes': 'b', 'resguardos': 'r'})
+    if busqueda:
+        where_clauses.append(busqueda.where)
+        params.extend(busqueda.params)
+    return where_clauses, params
+
+
+def _resumen_areas(cursor, inventario_id, args):
+    """Conteos por área y estatus de la cédula (con los filtros de `args`), ordenados por nombre."""
+    where_clauses, params = _filtros_detalle(inventario_id, args)
+    # Sin búsqueda basta el índice (id_inventario, id_area_esperada, estatus_hallazgo)
+    from_sql = FROM_DETALLES if args.get('q', '').strip() else "FROM inventario_detalle d"
+    cursor.execute(f"""
+        SELECT
+            d.id_area_esperada AS id,
+            COUNT(*) AS total,
+            SUM(d.estatus_hallazgo = 'Pendiente') AS pendientes,
+            SUM(d.estatus_hallazgo = 'Localizado') AS localizados,
+            SUM(d.estatus_hallazgo = 'No Localizado') AS no_localizados,
+            SUM(d.estatus_hallazgo = 'Localizado con Discrepancia') AS discrepancias
+        {from_sql}
+        WHERE {' AND '.join(where_clauses)}
+        GROUP BY d.id_area_esperada
+    """, tuple(params))
+    conteos = cursor.fetchall()
+
+    # Nombre y jefe de área salen de los catálogos en memoria
+    stats = {area['id']: area for area in catalogos.area_stats()}
+    resumen = []
+    for fila in conteos:
+        area = stats.get(fila['id'], {})
+        resumen.append({
+            'id': fila['id'],
+            'nombre': area.get('nombre') or f"Área {fila['id']}",
+            'jefe_de_area': area.get('jefe_de_area'),
+            'total': int(fila['total']),
+            'pendientes': int(fila['pendientes'] or 0),
+            'localizados': int(fila['localizados'] or 0),
+            'no_localizados': int(fila['no_localizados'] or 0),
+            'discrepancias': int(fila['discrepancias'] or 0),
+        })
+    resumen.sort(key=lambda area: area['nombre'])
+    return resumen
+
+
 @inventarios_bp.route('/gestionar/<int:inventario_id>')
 @login_required
 @permission_required('inventarios.gestionar_inventario') # Permiso para gestionar inventarios
 def gestionar_inventario(inventario_id):
+    """
+    Página de gestión. Sólo trae el resumen por área; los bienes de cada área
+    se piden al abrir su acordeón (detalles_area_inventario).
+    """
     conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(pymysql.cursors.DictCursor) 
         
-        cursor.execute("SELECT id, nombre FROM areas ORDER BY nombre ASC")
-        todas_las_areas = cursor.fetchall()
+        todas_las_areas = catalogos.areas()
 
         cursor.execute("SELECT * FROM inventarios WHERE id = %s", (inventario_id,))
         inventario = cursor.fetchone()
         if not inventario:
             flash("El inventario no existe.", "danger")
             return redirect(url_for('inventarios.listar_inventarios'))
-            
-        # --- ¡CAMBIO IMPORTANTE EN LA CONSULTA SQL! ---
-        # Se une con 'resguardos' para obtener el Nombre_Director_Jefe_De_Area
-        sql_detalles = """
-            SELECT 
-                d.*, 
-                b.No_Inventario, b.Descripcion_Del_Bien,
-                a.nombre AS nombre_area,
-                r.Nombre_Director_Jefe_De_Area  -- <-- Se añade este campo
-            FROM inventario_detalle d
-            JOIN bienes b ON d.id_bien = b.id
-            JOIN areas a ON d.id_area_esperada = a.id
-            LEFT JOIN resguardos r ON d.id_resguardo_esperado = r.id -- <-- Se añade este JOIN
-            WHERE d.id_inventario = %s
-            ORDER BY a.nombre, b.No_Inventario
-        """
-        cursor.execute(sql_detalles, (inventario_id,))
-        detalles_list = cursor.fetchall()
-
-        # El resto de la función no necesita cambios
-        detalles_agrupados = {}
-        for detalle in detalles_list:
-            nombre_area = detalle['nombre_area']
-            if nombre_area not in detalles_agrupados:
-                detalles_agrupados[nombre_area] = []
-            detalles_agrupados[nombre_area].append(detalle)
+
+        areas_resumen = _resumen_areas(cursor, inventario_id, {})
+        # Mientras la cédula se genera no se ofrece regenerarla ni comenzar el levantamiento
+        cedula_job = (job_activo('generar_cedula_inventario', inventario_id=inventario_id)
+                      if inventario['estatus'] == 'Planificado' else None)
         
         cursor.execute("SELECT * FROM inventario_sobrantes WHERE id_inventario = %s", (inventario_id,))
         sobrantes = cursor.fetchall()
 
-        # 1. Obtener la brigada actual (asumiendo que ya lo haces para tu plantilla)
+        # 1. Obtener la brigada actual
         cursor.execute("""
             SELECT u.id, u.username, u.nombres AS full_name
             FROM user u
@@ -279,22 +379,20 @@ def gestionar_inventario(inventario_id):
         """, (inventario_id,))
         brigada_actual = cursor.fetchall()
         
-        # 2. Obtener usuarios que NO están en la brigada
-        cursor.execute("""
-            SELECT u.id, u.username, u.nombres AS full_name
-            FROM user u
-            WHERE u.id NOT IN (
-                SELECT ib.user_id FROM inventario_brigadas ib
-                WHERE ib.inventario_id = %s
-            )
-            ORDER BY u.nombres
-        """, (inventario_id,))
-        usuarios_disponibles = cursor.fetchall()
+        # 2. Usuarios que NO están en la brigada (del catálogo en memoria)
+        en_brigada = {miembro['id'] for miembro in brigada_actual}
+        usuarios_disponibles = sorted(
+            ({'id': u['id'], 'username': u['username'], 'full_name': u['nombres']}
+             for u in catalogos.usuarios() if u['id'] not in en_brigada),
+            key=lambda u: u['full_name'] or ''
+        )
 
         return render_template(
             'inventarios/gestionar_inventario.html',
             inventario=inventario,
-            detalles_agrupados=detalles_agrupados, 
+            areas_resumen=areas_resumen,
+            cedula_job=cedula_job,
+            estatus_hallazgo=ESTATUS_HALLAZGO,
             sobrantes=sobrantes,
             todas_las_areas=todas_las_areas,
             brigada=brigada_actual,
@@ -309,6 +407,71 @@ def gestionar_inventario(inventario_id):
         if conn :
             conn.close()
 
+
+@inventarios_bp.route('/<int:inventario_id>/areas', methods=['GET'])
+@login_required
+@permission_required('inventarios.gestionar_inventario')
+def resumen_areas_inventario(inventario_id):
+    """Conteos por área de la cédula en JSON. Acepta ?estatus= y ?q=."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        areas = _resumen_areas(cursor, inventario_id, request.args)
+        return jsonify({'areas': areas, 'total': sum(area['total'] for area in areas)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': f'Error de servidor: {e}'}), 500
+    finally:
+        if conn:
+            conn.close()
+
+
+@inventarios_bp.route('/<int:inventario_id>/areas/<int:area_id>/detalles', methods=['GET'])
+@login_required
+@permission_required('inventarios.gestionar_inventario')
+def detalles_area_inventario(inventario_id, area_id):
+    """
+    Bienes de la cédula de un área, paginados por llave sobre d.id
+    (?cursor= de la respuesta anterior). Acepta ?estatus=, ?q= y ?limit=.
+    """
+    conn = None
+    try:
+        limit = min(max(request.args.get('limit', DETALLES_POR_PAGINA, type=int), 1), DETALLES_POR_PAGINA_MAX)
+        where_clauses, params = _filtros_detalle(inventario_id, request.args)
+        where_clauses.append("d.id_area_esperada = %s")
+        params.append(area_id)
+
+        conn = get_db_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        # El total cacheado se descarta con cada commit sobre inventario_detalle
+        version = version_tablas(('inventario_detalle',))[0]
+        pagina = paginar_keyset(
+            cursor,
+            """SELECT d.id, d.id_inventario, d.estatus_hallazgo, d.nombre_resguardante_esperado,
+                      b.No_Inventario, b.Descripcion_Del_Bien""",
+            FROM_DETALLES, where_clauses, params,
+            id_col='d.id', limit=limit, token=request.args.get('cursor'),
+            cache_key=f'inventario_detalle:{version}'
+        )
+        return jsonify({
+            'items': pagina.rows,
+            'page': pagina.page,
+            'total_pages': pagina.total_pages,
+            'total_items': pagina.total_items,
+            'next_cursor': pagina.next_cursor,
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': f'Error de servidor: {e}'}), 500
+    finally:
+        if conn:
+            conn.close()
+
 # inventarios_routes.py
 # NUEVO ENDPOINT: Para obtener los datos de un detalle y sus fotos
 @inventarios_bp.route('/detalle/<int:detalle_id>', methods=['GET'])
@@ -466,6 +629,7 @@ def actualizar_detalle(detalle_id):
                     
                     # Ruta relativa para guardar en la BD (ej: inventarios/foto.jpg)
                     db_path = os.path.join('inventarios', unique_filename)
+                    programar_derivados(save_path, db_path)
                     
                     # Insertar registro en BD
                     sql_foto = "INSERT INTO inventario_fotos (id_inventario_detalle, ruta_archivo) VALUES (%s, %s)"
@@ -494,6 +658,157 @@ def actualizar_detalle(detalle_id):
             
     return redirect(url_for('inventarios.gestionar_inventario', inventario_id=inventario_id))
 
+VERIFICACION_LOTE_MAX = 500   # Detalles por petición de verificar_lote
+
+
+def _leer_lote():
+    """
+    Detalles enviados a verificar_lote: cuerpo JSON {"detalles": [...]} o,
+    con fotos, multipart con el mismo arreglo en el campo 'detalles' y las
+    fotos de cada bien en 'fotos_<detalle_id>'.
+    """
+    if request.is_json:
+        datos = request.get_json(silent=True) or {}
+        detalles = datos.get('detalles')
+    else:
+        try:
+            detalles = json.loads(request.form.get('detalles') or '[]')
+        except ValueError:
+            raise ValueError("El campo 'detalles' no es JSON válido.")
+    if not isinstance(detalles, list) or not detalles:
+        raise ValueError("No se enviaron detalles a verificar.")
+    if len(detalles) > VERIFICACION_LOTE_MAX:
+        raise ValueError(f"Se admiten hasta {VERIFICACION_LOTE_MAX} bienes por lote.")
+
+    lote = {}
+    for detalle in detalles:
+        try:
+            detalle_id = int(detalle['id'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Cada detalle debe indicar su 'id'.")
+        estatus = detalle.get('estatus_hallazgo')
+        if estatus not in ESTATUS_HALLAZGO:
+            raise ValueError(f"Estatus de hallazgo inválido en el detalle {detalle_id}: {estatus}")
+        # Si un bien se repite, vale la última captura
+        lote[detalle_id] = (estatus, detalle.get('condicion_fisica'), detalle.get('observaciones'))
+    return lote
+
+
+@inventarios_bp.route('/<int:inventario_id>/verificar-lote', methods=['POST'])
+@login_required
+@permission_required('inventarios.actualizar_detalle')
+def verificar_lote(inventario_id):
+    """
+    Verificación de muchos bienes en una sola petición (brigadas que recorren
+    un área completa). Valida una vez la brigada y el estatus del inventario,
+    aplica todas las actualizaciones con executemany en una transacción y deja
+    un solo registro en la bitácora. Responde JSON.
+    """
+    try:
+        lote = _leer_lote()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    base_upload_folder = current_app.config.get('UPLOAD_FOLDER')
+    if not base_upload_folder:
+        return jsonify({'error': 'El directorio de subidas (UPLOAD_FOLDER) no está configurado.'}), 500
+    inventarios_dir = os.path.join(base_upload_folder, 'inventarios')
+
+    conn = None
+    guardadas = []   # (ruta física, ruta relativa) de las fotos escritas en esta petición
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+
+        # --- Brigada y estatus del inventario en una sola consulta ---
+        cursor.execute("""
+            SELECT i.estatus,
+                   EXISTS(SELECT 1 FROM inventario_brigadas ib
+                          WHERE ib.inventario_id = i.id AND ib.user_id = %s) AS es_miembro
+            FROM inventarios i WHERE i.id = %s
+        """, (current_user.id, inventario_id))
+        inventario = cursor.fetchone()
+        if not inventario:
+            return jsonify({'error': 'Inventario no encontrado.'}), 404
+        if not inventario['es_miembro']:
+            return jsonify({'error': 'No eres parte de la brigada asignada a este inventario.'}), 403
+        if inventario['estatus'] != 'En Progreso':
+            return jsonify({'error': 'El inventario no está en la fase de "Levantamiento Físico".'}), 409
+
+        # --- Todos los detalles deben pertenecer al inventario ---
+        ids = sorted(lote)
+        cursor.execute(
+            f"SELECT id FROM inventario_detalle WHERE id_inventario = %s AND id IN ({','.join(['%s'] * len(ids))})",
+            (inventario_id, *ids)
+        )
+        ajenos = set(ids) - {fila['id'] for fila in cursor.fetchall()}
+        if ajenos:
+            return jsonify({'error': 'Hay detalles que no pertenecen a este inventario.',
+                            'detalles': sorted(ajenos)}), 400
+
+        # --- Actualización en una transacción (condición y observaciones omitidas se conservan) ---
+        ahora = datetime.now()
+        cursor.executemany("""
+            UPDATE inventario_detalle SET
+                estatus_hallazgo = %s,
+                condicion_fisica_reportada = COALESCE(%s, condicion_fisica_reportada),
+                observaciones = COALESCE(%s, observaciones),
+                id_usuario_verificador = %s, fecha_verificacion = %s
+            WHERE id = %s
+        """, [(estatus, condicion, observaciones, current_user.id, ahora, detalle_id)
+              for detalle_id, (estatus, condicion, observaciones) in lote.items()])
+
+        # --- Fotos opcionales: fotos_<detalle_id> ---
+        fotos_values = []
+        for detalle_id in ids:
+            for foto in request.files.getlist(f'fotos_{detalle_id}'):
+                if not (foto and foto.filename and allowed_file(foto.filename)):
+                    continue
+                os.makedirs(inventarios_dir, exist_ok=True)
+                unique_filename = f"inv-det-{uuid.uuid4()}-{secure_filename(foto.filename)}"
+                save_path = os.path.join(inventarios_dir, unique_filename)
+                db_path = os.path.join('inventarios', unique_filename)
+                foto.save(save_path)
+                guardadas.append((save_path, db_path))
+                fotos_values.append((detalle_id, db_path))
+        if fotos_values:
+            cursor.executemany(
+                "INSERT INTO inventario_fotos (id_inventario_detalle, ruta_archivo) VALUES (%s, %s)",
+                fotos_values
+            )
+
+        conn.commit()
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        # Las fotos de una transacción deshecha no deben quedar huérfanas en disco
+        for save_path, _ in guardadas:
+            try:
+                os.remove(save_path)
+            except OSError:
+                pass
+        traceback.print_exc()
+        return jsonify({'error': f'Error al verificar los bienes: {e}'}), 500
+    finally:
+        if conn:
+            conn.close()
+
+    for save_path, db_path in guardadas:
+        programar_derivados(save_path, db_path)
+
+    por_estatus = {}
+    for estatus, _, _ in lote.values():
+        por_estatus[estatus] = por_estatus.get(estatus, 0) + 1
+    log_activity(
+        action="Verificación por Lote",
+        category="Inventarios",
+        resource_id=inventario_id,
+        details=f"Usuario '{current_user.username}' verificó {len(lote)} bienes en el inventario ID: {inventario_id} ("
+                + ", ".join(f"{estatus}: {n}" for estatus, n in sorted(por_estatus.items()))
+                + f"; {len(guardadas)} fotos)."
+    )
+    return jsonify({'actualizados': len(lote), 'fotos': len(guardadas), 'por_estatus': por_estatus})
+
 @inventarios_bp.route('/<int:inventario_id>/finalizar', methods=['POST'])
 @login_required
 @permission_required('inventarios.finalizar_inventario') # Un nuevo permiso para esta acción
@@ -521,6 +836,7 @@ def finalizar_inventario(inventario_id):
                 UPDATE bienes SET estatus_actual = 'Faltante'
                 WHERE id IN ({format_strings})
             """, tuple(bienes_pendientes))
+            area_stats.refrescar_bienes(cursor, bienes_pendientes)
 
         # 3. Actualizar el estatus del inventario a 'Finalizado' y registrar la fecha de cierre.
         cursor.execute("""
@@ -580,6 +896,9 @@ def cambiar_estatus_inventario(inventario_id, accion):
         
         # 2. VALIDACIÓN DE TRANSICIÓN DE ESTADO
         if accion == 'comenzar' and current_status == 'Planificado':
+            if job_activo('generar_cedula_inventario', inventario_id=inventario_id):
+                flash('La cédula de levantamiento todavía se está generando. Espere a que termine para comenzar.', 'warning')
+                return redirect(url_for('inventarios.gestionar_inventario', inventario_id=inventario_id))
             nuevo_estatus = 'En Progreso'
             mensaje_log = 'El inventario ha cambiado a: En Progreso.'
         elif accion == 'conciliar' and current_status == 'En Progreso':
@@ -595,6 +914,7 @@ def cambiar_estatus_inventario(inventario_id, accion):
             if bienes_pendientes:
                 format_strings = ','.join(['%s'] * len(bienes_pendientes))
                 cursor.execute(f"UPDATE bienes SET estatus_actual = 'Faltante' WHERE id IN ({format_strings})", tuple(bienes_pendientes))
+                area_stats.refrescar_bienes(cursor, bienes_pendientes)
                 mensaje_log += f" {len(bienes_pendientes)} bienes marcados como faltantes."
         
         # 3. Si la transición no fue válida, mostramos un error.
@@ -710,6 +1030,7 @@ def agregar_sobrante(inventario_id):
                     
                     # Ruta relativa para BD
                     db_path = os.path.join('inventarios', unique_filename)
+                    programar_derivados(save_path, db_path)
                     
                     sql_foto = "INSERT INTO inventario_sobrante_fotos (id_inventario_sobrante, ruta_archivo) VALUES (%s, %s)"
                     write_cursor.execute(sql_foto, (sobrante_id, db_path))
@@ -793,7 +1114,7 @@ def generar_reporte(inventario_id):
                 ruta_bd = foto['ruta_archivo']
                 if ruta_bd:
                     # Usamos la función universal serve_uploaded_file definida en app.py
-                    url_imagen = url_for('serve_uploaded_file', filename=ruta_bd)
+                    url_imagen = url_for('serve_uploaded_file', filename=ruta_bd, size='report')
                     fotos_por_detalle[detalle_id].append(url_imagen)
 
         # 4. Procesar y clasificar los datos
@@ -845,7 +1166,7 @@ def generar_reporte(inventario_id):
                 
                 ruta_bd = foto['ruta_archivo']
                 if ruta_bd:
-                    url_imagen = url_for('serve_uploaded_file', filename=ruta_bd)
+                    url_imagen = url_for('serve_uploaded_file', filename=ruta_bd, size='report')
                     fotos_por_sobrante[sobrante_id].append(url_imagen)
 
         return render_template(
@@ -874,52 +1195,21 @@ def generar_reporte(inventario_id):
         if conn :
             conn.close()
 
-@inventarios_bp.route('/<int:inventario_id>/reporte/pdf')
-@login_required
-@permission_required('inventarios.descargar_reporte_pdf')
-def descargar_reporte_pdf(inventario_id):
+@register_job('reporte_pdf_inventario')
+def _job_reporte_pdf(ctx, inventario_id):
     """
-    Genera un reporte en PDF de un inventario, incrustando las imágenes
-    del almacenamiento LOCAL como Data URIs (Base64).
+    Genera un reporte en PDF de un inventario. Las fotos del almacenamiento
+    LOCAL se referencian con `pdfimg:` y se entregan reducidas a tamaño de
+    impresión (ver pdf_render). El documento se escribe por secciones para
+    acotar la memoria. Se ejecuta como trabajo en segundo plano; el PDF
+    queda en JOBS_FOLDER.
     """
-    
-    # --- Función helper interna para leer archivo local y convertir a Base64 ---
-    def _get_local_image_data_uri(relative_path):
-        if not relative_path: return None
-        
-        # Obtener la carpeta base de la configuración
-        base_folder = current_app.config.get('UPLOAD_FOLDER')
-        if not base_folder: return None
-        
-        # Construir ruta absoluta
-        full_path = os.path.join(base_folder, relative_path)
-        
-        if not os.path.exists(full_path):
-            print(f"PDF Warning: Imagen no encontrada en disco: {full_path}")
-            return None
-            
-        try:
-            with open(full_path, 'rb') as f:
-                image_bytes = f.read()
-            
-            # Detectar tipo MIME usando Pillow
-            try:
-                img = Image.open(io.BytesIO(image_bytes))
-                mime_type = Image.MIME.get(img.format, 'image/jpeg')
-            except Exception:
-                mime_type = 'image/jpeg' # Fallback
-            
-            encoded_string = base64.b64encode(image_bytes).decode('utf-8')
-            return f"data:{mime_type};base64,{encoded_string}"
-        except Exception as e:
-            print(f"Error procesando imagen para PDF {relative_path}: {e}")
-            return None
 
     # --- INICIO DE LA LÓGICA DE LA RUTA ---
     conn = None
     try:
         conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor) 
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
 
         fecha_generacion_reporte = datetime.now()
 
@@ -929,19 +1219,19 @@ def descargar_reporte_pdf(inventario_id):
         cursor.execute("SELECT * FROM inventarios WHERE id = %s", (inventario_id,))
         inventario = cursor.fetchone()
         if not inventario:
-            flash("Inventario no encontrado.", "danger")
-            return redirect(url_for('inventarios.listar_inventarios'))
+            raise JobError("Inventario no encontrado.")
+        ctx.progreso(5, "Consultando bienes del inventario...")
 
         sql_brigada_pdf = """
             SELECT u.username, u.nombres AS full_name, u.id
-            FROM user u 
-            JOIN inventario_brigadas ib ON u.id = ib.user_id 
-            WHERE ib.inventario_id = %s 
+            FROM user u
+            JOIN inventario_brigadas ib ON u.id = ib.user_id
+            WHERE ib.inventario_id = %s
             ORDER BY u.nombres
         """
         cursor.execute(sql_brigada_pdf, (inventario_id,))
         brigada = cursor.fetchall()
-        
+
         # 1b. Obtener todos los detalles de bienes
         sql_detalles = """
             SELECT d.*, b.No_Inventario, b.Descripcion_Del_Bien, b.Valor_En_Libros,
@@ -957,7 +1247,8 @@ def descargar_reporte_pdf(inventario_id):
         cursor.execute(sql_detalles, (inventario_id,))
         todos_los_detalles = cursor.fetchall()
 
-        # --- 1c. Obtener fotos de detalles (LOCAL) y convertir a Data URI ---
+        # --- 1c. Obtener fotos de detalles (LOCAL) ---
+        ctx.progreso(20, "Preparando evidencias fotográficas...")
         detalle_ids = [d['id'] for d in todos_los_detalles]
         fotos_por_detalle = {}
         if detalle_ids:
@@ -968,11 +1259,10 @@ def descargar_reporte_pdf(inventario_id):
                 detalle_id = foto['id_inventario_detalle']
                 if detalle_id not in fotos_por_detalle:
                     fotos_por_detalle[detalle_id] = []
-                
-                # Convertimos la ruta local relativa a Data URI
-                data_uri = _get_local_image_data_uri(foto['ruta_archivo'])
-                if data_uri:
-                    fotos_por_detalle[detalle_id].append(data_uri)
+
+                # La imagen se resuelve desde disco al escribir el PDF (pdf_render)
+                if foto['ruta_archivo']:
+                    fotos_por_detalle[detalle_id].append(url_imagen_pdf(foto['ruta_archivo']))
 
         # 1d. Procesar y clasificar los datos
         faltantes_por_area, discrepancias_por_area, correctos_por_area = {}, {}, {}
@@ -1006,7 +1296,7 @@ def descargar_reporte_pdf(inventario_id):
         """, (inventario_id,))
         bienes_sobrantes = cursor.fetchall()
 
-        # --- 1f. Obtener fotos de sobrantes (LOCAL) y convertir a Data URI ---
+        # --- 1f. Obtener fotos de sobrantes (LOCAL) ---
         sobrante_ids = [s['id'] for s in bienes_sobrantes]
         fotos_por_sobrante = {}
         if sobrante_ids:
@@ -1015,18 +1305,17 @@ def descargar_reporte_pdf(inventario_id):
             fotos_s = cursor.fetchall()
             for foto in fotos_s:
                 sobrante_id = foto['id_inventario_sobrante']
-                if sobrante_id not in fotos_por_sobrante: 
+                if sobrante_id not in fotos_por_sobrante:
                     fotos_por_sobrante[sobrante_id] = []
-                
-                data_uri = _get_local_image_data_uri(foto['ruta_archivo'])
-                if data_uri:
-                    fotos_por_sobrante[sobrante_id].append(data_uri)
+
+                if foto['ruta_archivo']:
+                    fotos_por_sobrante[sobrante_id].append(url_imagen_pdf(foto['ruta_archivo']))
 
 
         # --- SECCIÓN 2: GENERACIÓN DEL PDF ---
+        ctx.progreso(60, "Generando PDF...")
 
-        html_string = render_template(
-            'inventarios/reporte_inventario_pdf.html',
+        contexto = dict(
             fecha_generacion=fecha_generacion_reporte,
             inventario=inventario,
             area_jefe_map=area_jefe_map,
@@ -1038,26 +1327,80 @@ def descargar_reporte_pdf(inventario_id):
             bienes_sobrantes=bienes_sobrantes,
             bienes_revisados=bienes_revisados,
             fotos_por_detalle=fotos_por_detalle,
-            fotos_por_sobrante=fotos_por_sobrante
+            fotos_por_sobrante=fotos_por_sobrante,
+            total_discrepancias=sum(len(v) for v in discrepancias_por_area.values()),
+            total_revisados=len(bienes_revisados),
         )
 
-        # Convertir HTML a PDF (base_url ayuda a encontrar estilos estáticos)
-        pdf_file = HTML(string=html_string, base_url=request.base_url).write_pdf()
+        # Bitácora agrupada por área; cada grupo es una parte del PDF
+        revisados_por_area = {}
+        for detalle in bienes_revisados:
+            revisados_por_area.setdefault(detalle['nombre_area'] or 'Sin Área Asignada', []).append(detalle)
 
-        response = make_response(pdf_file)
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'inline; filename=reporte_{inventario.get("nombre", "inventario")}.pdf'
-        
-        return response
+        plantilla = 'inventarios/reporte_inventario_pdf.html'
+
+        def _partes():
+            """Genera el HTML de cada sección; sólo una está en memoria a la vez."""
+            yield render_template(plantilla, seccion='resumen', con_pie=False, **contexto)
+
+            grupos = list(discrepancias_por_area.items()) or [(None, [])]
+            for n, (area, lista) in enumerate(grupos):
+                parcial = dict(contexto, discrepancias_por_area={area: lista} if area else {})
+                yield render_template(plantilla, seccion='discrepancias', con_titulo=(n == 0),
+                                      con_pie=False, **parcial)
+
+            grupos = list(revisados_por_area.values()) or [[]]
+            for n, lista in enumerate(grupos):
+                parcial = dict(contexto, bienes_revisados=lista)
+                yield render_template(plantilla, seccion='bitacora', con_titulo=(n == 0),
+                                      con_pie=(n == len(grupos) - 1), **parcial)
+
+        total_partes = 1 + max(len(discrepancias_por_area), 1) + max(len(revisados_por_area), 1)
+
+        def _avance(n):
+            ctx.progreso(60 + int(35 * n / total_partes), f"Generando PDF ({n}/{total_partes} secciones)...")
 
+        ruta_pdf = ctx.archivo_resultado(f'reporte_{inventario.get("nombre", "inventario")}.pdf', 'application/pdf')
+        escribir_pdf_por_secciones(_partes(), ruta_pdf, request.base_url, progreso=_avance)
+
+        return {'bienes': len(todos_los_detalles), 'mensaje': "Reporte PDF generado."}
+
+    except JobError:
+        raise
     except Exception as e:
-        flash(f'Error al generar el PDF: {e}', 'danger')
         traceback.print_exc()
-        return redirect(url_for('inventarios.gestionar_inventario', inventario_id=inventario_id))
+        raise JobError(f'Error al generar el PDF: {e}')
     finally:
         if conn:
             conn.close()
 
+
+@inventarios_bp.route('/<int:inventario_id>/reporte/pdf')
+@login_required
+@permission_required('inventarios.descargar_reporte_pdf')
+def descargar_reporte_pdf(inventario_id):
+    """Encola la generación del PDF y muestra su progreso; al terminar se abre en el navegador."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute("SELECT id FROM inventarios WHERE id = %s", (inventario_id,))
+        if not cursor.fetchone():
+            flash("Inventario no encontrado.", "danger")
+            return redirect(url_for('inventarios.listar_inventarios'))
+    finally:
+        if conn:
+            conn.close()
+
+    try:
+        job_id = submit_job('reporte_pdf_inventario', {'inventario_id': inventario_id},
+                            user_id=current_user.id, base_url=request.host_url)
+    except Exception as e:
+        traceback.print_exc()
+        flash(f'No se pudo iniciar la generación del PDF: {e}', 'danger')
+        return redirect(url_for('inventarios.gestionar_inventario', inventario_id=inventario_id))
+    return responder_job(job_id, "El reporte PDF se está generando en segundo plano.")
+
 @inventarios_bp.route('/<int:inventario_id>/brigada/agregar', methods=['POST'])
 @login_required
 @permission_required('inventarios.gestionar_inventario') # O un permiso específico
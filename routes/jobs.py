@@ -0,0 +1,84 @@
+# routes/jobs.py
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, abort
+from flask_login import login_required, current_user
+import os
+
+from jobs import get_job
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+
+def _job_del_usuario(job_id):
+    """Devuelve el trabajo si pertenece al usuario actual (o es admin); 404 en otro caso."""
+    job = get_job(job_id)
+    if not job:
+        abort(404)
+    if job['id_usuario'] != current_user.id and not current_user.is_admin():
+        abort(404)
+    return job
+
+
+def _estado_json(job):
+    datos = {
+        'id': job['id'],
+        'tipo': job['tipo'],
+        'estatus': job['estatus'],
+        'progreso': job['progreso'],
+        'mensaje': job['mensaje'],
+        'resultado': job['resultado'],
+        'estado_url': url_for('jobs.estado_job', job_id=job['id']),
+        'descarga_url': None,
+    }
+    if job['estatus'] == 'Completado' and job['ruta_resultado']:
+        datos['descarga_url'] = url_for('jobs.descargar_resultado', job_id=job['id'])
+    return datos
+
+
+def responder_job(job_id, mensaje=None):
+    """
+    Respuesta común de las rutas que encolan un trabajo: 202 con el estado en
+    JSON para peticiones AJAX, o redirección a la página de progreso.
+    """
+    if request.accept_mimetypes.best == 'application/json' or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        job = get_job(job_id)
+        return jsonify(_estado_json(job)), 202
+    if mensaje:
+        flash(mensaje, 'info')
+    return redirect(url_for('jobs.ver_job', job_id=job_id))
+
+
+@jobs_bp.route('/<string:job_id>')
+@login_required
+def ver_job(job_id):
+    job = _job_del_usuario(job_id)
+    return render_template('jobs/estado_job.html', job=_estado_json(job))
+
+
+@jobs_bp.route('/<string:job_id>/estado')
+@login_required
+def estado_job(job_id):
+    job = _job_del_usuario(job_id)
+    return jsonify(_estado_json(job))
+
+
+@jobs_bp.route('/<string:job_id>/descargar')
+@login_required
+def descargar_resultado(job_id):
+    job = _job_del_usuario(job_id)
+    if job['estatus'] != 'Completado' or not job['ruta_resultado']:
+        flash("El resultado de este trabajo todavía no está disponible.", 'warning')
+        return redirect(url_for('jobs.ver_job', job_id=job_id))
+    if not os.path.exists(job['ruta_resultado']):
+        flash("El archivo generado ya expiró. Vuelve a generarlo.", 'warning')
+        return redirect(url_for('jobs.ver_job', job_id=job_id))
+
+    # Los PDF se muestran en el navegador como antes; el resto se descarga.
+    # send_file transmite el archivo por bloques desde disco y admite Range
+    # (descargas reanudables de exportaciones grandes).
+    return send_file(
+        job['ruta_resultado'],
+        mimetype=job['mimetype'],
+        download_name=job['nombre_descarga'],
+        as_attachment=job['mimetype'] != 'application/pdf',
+        conditional=True
+    )
@@ -1,22 +1,24 @@
-from flask import current_app, Blueprint, render_template, request, redirect, url_for, flash, send_file, jsonify
+from flask import current_app, Blueprint, render_template, request, redirect, url_for, flash, send_file, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user # Asume que tienes Flask-Login configurado
 import os
+import shutil
 import traceback
 import json
 from werkzeug.utils import secure_filename
-import pandas as pd
-from io import BytesIO
-from PIL import Image
 from config import UPLOAD_FOLDER # Asegúrate de que estos archivos existan
-from database import get_db_connection # Asegúrate de que este archivo exista
+from database import get_db_connection, get_image_paths_batch, IMAGE_IN_CHUNK_SIZE # Asegúrate de que este archivo exista
 from helpers import map_operator_to_sql
 from log_activity import log_activity # Asegúrate de que este archivo exista
-from decorators import permission_required # Asume que este decorador existe
+from decorators import permission_required, admin_required # Asume que este decorador existe
 import pymysql
-import io
 from drive_service import drive_service, get_cached_image, save_to_cache
+from jobs import register_job, submit_job, JobError
+from routes.jobs import responder_job
+from excel_export import escribir_excel_plantilla
+from tabular_export import generar_csv, escribir_parquet, parquet_disponible
+from query_cache import query_cache, clave_plantilla, version_tablas, TABLAS_PLANTILLAS
+from filter_compiler import FilterCompiler
 plantillas_bp = Blueprint('plantillas', __name__)
-import urllib.parse
 
 # EL CÓDIGO NUEVO (CORRECTO)
 # REEMPLAZA tu diccionario AVAILABLE_COLUMNS con este:
@@ -94,205 +96,130 @@ def map_operator_to_sql(operator):
     }
     return operator_map.get(operator)
 
-def get_filtered_resguardo_data(selected_columns, filters, limit=None):
+def _consulta_resguardos(selected_columns, filters, template_id=None):
     """
-    Versión corregida para almacenamiento local.
-    1. Usa build_where_clause para filtros complejos.
-    2. Genera URLs apuntando a 'serve_uploaded_file'.
-    3. Evita el error 'Unknown column Imagen_Path'.
+    Arma las partes del query de resguardos de una plantilla.
+    Devuelve (select_clause, from_where, params, special_columns); `from_where`
+    es el FROM con sus JOIN y el WHERE, para reutilizarlo en consultas agregadas.
     """
-    conn = None
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
+    safe_columns_clauses = []
+    special_columns = [] # Aquí guardaremos 'imagenPath_bien', etc.
 
-        # --- 1. Construcción segura del SELECT ---
-        safe_columns_clauses = []
-        special_columns = [] # Aquí guardaremos 'imagenPath_bien', etc.
+    # Siempre traemos los IDs ocultos para poder buscar las imágenes después
+    safe_columns_clauses.append("bienes.id AS `id_bien_hidden`")
+    safe_columns_clauses.append("resguardos.id AS `id_resguardo_hidden`")
 
-        # Siempre traemos los IDs ocultos para poder buscar las imágenes después
-        safe_columns_clauses.append("bienes.id AS `id_bien_hidden`")
-        safe_columns_clauses.append("resguardos.id AS `id_resguardo_hidden`")
+    for col in selected_columns:
+        if col in AVAILABLE_COLUMNS:
+            sql_name = AVAILABLE_COLUMNS[col]
 
-        for col in selected_columns:
-            if col in AVAILABLE_COLUMNS:
-                sql_name = AVAILABLE_COLUMNS[col]
-                
-                if sql_name is None:
-                    # Es una columna especial (imagen), NO la agregamos al SQL
-                    special_columns.append(col)
-                else:
-                    # Es una columna normal de la BD
-                    safe_columns_clauses.append(f"{sql_name} AS `{col}`")
-        
-        if not safe_columns_clauses:
-             return [], 0, 0
+            if sql_name is None:
+                # Es una columna especial (imagen), NO la agregamos al SQL
+                special_columns.append(col)
+            else:
+                # Es una columna normal de la BD
+                safe_columns_clauses.append(f"{sql_name} AS `{col}`")
 
-        select_clause = ", ".join(safe_columns_clauses)
+    where_sql, where_params = build_where_clause(filters, template_id)
 
-        # --- 2. Construcción del WHERE (Usando la función recursiva) ---
-        # Asegúrate de que 'build_where_clause' esté definida antes en tu archivo
-        where_sql, where_params = build_where_clause(filters)
+    from_where = "FROM bienes"
+    from_where += " LEFT JOIN resguardos ON bienes.id = resguardos.id_bien"
+    from_where += " LEFT JOIN areas ON resguardos.id_area = areas.id"
+    if where_sql:
+        from_where += f" WHERE {where_sql}"
 
-        # --- 3. Construcción del Query Principal ---
-        query = f"SELECT {select_clause} FROM bienes"
-        query += " LEFT JOIN resguardos ON bienes.id = resguardos.id_bien"
-        query += " LEFT JOIN areas ON resguardos.id_area = areas.id"
+    return ", ".join(safe_columns_clauses), from_where, list(where_params), special_columns
 
-        if where_sql:
-            query += f" WHERE {where_sql}"
-        
-        query += " ORDER BY bienes.id DESC"
-
-        if limit:
-            query += f" LIMIT {limit}"
-
-        # Ejecución
-        cursor.execute(query, where_params)
-        results = cursor.fetchall()
-
-        if not results:
-            return [], 0, 0
 
-        # --- 4. Inyección de Imágenes (LÓGICA LOCAL CORREGIDA) ---
-        max_bien_images = 0
-        max_resguardo_images = 0
+def resumen_exportacion(selected_columns, filters, template_id=None):
+    """
+    Total de filas y máximo de imágenes por tipo de una plantilla, con
+    consultas agregadas (sin traer las filas ni las rutas de imagen).
+    Devuelve (total_filas, max_bien_images, max_resguardo_images).
+    """
+    _, from_where, params, special_columns = _consulta_resguardos(selected_columns, filters, template_id)
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute(f"SELECT COUNT(*) AS total {from_where}", params)
+        total = cursor.fetchone()['total']
+
+        maximos = {}
+        for col, tabla, fk, id_sql in (('imagenPath_bien', 'imagenes_bien', 'id_bien', 'bienes.id'),
+                                       ('imagenPath_resguardo', 'imagenes_resguardo', 'id_resguardo', 'resguardos.id')):
+            maximos[col] = 0
+            if col in special_columns and total:
+                cursor.execute(f"""
+                    SELECT COALESCE(MAX(n), 0) AS maximo FROM (
+                        SELECT COUNT(*) AS n FROM {tabla}
+                        WHERE {fk} IN (SELECT {id_sql} {from_where})
+                        GROUP BY {fk}
+                    ) t
+                """, params)
+                maximos[col] = int(cursor.fetchone()['maximo'])
+        return total, maximos['imagenPath_bien'], maximos['imagenPath_resguardo']
+    finally:
+        conn.close()
 
-        # A) Imágenes de Bienes
-        if 'imagenPath_bien' in special_columns:
-            bien_ids = set()
-            for row in results:
-                bid = row.get('id_bien_hidden')
-                if bid: bien_ids.add(str(bid))
-            
-            if bien_ids:
-                format_strings = ','.join(['%s'] * len(bien_ids))
-                sql_img = f"""
-                    SELECT id_bien, GROUP_CONCAT(ruta_imagen) as rutas 
-                    FROM imagenes_bien 
-                    WHERE id_bien IN ({format_strings}) 
-                    GROUP BY id_bien
-                """
-                cursor.execute(sql_img, tuple(bien_ids))
-                
-                mapa_img = {}
-                for row_img in cursor.fetchall():
-                    rutas = row_img['rutas'].split(',') if row_img['rutas'] else []
-                    
-                    # --- CAMBIO CLAVE AQUÍ ---
-                    # Usamos 'serve_uploaded_file' en lugar de 'serve_drive_image'
-                    urls = [url_for('serve_uploaded_file', filename=r) for r in rutas]
-                    
-                    mapa_img[row_img['id_bien']] = urls
-                    if len(urls) > max_bien_images:
-                        max_bien_images = len(urls)
-
-                # Asignar a los resultados
-                for row in results:
-                    bid = row.get('id_bien_hidden')
-                    row['imagenPath_bien'] = mapa_img.get(bid, [])
 
-        # B) Imágenes de Resguardos
-        if 'imagenPath_resguardo' in special_columns:
-            res_ids = set()
-            for row in results:
-                rid = row.get('id_resguardo_hidden')
-                if rid: res_ids.add(str(rid))
-            
-            if res_ids:
-                format_strings = ','.join(['%s'] * len(res_ids))
-                sql_img = f"""
-                    SELECT id_resguardo, GROUP_CONCAT(ruta_imagen) as rutas 
-                    FROM imagenes_resguardo 
-                    WHERE id_resguardo IN ({format_strings}) 
-                    GROUP BY id_resguardo
-                """
-                cursor.execute(sql_img, tuple(res_ids))
-                
-                mapa_img = {}
-                for row_img in cursor.fetchall():
-                    rutas = row_img['rutas'].split(',') if row_img['rutas'] else []
-                    
-                    # --- CAMBIO CLAVE AQUÍ ---
-                    urls = [url_for('serve_uploaded_file', filename=r) for r in rutas]
-                    
-                    mapa_img[row_img['id_resguardo']] = urls
-                    if len(urls) > max_resguardo_images:
-                        max_resguardo_images = len(urls)
-
-                for row in results:
-                    rid = row.get('id_resguardo_hidden')
-                    row['imagenPath_resguardo'] = mapa_img.get(rid, [])
+def iter_filtered_resguardo_rows(selected_columns, filters, chunk_size=IMAGE_IN_CHUNK_SIZE, template_id=None):
+    """
+    Filas de la plantilla en streaming para las exportaciones:
+    lee las filas con un cursor del lado del servidor (SSDictCursor) y busca
+    las imágenes por bloques en una segunda conexión. Las listas
+    'imagenPath_bien' / 'imagenPath_resguardo' traen rutas relativas a
+    UPLOAD_FOLDER (no URLs).
+    """
+    select_clause, from_where, params, special_columns = _consulta_resguardos(selected_columns, filters, template_id)
+    query = f"SELECT {select_clause} {from_where} ORDER BY bienes.id DESC"
+    want_bien = 'imagenPath_bien' in special_columns
+    want_resguardo = 'imagenPath_resguardo' in special_columns
+
+    conn = get_db_connection()
+    conn_img = get_db_connection() if special_columns else None
+    cursor = None
+    try:
+        cursor = conn.cursor(pymysql.cursors.SSDictCursor)
+        cursor_img = conn_img.cursor(pymysql.cursors.DictCursor) if conn_img else None
+        cursor.execute(query, params)
+        while True:
+            bloque = cursor.fetchmany(chunk_size)
+            if not bloque:
+                break
+            if want_bien:
+                ids = [r['id_bien_hidden'] for r in bloque if r.get('id_bien_hidden')]
+                rutas_bien = get_image_paths_batch(cursor_img, 'imagenes_bien', 'id_bien', ids, chunk_size) if ids else {}
+            if want_resguardo:
+                ids = [r['id_resguardo_hidden'] for r in bloque if r.get('id_resguardo_hidden')]
+                rutas_resguardo = get_image_paths_batch(cursor_img, 'imagenes_resguardo', 'id_resguardo', ids, chunk_size) if ids else {}
+
+            for row in bloque:
+                bid = row.pop('id_bien_hidden', None)
+                rid = row.pop('id_resguardo_hidden', None)
+                if want_bien:
+                    row['imagenPath_bien'] = rutas_bien.get(bid, [])
+                if want_resguardo:
+                    row['imagenPath_resguardo'] = rutas_resguardo.get(rid, [])
+                yield row
+    finally:
+        if cursor:
+            cursor.close()  # Descarta lo que falte por leer del servidor
+        conn.close()
+        if conn_img:
+            conn_img.close()
 
-        # --- 5. Limpieza final (Opcional) ---
-        for row in results:
-            row.pop('id_bien_hidden', None)
-            row.pop('id_resguardo_hidden', None)
 
-        return results, max_bien_images, max_resguardo_images
+_compilador_filtros = FilterCompiler(AVAILABLE_COLUMNS)
 
-    except Exception as e:
-        print("Error CRÍTICO en get_filtered_resguardo_data:")
-        traceback.print_exc() 
-        return [], 0, 0
-    finally:
-        if conn :
-            cursor.close()
-            conn.close()
 
-def build_where_clause(group_data):
+def build_where_clause(group_data, template_id=None):
     """
-    Construye recursivamente la cláusula WHERE y los parámetros
-    a partir de la estructura de datos anidada.
+    Construye la cláusula WHERE y los parámetros a partir del árbol de
+    filtros. El árbol se normaliza y simplifica antes (ver filter_compiler)
+    y el resultado se memoriza por plantilla.
     Usa el diccionario AVAILABLE_COLUMNS para la seguridad.
     """
-    if not group_data or not group_data.get('rules'):
-        return "", []
-
-    condition = f" {group_data.get('condition', 'AND').upper()} "
-    params = []
-    clauses = []
-
-    for rule in group_data['rules']:
-        if 'condition' in rule:
-            # Es un sub-grupo
-            sub_clause, sub_params = build_where_clause(rule)
-            if sub_clause:
-                clauses.append(f"({sub_clause})")
-                params.extend(sub_params)
-        else:
-            # Es una regla simple
-            field = rule.get('field')
-            operator = rule.get('operator')
-            value = rule.get('value')
-            
-            # 1. Validación (contra las claves del diccionario)
-            if not (field and operator and field in AVAILABLE_COLUMNS):
-                continue
-                
-            # 2. Búsqueda del nombre real (ej: 'bienes.No_Inventario')
-            sql_field_name = AVAILABLE_COLUMNS[field] 
-            
-            sql_op_map = {'==': '=', '!=': '!=', '>': '>', '<': '<'}
-            
-            if operator in sql_op_map:
-                clauses.append(f"{sql_field_name} {sql_op_map[operator]} %s")
-                params.append(value)
-            elif operator == 'contains':
-                clauses.append(f"{sql_field_name} LIKE %s")
-                params.append(f"%{value}%")
-            elif operator == 'in':
-                values_list = [v.strip() for v in value.split(',') if v.strip()]
-                if not values_list:
-                    continue
-                placeholders = ', '.join(['%s'] * len(values_list))
-                clauses.append(f"{sql_field_name} IN ({placeholders})")
-                params.extend(values_list)
-
-    if not clauses:
-        return "", []
-        
-    return condition.join(clauses), params
+    return _compilador_filtros.compilar(group_data, template_id)
 
 
 # --- 3. RUTA PARA CREAR PLANTILLA (CORREGIDA) ---
@@ -451,18 +378,11 @@ def editar_plantilla(template_id):
 
 
 # --- 5. RUTA DE VISTA PREVIA (CORREGIDA) ---
-@plantillas_bp.route('/preview_query', methods=['POST'])
-@login_required
-@permission_required('resguardos.crear_resguardo')
-def preview_query():
-    """
-    Genera una vista previa de la consulta uniendo Bienes, Resguardos y Areas.
-    Maneja la carga de imágenes de almacenamiento local.
-    """
-    data = request.get_json()
-    columns = data.get('columns', []) 
-    filters_data = data.get('filters', {}) 
+PREVIEW_LIMIT = 50
 
+
+def _preview_resultados(columns, filters_data):
+    """Ejecuta la consulta de vista previa (bienes ⟕ resguardos ⟕ áreas + imágenes)."""
     conn = None
     try:
         # --- 1. Separar Columnas SQL de Columnas Especiales (Imágenes) ---
@@ -487,7 +407,7 @@ def preview_query():
                     safe_columns_clauses.append(f"{sql_name} AS `{user_name}`")
 
         if not safe_columns_clauses:
-            return jsonify([])
+            return []
 
         safe_columns_str = ", ".join(safe_columns_clauses)
 
@@ -502,7 +422,7 @@ def preview_query():
         if where_sql:
             query += f" WHERE {where_sql}"
         
-        query += " LIMIT 50" 
+        query += f" LIMIT {PREVIEW_LIMIT}"
 
         # --- 4. Ejecutar Consulta Principal ---
         conn = get_db_connection()
@@ -512,7 +432,7 @@ def preview_query():
         results = cursor.fetchall()
 
         if not results:
-            return jsonify([])
+            return []
 
         # --- 5. POST-PROCESAMIENTO: Inyectar Imágenes Locales ---
         
@@ -543,7 +463,7 @@ def preview_query():
                     rutas = row['rutas'].split(',') if row['rutas'] else []
                     # Convertir rutas físicas en URLs usando la función universal 'serve_uploaded_file'
                     # Nota: 'serve_uploaded_file' debe estar definida en app.py y accesible via 'url_for'
-                    urls = [url_for('serve_uploaded_file', filename=r) for r in rutas]
+                    urls = [url_for('serve_uploaded_file', filename=r, size='thumb') for r in rutas]
                     mapa_imagenes_bien[row['id_bien']] = urls
 
                 # Asignar al resultado final
@@ -573,7 +493,7 @@ def preview_query():
                 mapa_imagenes_res = {}
                 for row in cursor.fetchall():
                     rutas = row['rutas'].split(',') if row['rutas'] else []
-                    urls = [url_for('serve_uploaded_file', filename=r) for r in rutas]
+                    urls = [url_for('serve_uploaded_file', filename=r, size='thumb') for r in rutas]
                     mapa_imagenes_res[row['id_resguardo']] = urls
 
                 for row in results:
@@ -584,15 +504,37 @@ def preview_query():
         for row in results:
             row.pop('id_bien_hidden', None)
             row.pop('id_resguardo_hidden', None)
+        return results
+    finally:
+        if conn:
+            cursor.close()
+            conn.close()
+
+
+@plantillas_bp.route('/preview_query', methods=['POST'])
+@login_required
+@permission_required('resguardos.crear_resguardo')
+def preview_query():
+    """
+    Genera una vista previa de la consulta uniendo Bienes, Resguardos y Areas.
+    Maneja la carga de imágenes de almacenamiento local. El resultado se
+    guarda en query_cache hasta que se escriba en alguna de sus tablas.
+    """
+    data = request.get_json()
+    columns = data.get('columns', []) 
+    filters_data = data.get('filters', {}) 
+
+    try:
+        results = query_cache.obtener_o_calcular(
+            clave_plantilla('preview', columns, filters_data, PREVIEW_LIMIT),
+            TABLAS_PLANTILLAS,
+            lambda: _preview_resultados(columns, filters_data)
+        )
         return jsonify(results)
     
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": f"Error al construir la consulta: {str(e)}"}), 500
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
 
 @plantillas_bp.route('/ver_plantillas')
 @login_required
@@ -654,10 +596,20 @@ def eliminar_plantilla(template_id):
             conn.close()
     return redirect(url_for('plantillas.ver_plantillas'))
 
-@plantillas_bp.route('/exportar_excel/<int:template_id>')
-@login_required
-@permission_required('resguardos.crear_resguardo')
-def exportar_excel(template_id):
+def _reutilizar_archivo(origen, destino):
+    """Enlaza (o copia) un resultado previo al archivo del trabajo actual."""
+    if not origen or not os.path.exists(origen):
+        return False
+    try:
+        os.link(origen, destino)  # Sin copiar bytes; sobrevive a la purga del original
+    except OSError:
+        shutil.copyfile(origen, destino)
+    return True
+
+
+@register_job('exportar_excel_plantilla')
+def _job_exportar_excel(ctx, template_id):
+    """Genera el Excel de una plantilla en segundo plano y lo deja listo para descargar."""
     conn = None
     try:
         conn = get_db_connection()
@@ -666,191 +618,228 @@ def exportar_excel(template_id):
         # 1. Obtener la plantilla
         cursor.execute("SELECT * FROM query_templates WHERE id = %s", (template_id,))
         template = cursor.fetchone()
-        
+
         if not template:
-            flash("Plantilla no encontrada.", 'danger')
-            return redirect(url_for('plantillas.ver_plantillas'))
+            raise JobError("Plantilla no encontrada.")
 
         # 2. Obtener carpeta base local (Donde están guardadas las fotos realmente)
         base_upload_folder = current_app.config.get('UPLOAD_FOLDER')
         if not base_upload_folder:
-            flash("Error de configuración: UPLOAD_FOLDER no definido.", 'danger')
-            return redirect(url_for('plantillas.ver_plantillas'))
+            raise JobError("Error de configuración: UPLOAD_FOLDER no definido.")
 
         # 3. Obtener configuración de columnas y filtros
         selected_columns = json.loads(template['columns']) if template['columns'] else []
         filters = json.loads(template['filters']) if template['filters'] else []
 
-        # 4. Obtener los datos (Esta función devuelve URLs relativas, ej: /uploads/bienes/foto.jpg)
-        filtered_data, max_bien_images, max_resguardo_images = get_filtered_resguardo_data(selected_columns, filters)
+        filename = f"reporte_{template['name'].replace(' ', '_')}.xlsx"
+        ruta_excel = ctx.archivo_resultado(filename, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        sheet_name = template['name'][:30] if template['name'] else 'Reporte' # Excel limita nombre a 31 chars
+
+        # Si nada cambió en las tablas desde la última exportación de esta
+        # misma consulta, se reutiliza el archivo ya generado
+        llave = clave_plantilla('excel', selected_columns, filters, sheet_name)
+        encontrado, previo = query_cache.get(llave)
+        if encontrado and _reutilizar_archivo(previo['ruta'], ruta_excel):
+            log_activity("Exportación Excel", "Plantillas", resource_id=template_id, details=f"Exportada: {template['name']}")
+            return {'filas': previo['filas'], 'mensaje': f"Excel generado con {previo['filas']} registros."}
+        versiones = version_tablas(TABLAS_PLANTILLAS)
+
+        # 4. Totales y máximo de imágenes por fila con consultas agregadas;
+        # las filas se leen después en streaming, sin materializarlas
+        ctx.progreso(0, "Consultando registros...")
+        total_filas, max_bien_images, max_resguardo_images = resumen_exportacion(selected_columns, filters, template_id)
+
+        if not total_filas:
+            raise JobError("No hay datos para exportar con esos filtros.")
+
+        # 5. Escribir el Excel (en disco, dentro de JOBS_FOLDER) fila por fila
+
+        escritas = escribir_excel_plantilla(
+            ruta_excel, sheet_name, selected_columns,
+            iter_filtered_resguardo_rows(selected_columns, filters, template_id=template_id),
+            max_bien_images, max_resguardo_images, base_upload_folder,
+            progreso=lambda n: ctx.progreso(min(n * 100 // total_filas, 99), f"Escribiendo fila {n} de {total_filas}...")
+        )
+        query_cache.put(llave, TABLAS_PLANTILLAS, {'ruta': ruta_excel, 'filas': escritas}, versiones)
+
+        log_activity("Exportación Excel", "Plantillas", resource_id=template_id, details=f"Exportada: {template['name']}")
+
+        return {'filas': escritas, 'mensaje': f"Excel generado con {escritas} registros."}
+
+    except JobError:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise JobError(f"Error crítico al generar Excel: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
 
-        if not filtered_data:
-            flash("No hay datos para exportar con esos filtros.", 'warning')
+@plantillas_bp.route('/exportar_excel/<int:template_id>')
+@login_required
+@permission_required('resguardos.crear_resguardo')
+def exportar_excel(template_id):
+    """Encola la exportación; el archivo se descarga desde la página de progreso."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute("SELECT id FROM query_templates WHERE id = %s", (template_id,))
+        if not cursor.fetchone():
+            flash("Plantilla no encontrada.", 'danger')
             return redirect(url_for('plantillas.ver_plantillas'))
+    finally:
+        if conn:
+            conn.close()
+
+    try:
+        job_id = submit_job('exportar_excel_plantilla', {'template_id': template_id},
+                            user_id=current_user.id, base_url=request.host_url)
+    except Exception as e:
+        traceback.print_exc()
+        flash(f"No se pudo iniciar la exportación: {e}", 'danger')
+        return redirect(url_for('plantillas.ver_plantillas'))
+    return responder_job(job_id, "El Excel se está generando en segundo plano.")
 
-        # 5. Aplanar las listas de imágenes en columnas individuales para el DataFrame
-        for row in filtered_data:
-            if 'imagenPath_bien' in row and row['imagenPath_bien']:
-                for i, path in enumerate(row['imagenPath_bien']):
-                    if i < max_bien_images:
-                        row[f'imagen_bien_{i+1}'] = path
-            if 'imagenPath_resguardo' in row and row['imagenPath_resguardo']:
-                for i, path in enumerate(row['imagenPath_resguardo']):
-                    if i < max_resguardo_images:
-                        row[f'imagen_resguardo_{i+1}'] = path
-        
-        # Crear DataFrame y Buffer de Excel
-        df = pd.DataFrame(filtered_data)
-        excel_file_buffer = BytesIO()
-
-        with pd.ExcelWriter(excel_file_buffer, engine='xlsxwriter') as writer:
-            sheet_name = template['name'][:30] if template['name'] else 'Reporte' # Excel limita nombre a 31 chars
-            workbook = writer.book
-            worksheet = workbook.add_worksheet(sheet_name) 
-
-            # Formatos
-            header_format = workbook.add_format({'bg_color': '#4A90E2', 'font_color': 'white', 'bold': True, 'align': 'center', 'valign': 'vcenter', 'border': 1})
-            data_format = workbook.add_format({'align': 'center', 'valign': 'vcenter', 'border': 1, 'text_wrap': True})
-            image_cell_format = workbook.add_format({'align': 'center', 'valign': 'top', 'border': 1})
-
-            # Definir orden de columnas
-            all_columns_in_order = [col for col in selected_columns if col not in ['imagenPath_bien', 'imagenPath_resguardo']]
-            for i in range(max_bien_images):
-                all_columns_in_order.append(f'imagen_bien_{i+1}')
-            for i in range(max_resguardo_images):
-                all_columns_in_order.append(f'imagen_resguardo_{i+1}')
-            
-            # Escribir Encabezados
-            for col_num, column_name in enumerate(all_columns_in_order):
-                display_name = column_name.replace('_', ' ').title()
-                if column_name.startswith('imagen_bien_'):
-                    display_name = f'Img Bien {column_name.split("_")[2]}'
-                elif column_name.startswith('imagen_resguardo_'):
-                    display_name = f'Img Resguardo {column_name.split("_")[2]}'
-                worksheet.write(0, col_num, display_name, header_format)
-
-            # Configuración de altura de filas para imágenes
-            image_row_height = 120
-            worksheet.set_default_row(30) # Altura por defecto para filas de texto
-
-            # --- BUCLE PRINCIPAL DE FILAS ---
-            for row_num, row_data in enumerate(filtered_data):
-                excel_row = row_num + 1
-                
-                # Verificar si esta fila tiene imágenes para ajustar altura
-                has_images = any(row_data.get(col) for col in [f'imagen_bien_{i+1}' for i in range(max_bien_images)] + [f'imagen_resguardo_{i+1}' for i in range(max_resguardo_images)])
-                if has_images:
-                    worksheet.set_row(excel_row, image_row_height)
-
-                # --- BUCLE DE COLUMNAS ---
-                for col_num, col_name in enumerate(all_columns_in_order):
-                    value = row_data.get(col_name, '')
-                    
-                    # ==========================================================
-                    # 📸 LÓGICA DE INSERCIÓN DE IMÁGENES LOCALES
-                    # ==========================================================
-                    if col_name.startswith('imagen_'):
-                        if value: 
-                            try:
-                                # 1. Limpiar la URL para obtener la ruta relativa
-                                # El valor viene como: "/uploads/bienes/foto.jpg" -> queremos "bienes/foto.jpg"
-                                url_str = str(value)
-                                if '/uploads/' in url_str:
-                                    relative_path = url_str.split('/uploads/')[-1]
-                                else:
-                                    relative_path = url_str.lstrip('/')
-
-                                # Decodificar caracteres raros (%20 -> espacio)
-                                relative_path = urllib.parse.unquote(relative_path)
-
-                                # 2. Construir la ruta absoluta en el servidor
-                                full_path = os.path.join(base_upload_folder, relative_path)
-                                
-                                # 3. Verificar extensión (Excel no soporta incrustar PDF)
-                                _, ext = os.path.splitext(full_path)
-                                if ext.lower() == '.pdf':
-                                    worksheet.write(excel_row, col_num, 'Archivo PDF (No visualizable)', data_format)
-                                    continue 
-
-                                # 4. Verificar existencia física
-                                if os.path.exists(full_path):
-                                    
-                                    # Abrir imagen en bytes para procesar
-                                    with open(full_path, 'rb') as f:
-                                        image_data = f.read()
-                                    
-                                    image_buffer = io.BytesIO(image_data)
-                                    
-                                    # Usar Pillow para obtener dimensiones y evitar errores de formato
-                                    try:
-                                        img = Image.open(image_buffer)
-                                        width, height = img.size
-                                    except Exception:
-                                        worksheet.write(excel_row, col_num, 'Formato img inválido', data_format)
-                                        continue
-
-                                    # Calcular escala para que quepa en la celda (aprox 200x120 px)
-                                    # Unidades de excel aprox: width 25 ~ 180px, height 120 ~ 160px
-                                    x_scale = 180 / width
-                                    y_scale = 150 / height
-                                    scale = min(x_scale, y_scale, 1.0) # Mantener proporción y no agrandar
-
-                                    # Insertar en Excel
-                                    worksheet.insert_image(
-                                        excel_row, col_num, 
-                                        full_path, 
-                                        {
-                                            'image_data': image_buffer, 
-                                            'x_scale': scale, 
-                                            'y_scale': scale, 
-                                            'x_offset': 5, 
-                                            'y_offset': 5,
-                                            'object_position': 1 # Mover y cambiar tamaño con celdas
-                                        }
-                                    )
-                                    worksheet.write(excel_row, col_num, '', image_cell_format) # Celda vacía formateada
-                                
-                                else:
-                                    # El archivo está en BD pero no en disco
-                                    print(f"EXCEL DEBUG: No encontrado -> {full_path}")
-                                    worksheet.write(excel_row, col_num, 'Archivo no encontrado', data_format)
-
-                            except Exception as e:
-                                print(f"EXCEL ERROR en fila {excel_row}: {e}")
-                                worksheet.write(excel_row, col_num, 'Error al procesar', data_format)
-                        else:
-                            worksheet.write(excel_row, col_num, 'Sin imagen', data_format)
-                    
-                    # ==========================================================
-                    # 📝 LÓGICA PARA DATOS NORMALES (TEXTO/NÚMEROS)
-                    # ==========================================================
-                    else:
-                        worksheet.write(excel_row, col_num, value, data_format)
-
-            # Ajustar ancho de columnas
-            for col_num, col_name in enumerate(all_columns_in_order):
-                if col_name.startswith('imagen_'):
-                    worksheet.set_column(col_num, col_num, 25) # Ancho fijo para imágenes
-                else:
-                    worksheet.set_column(col_num, col_num, 20) # Ancho estándar para texto
-        
-        excel_file_buffer.seek(0)
-        filename = f"reporte_{template['name'].replace(' ', '_')}.xlsx"
-        
-        log_activity("Exportación Excel", "Plantillas", resource_id=template_id, details=f"Exportada: {template['name']}")
 
-        return send_file(
-            excel_file_buffer, 
-            download_name=filename, 
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 
-            as_attachment=True
+def _plantilla_exportable(template_id):
+    """Devuelve (template, columnas válidas, filtros) o None si la plantilla no existe."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute("SELECT * FROM query_templates WHERE id = %s", (template_id,))
+        template = cursor.fetchone()
+    finally:
+        conn.close()
+    if not template:
+        return None
+    selected_columns = json.loads(template['columns']) if template['columns'] else []
+    columnas = [col for col in selected_columns if col in AVAILABLE_COLUMNS]
+    filters = json.loads(template['filters']) if template['filters'] else []
+    return template, columnas, filters
+
+
+def _url_imagen_externa(ruta):
+    return url_for('serve_uploaded_file', filename=ruta, _external=True)
+
+
+@plantillas_bp.route('/exportar_csv/<int:template_id>')
+@login_required
+@permission_required('resguardos.crear_resguardo')
+def exportar_csv(template_id):
+    """CSV sin formato en streaming: las filas se leen y se envían por bloques."""
+    datos = _plantilla_exportable(template_id)
+    if not datos:
+        flash("Plantilla no encontrada.", 'danger')
+        return redirect(url_for('plantillas.ver_plantillas'))
+    template, columnas, filters = datos
+    if not columnas:
+        flash("La plantilla no tiene columnas para exportar.", 'warning')
+        return redirect(url_for('plantillas.ver_plantillas'))
+
+    log_activity("Exportación CSV", "Plantillas", resource_id=template_id, details=f"Exportada: {template['name']}")
+
+    filas = iter_filtered_resguardo_rows(columnas, filters, template_id=template_id)
+    filename = secure_filename(f"reporte_{template['name']}.csv") or 'reporte.csv'
+    return Response(
+        stream_with_context(generar_csv(columnas, filas, _url_imagen_externa)),
+        mimetype='text/csv; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
+@register_job('exportar_parquet_plantilla')
+def _job_exportar_parquet(ctx, template_id):
+    """Genera el Parquet de una plantilla (columnas tipadas, imágenes como listas de URLs)."""
+    datos = _plantilla_exportable(template_id)
+    if not datos:
+        raise JobError("Plantilla no encontrada.")
+    template, columnas, filters = datos
+    if not columnas:
+        raise JobError("La plantilla no tiene columnas para exportar.")
+
+    ctx.progreso(0, "Consultando registros...")
+    total_filas, _, _ = resumen_exportacion(columnas, filters, template_id)
+    if not total_filas:
+        raise JobError("No hay datos para exportar con esos filtros.")
+
+    filename = f"reporte_{template['name'].replace(' ', '_')}.parquet"
+    ruta = ctx.archivo_resultado(filename, 'application/vnd.apache.parquet')
+    try:
+        escritas = escribir_parquet(
+            ruta, columnas, iter_filtered_resguardo_rows(columnas, filters, template_id=template_id),
+            _url_imagen_externa, AVAILABLE_COLUMNS,
+            progreso=lambda n: ctx.progreso(min(n * 100 // total_filas, 99), f"Escritas {n} de {total_filas} filas...")
         )
+    except Exception as e:
+        traceback.print_exc()
+        raise JobError(f"Error al generar Parquet: {e}")
+
+    log_activity("Exportación Parquet", "Plantillas", resource_id=template_id, details=f"Exportada: {template['name']}")
+    return {'filas': escritas, 'mensaje': f"Parquet generado con {escritas} registros."}
+
 
+@plantillas_bp.route('/exportar_parquet/<int:template_id>')
+@login_required
+@permission_required('resguardos.crear_resguardo')
+def exportar_parquet(template_id):
+    """Encola la exportación a Parquet; el archivo se descarga desde la página de progreso."""
+    if not parquet_disponible():
+        flash("La exportación a Parquet no está disponible: falta instalar 'pyarrow'.", 'warning')
+        return redirect(url_for('plantillas.ver_plantillas'))
+    if not _plantilla_exportable(template_id):
+        flash("Plantilla no encontrada.", 'danger')
+        return redirect(url_for('plantillas.ver_plantillas'))
+
+    try:
+        job_id = submit_job('exportar_parquet_plantilla', {'template_id': template_id},
+                            user_id=current_user.id, base_url=request.host_url)
     except Exception as e:
-        flash(f"Error crítico al generar Excel: {str(e)}", 'danger')
         traceback.print_exc()
+        flash(f"No se pudo iniciar la exportación: {e}", 'danger')
         return redirect(url_for('plantillas.ver_plantillas'))
+    return responder_job(job_id, "El archivo Parquet se está generando en segundo plano.")
+
+
+@plantillas_bp.route('/<int:template_id>/explain')
+@login_required
+@admin_required
+def explicar_plantilla(template_id):
+    """
+    Plan de ejecución (EXPLAIN) de la consulta de una plantilla, junto con el
+    árbol de filtros normalizado y el SQL compilado. ?formato=json usa
+    EXPLAIN FORMAT=JSON.
+    """
+    datos = _plantilla_exportable(template_id)
+    if not datos:
+        return jsonify({'error': 'Plantilla no encontrada.'}), 404
+    template, columnas, filters = datos
+
+    select_clause, from_where, params, _ = _consulta_resguardos(columnas, filters, template_id)
+    query = f"SELECT {select_clause} {from_where} ORDER BY bienes.id DESC"
+    formato_json = request.args.get('formato') == 'json'
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute(("EXPLAIN FORMAT=JSON " if formato_json else "EXPLAIN ") + query, params)
+        plan = cursor.fetchall()
+        if formato_json and plan:
+            plan = json.loads(next(iter(plan[0].values())))
+    except pymysql.MySQLError as e:
+        return jsonify({'error': f'No se pudo obtener el plan: {e}'}), 500
     finally:
         if conn:
             conn.close()
 
+    return jsonify({
+        'plantilla': template['name'],
+        'filtros': filters,
+        'filtros_normalizados': _compilador_filtros.a_json(_compilador_filtros.normalizar(filters)),
+        'sql': query,
+        'parametros': [str(p) for p in params],
+        'plan': plan,
+    })
+
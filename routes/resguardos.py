@@ -6,6 +6,10 @@ import traceback
 from database import get_db_connection, get_db_connection, AVAILABLE_COLUMNS
 from decorators import permission_required
 from log_activity import log_activity
+from pagination import paginar_keyset
+from search import build_search
+import catalogos
+import area_stats
 import math
 from pymysql.err import MySQLError
 import pymysql
@@ -14,6 +18,7 @@ from drive_service import drive_service, BIENES_FOLDER_ID, RESGUARDOS_FOLDER_ID
 import traceback
 from werkzeug.utils import secure_filename
 import uuid
+from derivatives import programar_derivados
 
 resguardos_bp = Blueprint('resguardos', __name__)
 
@@ -30,30 +35,21 @@ def allowed_file(filename):
 
 
 def get_areas_for_form():
-    """Obtiene una lista de objetos de área [{id, nombre}] desde la BD."""
-    conn = None
+    """Lista de áreas [{id, nombre, numero}] del catálogo en memoria."""
     try:
-        conn = get_db_connection()
-        if not conn: return []
-        cursor = cursor = conn.cursor(pymysql.cursors.DictCursor)
-        cursor.execute("SELECT id, nombre FROM areas ORDER BY nombre")
-        return cursor.fetchall()
-    except MySQLError as err:
+        return catalogos.areas()
+    except Exception as err:
         print(f"Error al obtener áreas: {err}")
         return []
-    finally:
-        if conn :
-            conn.close()
 
 
 # Añade esta nueva ruta en cualquier parte de tu archivo resguardos.py
 @resguardos_bp.route('/api/areas', methods=['GET'])
 @login_required
 def get_areas_api():
-    """Devuelve la lista de áreas en formato JSON."""
+    """Devuelve la lista de áreas en formato JSON (con ETag)."""
     try:
-        areas = get_areas_for_form()
-        return jsonify(areas)
+        return catalogos.respuesta_json('areas', campos=('id', 'nombre'))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -112,6 +108,7 @@ def crear_resguardo():
                         
                         # Guardar ruta relativa en BD
                         db_path = os.path.join('bienes', unique_filename)
+                        programar_derivados(save_path, db_path)
                         cursor.execute("INSERT INTO imagenes_bien (id_bien, ruta_imagen) VALUES (%s, %s)", (id_bien, db_path))
 
             # --- 3. Crear el resguardo ---
@@ -146,10 +143,12 @@ def crear_resguardo():
                     
                     # Guardar ruta relativa en BD
                     db_path = os.path.join('resguardos', unique_filename)
+                    programar_derivados(save_path, db_path)
                     # Asumiendo que tu tabla tiene 'fecha_subida'
                     cursor.execute("INSERT INTO imagenes_resguardo (id_resguardo, ruta_imagen, fecha_subida) VALUES (%s, %s, NOW())", (id_resguardo, db_path))
             
             # --- 5. Si todo salió bien, confirmar cambios ---
+            area_stats.refrescar_areas(cursor, [area_id])
             conn.commit()
             log_activity(
                 action='Creación de Resguardo', 
@@ -364,6 +363,7 @@ def editar_resguardo(id_resguardo):
                     
                     # Guardar ruta relativa en BD
                     db_path = os.path.join('bienes', unique_filename)
+                    programar_derivados(save_path, db_path)
                     cursor.execute("INSERT INTO imagenes_bien (id_bien, ruta_imagen) VALUES (%s, %s)", (id_bien_val, db_path))
 
             # D) Subir nuevas imágenes de RESGUARDOS
@@ -378,8 +378,11 @@ def editar_resguardo(id_resguardo):
                     
                     # Guardar ruta relativa en BD
                     db_path = os.path.join('resguardos', unique_filename)
+                    programar_derivados(save_path, db_path)
                     cursor.execute("INSERT INTO imagenes_resguardo (id_resguardo, ruta_imagen) VALUES (%s, %s)", (id_resguardo, db_path))
 
+            # Estadísticas del área anterior y de la nueva (si cambió)
+            area_stats.refrescar_areas(cursor, [resguardo_data_val['Area_id'], area_id])
             conn.commit()
             log_activity(
                 action='Edición de Resguardo', 
@@ -502,20 +505,11 @@ def ver_resguardo(id_resguardo):
 
 # It's good practice to have a helper function to get areas
 def get_areas_list_from_db():
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-        cursor.execute("SELECT DISTINCT nombre FROM areas ORDER BY nombre")
-        areas = [row['nombre'] for row in cursor.fetchall()]
-        return areas
+        return [area['nombre'] for area in catalogos.areas()]
     except Exception as e:
         print(f"Error fetching areas from DB: {e}")
         return []
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
 
 @resguardos_bp.route('/delete/<int:id>', methods=['POST'])
 @login_required
@@ -577,14 +571,13 @@ def ver_resguardos_sujeto_control():
 def _get_resguardos_list(control_only=False):
     """
     Función unificada y COMPLETA para obtener listas de resguardos.
-    Ahora solo maneja la paginación numerada.
+    Pagina por llave (r.id DESC) con cursores opacos; el total se cachea.
     """
     conn = None
     try:
         # --- 1. Obtener Parámetros de la Petición ---
-        page = request.args.get('page', 1, type=int)
         limit = 100
-        offset = (page - 1) * limit
+        page_cursor = request.args.get('cursor')
         search_column = request.args.get('search_column', 'all')
         search_query = request.args.get('search_query', '').strip()
         
@@ -615,36 +608,19 @@ def _get_resguardos_list(control_only=False):
             where_clauses.append("r.Tipo_De_Resguardo = 1")
         else:
             where_clauses.append("r.Tipo_De_Resguardo = 0")
-        if search_query:
-            # (Tu lógica de búsqueda se mantiene aquí)
-            searchable_cols = [
-                'b.No_Inventario', 'b.Descripcion_Corta_Del_Bien', 'a.nombre', 
-                'r.No_Resguardo', 'r.Nombre_Del_Resguardante', 'b.Proveedor'
-            ]
-            all_cols_clause = " OR ".join([f"{col} LIKE %s" for col in searchable_cols])
-            where_clauses.append(f"({all_cols_clause})")
-            sql_params.extend([f"%{search_query}%"] * len(searchable_cols))
-
-        # --- Consulta para el conteo total de items (sin LIMIT ni OFFSET) ---
-        count_query = "SELECT COUNT(*) " + from_tables
-        if where_clauses:
-            count_query += " WHERE " + " AND ".join(where_clauses)
-        
-        cursor.execute(count_query, sql_params)
-        total_items = cursor.fetchone()['COUNT(*)']
-        total_pages = math.ceil(total_items / limit)
-
-        # --- Consulta para obtener los datos de la página actual ---
-        final_query = select_cols + from_tables
-        if where_clauses:
-            final_query += " WHERE " + " AND ".join(where_clauses)
-        
-        final_query += " ORDER BY r.id DESC LIMIT %s OFFSET %s"
-        sql_params.extend([limit, offset])
-
-        # --- 4. Ejecución y Renderizado ---
-        cursor.execute(final_query, sql_params)
-        resguardos_data = cursor.fetchall()
+        # Búsqueda por el subsistema común (FULLTEXT + prefijos de No_Inventario/No_Resguardo)
+        busqueda = build_search(search_query, {'bienes': 'b', 'resguardos': 'r', 'areas': 'a'})
+        if busqueda:
+            where_clauses.append(busqueda.where)
+            sql_params.extend(busqueda.params)
+
+        # --- 4. Página actual por llave (sin OFFSET) y total cacheado ---
+        pagina = paginar_keyset(
+            cursor, select_cols, from_tables, where_clauses, sql_params,
+            id_col='r.id', limit=limit, token=page_cursor,
+            cache_key='resguardos_sujeto_control' if control_only else 'resguardos'
+        )
+        resguardos_data = pagina.rows
         
         template_name = 'resguardos_list.html'
         return render_template(
@@ -653,8 +629,11 @@ def _get_resguardos_list(control_only=False):
             search_column=search_column,
             search_query=search_query,
             available_columns_for_search=AVAILABLE_COLUMNS,
-            current_page=page,
-            total_pages=total_pages, # Ahora pasamos el total de páginas
+            current_page=pagina.page,
+            total_pages=pagina.total_pages,
+            total_items=pagina.total_items,
+            next_cursor=pagina.next_cursor,
+            prev_cursor=pagina.prev_cursor,
             limit=limit,
             is_sujeto_control=control_only
         )
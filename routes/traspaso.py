@@ -2,6 +2,9 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from database import get_db_connection
+from search import build_search
+import catalogos
+import area_stats
 from decorators import permission_required
 from log_activity import log_activity
 from datetime import date, datetime
@@ -9,6 +12,7 @@ from werkzeug.utils import secure_filename
 import uuid
 import os
 from config import UPLOAD_FOLDER
+from derivatives import programar_derivados
 import traceback 
 import pymysql
 from drive_service import (drive_service, BIENES_FOLDER_ID, TRASPASOS_FOLDER_ID, RESGUARDOS_FOLDER_ID)
@@ -26,37 +30,19 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def get_areas_data():
-    conn = None
-    cursor = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor) 
-        cursor.execute("SELECT id, nombre FROM areas ORDER BY nombre")
-        areas = cursor.fetchall()
-        return {area['nombre']: area['id'] for area in areas}
-    except pymysql.MySQLError as e:
+        return {area['nombre']: area['id'] for area in catalogos.areas()}
+    except Exception as e:
         print(f"Error al obtener áreas: {e}")
         return {}
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
 
 def get_areas_for_form():
-    """Obtiene una lista de objetos de área [{id, nombre}] desde la BD."""
-    conn = None
+    """Lista de áreas [{id, nombre, numero}] del catálogo en memoria."""
     try:
-        conn = get_db_connection()
-        if not conn: return []
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-        cursor.execute("SELECT id, nombre FROM areas ORDER BY nombre")
-        return cursor.fetchall()
-    except MySQLError as err:
+        return catalogos.areas()
+    except Exception as err:
         print(f"Error al obtener áreas: {err}")
         return []
-    finally:
-        if conn:
-            conn.close()
 
 @traspaso_bp.route('/traspasar_resguardo/<int:id_resguardo_anterior>', methods=['GET', 'POST'])
 @login_required
@@ -87,8 +73,7 @@ def traspasar_resguardo(id_resguardo_anterior):
             flash("Resguardo no encontrado.", "danger")
             return redirect(url_for('resguardos.ver_resguardos'))
 
-        cursor.execute("SELECT id, nombre FROM areas ORDER BY nombre ASC")
-        areas = cursor.fetchall()
+        areas = catalogos.areas()
 
         # --- LÓGICA POST ---
         if request.method == 'POST':
@@ -169,6 +154,7 @@ def traspasar_resguardo(id_resguardo_anterior):
                     
                     # Ruta relativa para la BD
                     db_path = os.path.join('resguardos', unique_filename)
+                    programar_derivados(save_path, db_path)
 
                     cursor.execute(
                         """
@@ -221,6 +207,7 @@ def traspasar_resguardo(id_resguardo_anterior):
                         
                         # Ruta relativa para la BD
                         db_path = os.path.join('traspasos', unique_filename)
+                        programar_derivados(save_path, db_path)
 
                         cursor.execute(
                             """
@@ -233,7 +220,8 @@ def traspasar_resguardo(id_resguardo_anterior):
                 
                 oficio_index += 1
 
-            # Confirmar transacción
+            # Confirmar transacción (con las estadísticas de ambas áreas)
+            area_stats.refrescar_areas(cursor, [resguardo_anterior['id_area'], area_nueva_id])
             conn.commit()
             log_activity(
                 action="Traspaso de Resguardo", 
@@ -379,14 +367,10 @@ def ver_traspasos():
         """
         
         params = []
-        if search_query:
-            sql_base += """
-                WHERE b.No_Inventario LIKE %s
-                OR r_anterior.Nombre_Del_Resguardante LIKE %s
-                OR r_actual.Nombre_Del_Resguardante LIKE %s
-            """
-            like_query = f"%{search_query}%"
-            params.extend([like_query, like_query, like_query])
+        busqueda = build_search(search_query, {'bienes': 'b', 'resguardos': ['r_anterior', 'r_actual']})
+        if busqueda:
+            sql_base += f" WHERE {busqueda.where} "
+            params.extend(busqueda.params)
 
         sql_base += """
             GROUP BY t.id, t.fecha_traspaso, b.No_Inventario, 
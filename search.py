@@ -0,0 +1,359 @@
+# search.py
+"""
+Subsistema de búsqueda usado por las cajas de búsqueda de bienes y resguardos.
+
+Todas las rutas llaman a build_search(), que devuelve el fragmento WHERE y la
+expresión de relevancia para la consulta del usuario. El motor se elige con
+SEARCH_BACKEND en config.py:
+
+- 'fulltext': índices FULLTEXT de MySQL (ver migración c3d9a5e1f2b4). Cada
+  término es una subconsulta `alias.id IN (SELECT id ... WHERE MATCH ...)`:
+  MySQL la resuelve una vez con el índice FULLTEXT y la materializa, en vez
+  de evaluar MATCH fila por fila (lo que pasa si los MATCH de varias tablas
+  se unen con OR en el WHERE externo). Los términos más cortos que
+  innodb_ft_min_token_size no están en el índice y se buscan con LIKE.
+- 'like':     LIKE '%término%' clásico, para bases sin los índices.
+- 'memoria':  índice invertido en proceso, pensado para pruebas.
+
+En todos los modos No_Inventario y No_Resguardo aceptan búsqueda por prefijo
+y los nombres se comparan sin acentos.
+"""
+import bisect
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from config import SEARCH_BACKEND, SEARCH_FT_MIN_TOKEN
+
+# Columnas de cada índice FULLTEXT, en el mismo orden en que se crearon.
+# MATCH() debe nombrar exactamente las columnas de un índice.
+INDICES_FULLTEXT = {
+    'bienes': ('No_Inventario', 'Descripcion_Del_Bien', 'Descripcion_Corta_Del_Bien',
+               'Marca', 'Modelo', 'Numero_De_Serie', 'Proveedor'),
+    'resguardos': ('No_Resguardo', 'Nombre_Del_Resguardante', 'Nombre_Director_Jefe_De_Area'),
+    'areas': ('nombre',),
+}
+
+# Columnas con búsqueda por prefijo (LIKE 'x%' aprovecha el índice B-tree)
+COLUMNAS_PREFIJO = {
+    'bienes': ('No_Inventario',),
+    'resguardos': ('No_Resguardo',),
+}
+
+# Bitácora (activity_log): índice FULLTEXT propio, fuera del índice en memoria
+# por su tamaño. Mismo orden que ft_activity_log_texto (migración e2c4b7a9d1f6).
+INDICE_BITACORA = ('action', 'details')
+
+MAX_TERMINOS = 6          # Términos máximos que se toman de la consulta
+MAX_IDS_MEMORIA = 2000    # Tope de ids por entidad en el modo 'memoria'
+MEMORIA_TTL = 300         # Segundos antes de recargar el índice en memoria
+
+
+def normalizar(texto):
+    """Minúsculas y sin acentos: 'José Pérez' -> 'jose perez'."""
+    if texto is None:
+        return ''
+    descompuesto = unicodedata.normalize('NFKD', str(texto))
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def tokenizar(texto):
+    """Divide en términos alfanuméricos normalizados (igual que el parser de FULLTEXT)."""
+    return re.findall(r'[0-9a-zñ]+', normalizar(texto))
+
+
+def _escapar_like(valor):
+    return valor.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class SearchClause:
+    """
+    Resultado de build_search().
+    - where / params: condición lista para añadir con AND.
+    - score_sql / score_params: expresión de relevancia (mayor es mejor).
+    """
+
+    def __init__(self, where, params, score_sql, score_params):
+        self.where = where
+        self.params = list(params)
+        self.score_sql = score_sql
+        self.score_params = list(score_params)
+
+    def _a_texto(self, sql, params):
+        from sqlalchemy import text
+        nombres = {}
+
+        def _reemplazo(_match):
+            nombre = f"b{len(nombres)}"
+            nombres[nombre] = params[len(nombres)]
+            return f":{nombre}"
+
+        return text(re.sub(r'%s', _reemplazo, sql)).bindparams(**nombres)
+
+    def where_text(self):
+        """La condición como TextClause de SQLAlchemy (para consultas ORM)."""
+        return self._a_texto(self.where, self.params)
+
+    def score_text(self):
+        """La relevancia como TextClause de SQLAlchemy (para ORDER BY en ORM)."""
+        return self._a_texto(self.score_sql, self.score_params)
+
+
+def _aliases(valor):
+    if not valor:
+        return []
+    return [valor] if isinstance(valor, str) else list(valor)
+
+
+def _prefijos(tablas, consulta):
+    """Condiciones de prefijo sobre la consulta completa (p. ej. 'ATI-2023')."""
+    sql, params = [], []
+    patron = _escapar_like(consulta) + '%'
+    for entidad, columnas in COLUMNAS_PREFIJO.items():
+        for alias in _aliases(tablas.get(entidad)):
+            for col in columnas:
+                sql.append(f"{alias}.{col} LIKE %s")
+                params.append(patron)
+    return sql, params
+
+
+def _bono_exacto(tablas, consulta):
+    """Relevancia extra para coincidencias exactas y por prefijo en los números de control."""
+    sql, params = [], []
+    for entidad, columnas in COLUMNAS_PREFIJO.items():
+        for alias in _aliases(tablas.get(entidad)):
+            for col in columnas:
+                sql.append(f"(COALESCE({alias}.{col} = %s, 0) * 50 + COALESCE({alias}.{col} LIKE %s, 0) * 10)")
+                params.extend([consulta, _escapar_like(consulta) + '%'])
+    return sql, params
+
+
+def _termino_like(tablas, termino):
+    sql, params = [], []
+    patron = f"%{_escapar_like(termino)}%"
+    for entidad, columnas in INDICES_FULLTEXT.items():
+        for alias in _aliases(tablas.get(entidad)):
+            for col in columnas:
+                sql.append(f"{alias}.{col} LIKE %s")
+                params.append(patron)
+    return "(" + " OR ".join(sql) + ")", params
+
+
+def _termino_fulltext(tablas, termino):
+    """El término en alguna de las tablas, como semi-join por id contra cada índice FULLTEXT."""
+    sql, params = [], []
+    for entidad, columnas in INDICES_FULLTEXT.items():
+        for alias in _aliases(tablas.get(entidad)):
+            sql.append(f"{alias}.id IN (SELECT id FROM {entidad} "
+                       f"WHERE MATCH({', '.join(columnas)}) AGAINST (%s IN BOOLEAN MODE))")
+            params.append(f"+{termino}*")
+    return "(" + " OR ".join(sql) + ")", params
+
+
+def _score_fulltext(tablas, terminos):
+    sql, params = [], []
+    consulta_bool = " ".join(f"{t}*" for t in terminos)
+    for entidad, columnas in INDICES_FULLTEXT.items():
+        for alias in _aliases(tablas.get(entidad)):
+            lista = ", ".join(f"{alias}.{col}" for col in columnas)
+            sql.append(f"COALESCE(MATCH({lista}) AGAINST (%s IN BOOLEAN MODE), 0)")
+            params.append(consulta_bool)
+    return sql, params
+
+
+# --- Índice invertido en memoria ---
+
+class InvertedIndex:
+    """Índice invertido simple: término normalizado -> {id: peso}."""
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._terminos = []   # Ordenados, para búsqueda por prefijo con bisect
+        self._lock = threading.Lock()
+        self.cargado_en = 0
+
+    def add(self, doc_id, textos):
+        with self._lock:
+            for texto in textos:
+                for termino in tokenizar(texto):
+                    if termino not in self._postings:
+                        bisect.insort(self._terminos, termino)
+                    self._postings[termino][doc_id] = self._postings[termino].get(doc_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._terminos = []
+            self.cargado_en = 0
+
+    def buscar_prefijo(self, prefijo):
+        """Devuelve {id: puntaje} de los documentos con algún término que empiece con `prefijo`."""
+        resultado = {}
+        with self._lock:
+            i = bisect.bisect_left(self._terminos, prefijo)
+            while i < len(self._terminos) and self._terminos[i].startswith(prefijo):
+                termino = self._terminos[i]
+                # Coincidencia exacta pesa más que una por prefijo
+                factor = 2.0 if termino == prefijo else 1.0
+                for doc_id, peso in self._postings[termino].items():
+                    resultado[doc_id] = resultado.get(doc_id, 0) + peso * factor
+                i += 1
+        return resultado
+
+    def __len__(self):
+        return len(self._postings)
+
+
+_indices_memoria = {entidad: InvertedIndex() for entidad in INDICES_FULLTEXT}
+_carga_lock = threading.Lock()
+
+
+def indexar(entidad, doc_id, textos):
+    """Agrega un documento al índice en memoria (usado por pruebas y por la carga inicial)."""
+    _indices_memoria[entidad].add(doc_id, textos)
+
+
+def cargar_indices_memoria(conn=None):
+    """(Re)construye los índices en memoria leyendo las tablas de la base de datos."""
+    from database import get_db_connection
+
+    propia = conn is None
+    conn = conn or get_db_connection()
+    if conn is None:
+        return
+    try:
+        cursor = conn.cursor()
+        for entidad, columnas in INDICES_FULLTEXT.items():
+            indice = _indices_memoria[entidad]
+            indice.clear()
+            cursor.execute(f"SELECT id, {', '.join(columnas)} FROM {entidad}")
+            for row in cursor.fetchall():
+                indice.add(row['id'], [row[col] for col in columnas])
+            indice.cargado_en = time.time()
+    finally:
+        if propia:
+            conn.close()
+
+
+def _asegurar_indices_memoria():
+    with _carga_lock:
+        cargados = [i.cargado_en for i in _indices_memoria.values()]
+        vacios = all(len(i) == 0 for i in _indices_memoria.values())
+        # Si alguien indexó a mano (pruebas) no se recarga desde la base
+        if vacios or (min(cargados) and time.time() - min(cargados) > MEMORIA_TTL):
+            cargar_indices_memoria()
+
+
+def _buscar_memoria(tablas, terminos):
+    _asegurar_indices_memoria()
+    where_terminos, params = [], []
+    puntajes = defaultdict(dict)
+    for termino in terminos:
+        alternativas = []
+        for entidad in INDICES_FULLTEXT:
+            aliases = _aliases(tablas.get(entidad))
+            if not aliases:
+                continue
+            encontrados = _indices_memoria[entidad].buscar_prefijo(termino)
+            for doc_id, puntaje in encontrados.items():
+                puntajes[entidad][doc_id] = puntajes[entidad].get(doc_id, 0) + puntaje
+            ids = sorted(encontrados, key=encontrados.get, reverse=True)[:MAX_IDS_MEMORIA]
+            if not ids:
+                continue
+            marcadores = ", ".join(["%s"] * len(ids))
+            for alias in aliases:
+                alternativas.append(f"{alias}.id IN ({marcadores})")
+                params.extend(ids)
+        where_terminos.append("(" + " OR ".join(alternativas) + ")" if alternativas else "1 = 0")
+
+    score_sql, score_params = [], []
+    for entidad, docs in puntajes.items():
+        mejores = sorted(docs, key=docs.get, reverse=True)[:MAX_IDS_MEMORIA]
+        if not mejores:
+            continue
+        for alias in _aliases(tablas.get(entidad)):
+            casos = " ".join(["WHEN %s THEN %s"] * len(mejores))
+            score_sql.append(f"(CASE {alias}.id {casos} ELSE 0 END)")
+            for doc_id in mejores:
+                score_params.extend([doc_id, docs[doc_id]])
+    return where_terminos, params, score_sql, score_params
+
+
+def build_search(query, tablas, modo=None):
+    """
+    Arma la condición de búsqueda para `query`.
+
+    `tablas` indica el alias SQL de cada entidad presente en la consulta, p. ej.
+    {'bienes': 'b', 'resguardos': 'r', 'areas': 'a'} o, si una entidad aparece
+    varias veces, {'bienes': 'b', 'resguardos': ['r_anterior', 'r_actual']}.
+
+    Cada término debe aparecer en alguna de las tablas (AND entre términos, OR
+    entre tablas). Devuelve None si la consulta está vacía.
+    """
+    consulta = (query or '').strip()
+    terminos = tokenizar(consulta)[:MAX_TERMINOS]
+    if not consulta or not terminos:
+        return None
+    modo = modo or SEARCH_BACKEND
+
+    prefijo_sql, prefijo_params = _prefijos(tablas, consulta)
+    bono_sql, bono_params = _bono_exacto(tablas, consulta)
+
+    if modo == 'memoria':
+        where_terminos, params, score_sql, score_params = _buscar_memoria(tablas, terminos)
+    elif modo == 'fulltext':
+        # Los términos cortos no están en el índice: van con LIKE, también en AND
+        largos = [t for t in terminos if len(t) >= SEARCH_FT_MIN_TOKEN]
+        where_terminos, params = [], []
+        for termino in terminos:
+            if len(termino) >= SEARCH_FT_MIN_TOKEN:
+                sql, p = _termino_fulltext(tablas, termino)
+            else:
+                sql, p = _termino_like(tablas, termino)
+            where_terminos.append(sql)
+            params.extend(p)
+        score_sql, score_params = _score_fulltext(tablas, largos) if largos else ([], [])
+    else:
+        where_terminos, params = [], []
+        for termino in terminos:
+            sql, p = _termino_like(tablas, termino)
+            where_terminos.append(sql)
+            params.extend(p)
+        score_sql, score_params = [], []
+
+    where = "(" + " OR ".join(prefijo_sql + ["(" + " AND ".join(where_terminos) + ")"]) + ")"
+    partes_score = score_sql + bono_sql
+    score = "(" + " + ".join(partes_score) + ")" if partes_score else "0"
+    return SearchClause(where, prefijo_params + params, score, score_params + bono_params)
+
+
+def build_search_bitacora(query, alias='l', modo=None):
+    """
+    Búsqueda en la bitácora: cada término en acción/detalles (FULLTEXT, o LIKE
+    si el modo no es 'fulltext' o el término es corto), o la consulta completa
+    como prefijo del id de recurso. Devuelve None si la consulta está vacía.
+    """
+    consulta = (query or '').strip()
+    terminos = tokenizar(consulta)[:MAX_TERMINOS]
+    if not consulta:
+        return None
+    modo = modo or SEARCH_BACKEND
+
+    columnas = ", ".join(f"{alias}.{col}" for col in INDICE_BITACORA)
+    where_terminos, params = [], []
+    for termino in terminos:
+        if modo == 'fulltext' and len(termino) >= SEARCH_FT_MIN_TOKEN:
+            where_terminos.append(f"MATCH({columnas}) AGAINST (%s IN BOOLEAN MODE)")
+            params.append(f"+{termino}*")
+        else:
+            patron = f"%{_escapar_like(termino)}%"
+            where_terminos.append("(" + " OR ".join(f"{alias}.{col} LIKE %s" for col in INDICE_BITACORA) + ")")
+            params.extend([patron] * len(INDICE_BITACORA))
+
+    alternativas = [f"{alias}.resource_id LIKE %s"]
+    params = [_escapar_like(consulta) + '%'] + params
+    if where_terminos:
+        alternativas.append("(" + " AND ".join(where_terminos) + ")")
+    return SearchClause("(" + " OR ".join(alternativas) + ")", params, "0", [])
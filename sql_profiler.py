@@ -0,0 +1,235 @@
+# sql_profiler.py
+"""
+Perfilado de SQL por petición.
+
+Se suscribe a los hooks de consulta de database.py, que cubren tanto las
+conexiones de get_db_connection como db.session / db.engine. Por cada
+petición acumula el número de consultas, el tiempo total en la base, las
+filas devueltas y la sentencia más lenta:
+
+- Al responder agrega la cabecera `Server-Timing` (visible en la pestaña
+  de red del navegador).
+- Al terminar la petición (después de enviar una respuesta en streaming)
+  escribe una línea `SQL_PERFIL {...}` en JSON y suma las cifras por endpoint.
+- Las consultas que tardan más de SLOW_QUERY_MS se guardan (las últimas
+  SLOW_QUERY_MAX) con su EXPLAIN, que se obtiene en un hilo aparte para no
+  alargar la petición; cada sentencia se explica a lo más una vez cada
+  EXPLAIN_INTERVALO segundos. Los planes se recuerdan en un LRU de
+  PLANES_MAX sentencias, porque los IN (...) de largo variable y el ORM
+  producen textos distintos sin límite.
+
+/admin/sql lista los endpoints con más tiempo en la base. Las cifras son por
+proceso y se pierden al reiniciar.
+"""
+import json
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import g, has_request_context, request
+
+from config import SQL_PROFILER_ENABLED, SQL_PROFILER_LOG, SLOW_QUERY_MS, SLOW_QUERY_MAX
+from database import get_db_connection, registrar_hook_consulta
+
+EXPLAIN_INTERVALO = 600
+PLANES_MAX = SLOW_QUERY_MAX * 10   # Sentencias cuyo plan se recuerda (LRU)
+SQL_MAX_CHARS = 2000        # Texto de la sentencia que se guarda/registra
+_RE_SELECT = re.compile(r'^\s*(?:SELECT|WITH)\b', re.IGNORECASE)
+_RE_ESPACIOS = re.compile(r'\s+')
+
+_lock = threading.Lock()
+_por_endpoint = {}                          # endpoint -> acumulados
+_lentas = deque(maxlen=SLOW_QUERY_MAX)      # Consultas lentas más recientes
+_planes = OrderedDict()                     # sentencia -> (momento, plan), del menos al más usado
+_explain_executor = None
+
+
+def _compactar(sql):
+    return _RE_ESPACIOS.sub(' ', sql or '').strip()[:SQL_MAX_CHARS]
+
+
+def _guardar_plan(texto, momento, plan):
+    """Guarda el plan de la sentencia como el más reciente. Llamar con _lock tomado."""
+    _planes[texto] = (momento, plan)
+    _planes.move_to_end(texto)
+    while len(_planes) > PLANES_MAX:
+        _planes.popitem(last=False)
+
+
+def _params_texto(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: str(v)[:100] for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [str(v)[:100] for v in params]
+    return str(params)[:100]
+
+
+# --- EXPLAIN de consultas lentas ---
+
+def _explicar(sql, params, entrada):
+    """Corre en el hilo de EXPLAIN, sin contexto de aplicación: conexión directa."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("EXPLAIN " + sql, params)
+        plan = [{k: row.get(k) for k in ('table', 'type', 'possible_keys', 'key', 'rows', 'filtered', 'Extra')}
+                for row in cursor.fetchall()]
+    except Exception as e:
+        plan = [{'error': str(e)}]
+    finally:
+        if conn:
+            conn.close()
+    with _lock:
+        entrada['plan'] = plan
+        _guardar_plan(entrada['sql'], time.time(), plan)
+
+
+def _consulta_lenta(sql, params, duracion_ms, endpoint):
+    global _explain_executor
+    texto = _compactar(sql)
+    entrada = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'endpoint': endpoint,
+        'ms': round(duracion_ms, 1),
+        'sql': texto,
+        'params': _params_texto(params),
+        'plan': None,
+    }
+    explicar = False
+    with _lock:
+        _lentas.append(entrada)
+        previo = _planes.get(texto)
+        if previo and time.time() - previo[0] < EXPLAIN_INTERVALO:
+            entrada['plan'] = previo[1]
+            _planes.move_to_end(texto)
+        elif _RE_SELECT.match(sql):
+            _guardar_plan(texto, time.time(), None)   # Evita encolar la misma sentencia dos veces
+            explicar = True
+            if _explain_executor is None:
+                _explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sql-explain')
+    if explicar:
+        _explain_executor.submit(_explicar, sql, params, entrada)
+
+
+# --- Acumulación por petición ---
+
+def _registrar_consulta(sql, duracion_ms, params, filas):
+    if not has_request_context():
+        return
+    perfil = g.get('_perfil_sql')
+    if perfil is None:
+        return
+    perfil['consultas'] += 1
+    perfil['tiempo_ms'] += duracion_ms
+    if filas:
+        perfil['filas'] += filas
+    if duracion_ms > perfil['lenta_ms']:
+        perfil['lenta_ms'] = duracion_ms
+        perfil['lenta_sql'] = sql
+    if duracion_ms >= SLOW_QUERY_MS:
+        _consulta_lenta(sql, params, duracion_ms, request.endpoint)
+
+
+def _iniciar_peticion():
+    g._perfil_sql = {'inicio': time.perf_counter(), 'consultas': 0, 'tiempo_ms': 0.0,
+                     'filas': 0, 'lenta_ms': 0.0, 'lenta_sql': None}
+
+
+def _agregar_server_timing(response):
+    perfil = g.get('_perfil_sql')
+    if perfil is None:
+        return response
+    total_ms = (time.perf_counter() - perfil['inicio']) * 1000
+    metricas = [
+        f'db;dur={perfil["tiempo_ms"]:.1f};desc="SQL ({perfil["consultas"]} consultas)"',
+        f'db-lenta;dur={perfil["lenta_ms"]:.1f};desc="Consulta más lenta"',
+        f'app;dur={total_ms:.1f};desc="Total"',
+    ]
+    previo = response.headers.get('Server-Timing')
+    response.headers['Server-Timing'] = ', '.join(([previo] if previo else []) + metricas)
+    return response
+
+
+def _terminar_peticion(exc=None):
+    perfil = g.pop('_perfil_sql', None)
+    endpoint = request.endpoint
+    if perfil is None or not endpoint or endpoint == 'static':
+        return
+    total_ms = (time.perf_counter() - perfil['inicio']) * 1000
+
+    with _lock:
+        datos = _por_endpoint.setdefault(endpoint, {
+            'peticiones': 0, 'consultas': 0, 'consultas_max': 0, 'tiempo_db_ms': 0.0,
+            'tiempo_total_ms': 0.0, 'filas': 0, 'lenta_ms': 0.0, 'lenta_sql': None,
+        })
+        datos['peticiones'] += 1
+        datos['consultas'] += perfil['consultas']
+        datos['consultas_max'] = max(datos['consultas_max'], perfil['consultas'])
+        datos['tiempo_db_ms'] += perfil['tiempo_ms']
+        datos['tiempo_total_ms'] += total_ms
+        datos['filas'] += perfil['filas']
+        if perfil['lenta_ms'] > datos['lenta_ms']:
+            datos['lenta_ms'] = perfil['lenta_ms']
+            datos['lenta_sql'] = _compactar(perfil['lenta_sql'])
+
+    if SQL_PROFILER_LOG:
+        print("SQL_PERFIL " + json.dumps({
+            'endpoint': endpoint,
+            'metodo': request.method,
+            'ruta': request.path,
+            'consultas': perfil['consultas'],
+            'db_ms': round(perfil['tiempo_ms'], 1),
+            'total_ms': round(total_ms, 1),
+            'filas': perfil['filas'],
+            'lenta_ms': round(perfil['lenta_ms'], 1),
+            'lenta_sql': _compactar(perfil['lenta_sql'])[:200] or None,
+        }, ensure_ascii=False))
+
+
+# --- Consulta de estadísticas ---
+
+def resumen_endpoints(orden='tiempo_db_ms', limite=50):
+    """Endpoints ordenados por `orden` (total o promedio), con promedios por petición."""
+    with _lock:
+        filas = [dict(datos, endpoint=endpoint) for endpoint, datos in _por_endpoint.items()]
+    for f in filas:
+        n = f['peticiones'] or 1
+        f['consultas_promedio'] = round(f['consultas'] / n, 1)
+        f['db_ms_promedio'] = round(f['tiempo_db_ms'] / n, 1)
+        f['total_ms_promedio'] = round(f['tiempo_total_ms'] / n, 1)
+        f['tiempo_db_ms'] = round(f['tiempo_db_ms'], 1)
+        f['tiempo_total_ms'] = round(f['tiempo_total_ms'], 1)
+        f['lenta_ms'] = round(f['lenta_ms'], 1)
+    if filas and orden not in filas[0]:
+        orden = 'tiempo_db_ms'
+    filas.sort(key=lambda f: f[orden], reverse=True)
+    return filas[:limite]
+
+
+def consultas_lentas():
+    """Consultas lentas más recientes primero."""
+    with _lock:
+        return [dict(e) for e in reversed(_lentas)]
+
+
+def reiniciar():
+    with _lock:
+        _por_endpoint.clear()
+        _lentas.clear()
+        _planes.clear()
+
+
+def init_app(app):
+    """Registra el hook de consultas y los ganchos de petición; no hace nada si SQL_PROFILER=false."""
+    if not SQL_PROFILER_ENABLED:
+        return
+    registrar_hook_consulta(_registrar_consulta)
+    app.before_request(_iniciar_peticion)
+    app.after_request(_agregar_server_timing)
+    app.teardown_request(_terminar_peticion)
@@ -0,0 +1,145 @@
+# tabular_export.py
+"""
+Exportaciones tabulares (sin formato) de las plantillas de consulta.
+
+- CSV: generador de texto que se entrega como Response en streaming; sólo un
+  bloque de filas vive en memoria a la vez.
+- Parquet: columnar y tipado. Los tipos salen de los modelos (Bienes,
+  Resguardo, Area): Numeric -> decimal, Date -> date, etc. Se escribe por
+  row groups con pyarrow, que es una dependencia opcional.
+
+Las columnas de imagen se exportan como listas de URLs, no como fotos.
+"""
+import csv
+import io
+
+from sqlalchemy import Boolean, Date, DateTime, Integer, Numeric
+
+from models import Area, Bienes, Resguardo
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: sin él sólo se desactiva Parquet
+    pa = None
+    pq = None
+
+COLUMNAS_IMAGEN = ('imagenPath_bien', 'imagenPath_resguardo')
+CSV_FILAS_POR_BLOQUE = 500
+PARQUET_FILAS_POR_GRUPO = 10000
+SEPARADOR_URLS = '|'
+
+_TABLAS = {m.__tablename__: m.__table__ for m in (Bienes, Resguardo, Area)}
+
+
+def parquet_disponible():
+    return pa is not None
+
+
+def _columna_modelo(available_columns, col):
+    """Columna SQLAlchemy que corresponde a una clave de AVAILABLE_COLUMNS, o None."""
+    sql_name = available_columns.get(col)
+    if not sql_name or '.' not in sql_name:
+        return None
+    tabla, nombre = sql_name.split('.', 1)
+    table = _TABLAS.get(tabla)
+    return table.columns.get(nombre) if table is not None else None
+
+
+def _valor(row, col, url_imagen):
+    valor = row.get(col)
+    if col in COLUMNAS_IMAGEN:
+        return [url_imagen(r) for r in (valor or [])]
+    return valor
+
+
+# --- CSV ---
+
+def generar_csv(columnas, filas, url_imagen, filas_por_bloque=CSV_FILAS_POR_BLOQUE):
+    """Genera el CSV (UTF-8 con BOM, para que Excel respete los acentos) por bloques de texto."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    yield '\ufeff'
+    writer.writerow(columnas)
+
+    for n, row in enumerate(filas, start=1):
+        fila = []
+        for col in columnas:
+            valor = _valor(row, col, url_imagen)
+            if isinstance(valor, list):
+                valor = SEPARADOR_URLS.join(valor)
+            fila.append('' if valor is None else valor)
+        writer.writerow(fila)
+
+        if n % filas_por_bloque == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+# --- Parquet ---
+
+def _tipo_arrow(columna):
+    if columna is None:
+        return pa.string()
+    tipo = columna.type
+    if isinstance(tipo, Numeric) and tipo.asdecimal:
+        return pa.decimal128(tipo.precision or 18, tipo.scale or 0)
+    if isinstance(tipo, Boolean):
+        return pa.bool_()
+    if isinstance(tipo, Integer):
+        return pa.int64()
+    if isinstance(tipo, DateTime):
+        return pa.timestamp('s')
+    if isinstance(tipo, Date):
+        return pa.date32()
+    return pa.string()
+
+
+def esquema_arrow(columnas, available_columns):
+    campos = []
+    for col in columnas:
+        if col in COLUMNAS_IMAGEN:
+            campos.append(pa.field(col, pa.list_(pa.string())))
+        else:
+            campos.append(pa.field(col, _tipo_arrow(_columna_modelo(available_columns, col))))
+    return pa.schema(campos)
+
+
+def _normalizar(valor, tipo):
+    """Ajusta los valores de PyMySQL al tipo Arrow (TINYINT -> bool, Enum -> str)."""
+    if valor is None:
+        return None
+    if pa.types.is_boolean(tipo):
+        return bool(valor)
+    if pa.types.is_string(tipo) and not isinstance(valor, str):
+        return str(valor)
+    return valor
+
+
+def escribir_parquet(ruta, columnas, filas, url_imagen, available_columns,
+                     filas_por_grupo=PARQUET_FILAS_POR_GRUPO, progreso=None):
+    """Escribe `filas` en `ruta` por row groups. Devuelve el número de filas escritas."""
+    if pa is None:
+        raise RuntimeError("La exportación a Parquet requiere el paquete 'pyarrow'.")
+
+    schema = esquema_arrow(columnas, available_columns)
+    tipos = [schema.field(col).type for col in columnas]
+    escritas = pendientes = 0
+    with pq.ParquetWriter(ruta, schema, compression='snappy') as writer:
+        lote = {col: [] for col in columnas}
+        for row in filas:
+            for col, tipo in zip(columnas, tipos):
+                lote[col].append(_normalizar(_valor(row, col, url_imagen), tipo))
+            escritas += 1
+            pendientes += 1
+            if pendientes == filas_por_grupo:
+                writer.write_table(pa.Table.from_pydict(lote, schema=schema))
+                lote = {col: [] for col in columnas}
+                pendientes = 0
+                if progreso:
+                    progreso(escritas)
+        if pendientes:
+            writer.write_table(pa.Table.from_pydict(lote, schema=schema))
+    return escritas